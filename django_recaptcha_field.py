@@ -14,16 +14,256 @@
 #
 ################################################################################
 
+from bisect import bisect_right
+from binascii import hexlify
+from collections import OrderedDict
+from collections import deque
+from Queue import Empty
+from Queue import Full
+from Queue import LifoQueue
+from Queue import Queue
+from errno import ECONNRESET
+from errno import EPIPE
+from hashlib import sha1
+from httplib import BadStatusLine
+from httplib import HTTPConnection
+from httplib import HTTPException
+from httplib import HTTPSConnection
+from json import dumps as json_encode
+from json import loads as json_decode
+from math import ceil
+from math import log
+from re import compile as compile_regex
+from socket import AF_INET
+from socket import AF_INET6
+from socket import error as SocketError
+from socket import getdefaulttimeout
+from socket import inet_pton
+from sys import exc_info
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import sleep
+from time import time
+from urllib import urlencode
+from urlparse import urlsplit
+from weakref import WeakKeyDictionary
+from weakref import WeakValueDictionary
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.forms.fields import Field
 from django.forms.widgets import Widget
+from django.utils.crypto import constant_time_compare
+from django.utils.crypto import salted_hmac
 from django.utils.encoding import force_unicode
+from django.utils.html import escape
 from recaptcha import RECAPTCHA_CHARACTER_ENCODING
+from recaptcha import RecaptchaException
 from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaInvalidPrivateKeyError
+from recaptcha import RecaptchaUnreachableError
+
+
+__all__ = [
+    'PooledVerificationTransport',
+    'ProxyAwareRemoteIpResolver',
+    'PrometheusRecaptchaMetrics',
+    'RecaptchaCircuitBreaker',
+    'RecaptchaCircuitOpenError',
+    'RecaptchaClientRegistry',
+    'RecaptchaMetrics',
+    'RecaptchaRateLimiter',
+    'RecaptchaReplayGuard',
+    'RecaptchaRequestVerifier',
+    'RecaptchaScoreVerifier',
+    'RecaptchaVerificationHedger',
+    'RecaptchaVerificationResult',
+    'StatsdRecaptchaMetrics',
+    'create_form_subclass_with_recaptcha',
+    'verify_solutions',
+    ]
+
+
+_VERIFICATION_OUTCOME_CORRECT = 'correct'
+_VERIFICATION_OUTCOME_INCORRECT = 'incorrect'
+_VERIFICATION_OUTCOME_INVALID_CHALLENGE = 'invalid_challenge'
+_VERIFICATION_OUTCOME_UNAVAILABLE = 'unavailable'
+_VERIFICATION_OUTCOME_RATE_LIMITED = 'rate_limited'
+_VERIFICATION_OUTCOME_LOW_SCORE = 'low_score'
+_VERIFICATION_OUTCOME_WAIVED = 'waived'
+_ACCEPTED_VERIFICATION_OUTCOMES = (
+    _VERIFICATION_OUTCOME_CORRECT,
+    _VERIFICATION_OUTCOME_UNAVAILABLE,
+    _VERIFICATION_OUTCOME_WAIVED,
+    )
+_UNCACHEABLE_VERIFICATION_OUTCOMES = (
+    _VERIFICATION_OUTCOME_UNAVAILABLE,
+    _VERIFICATION_OUTCOME_RATE_LIMITED,
+    )
+
+
+_UNAVAILABILITY_POLICY_REJECT = 'reject'
+_UNAVAILABILITY_POLICY_ACCEPT = 'accept'
+_UNAVAILABILITY_POLICIES = (
+    None,
+    _UNAVAILABILITY_POLICY_REJECT,
+    _UNAVAILABILITY_POLICY_ACCEPT,
+    )
+
+
+_VERIFICATION_CACHE_KEY_PREFIX = 'django_recaptcha_field.verification:'
+
+
+_DEFAULT_VERIFICATION_CACHE_TIMEOUT = 60
+
+
+_DEFAULT_MAX_SOLUTION_LENGTH = 256
+_DEFAULT_MAX_CHALLENGE_ID_LENGTH = 1024
+_DEFAULT_MAX_SCORE_TOKEN_LENGTH = 4096
+
+
+_VERIFICATION_LEASE_KEY_PREFIX = 'django_recaptcha_field.verification_lease:'
+
+
+_VERIFICATION_LEASE_POLL_INTERVAL = 0.05
+
+
+_RATE_LIMIT_CACHE_KEY_PREFIX = 'django_recaptcha_field.rate_limit:'
+
+
+_DEFAULT_RATE_LIMITER_MAX_SIZE = 10000
+
+
+_CONSUMED_CHALLENGE_CACHE_KEY_PREFIX = \
+    'django_recaptcha_field.consumed_challenge:'
+
+
+_DEFAULT_CHALLENGE_LIFETIME = 4 * 60 * 60
+
+
+_DEFAULT_REPLAY_GUARD_CAPACITY = 100000
+
+
+_DEFAULT_REPLAY_GUARD_FALSE_POSITIVE_RATE = 0.0001
+
+
+_PASS_TOKEN_SESSION_KEY = 'django_recaptcha_field.pass_token'
+_PASS_TOKEN_KEY_SALT = 'django_recaptcha_field.pass_token'
+
+
+_IP_ADDRESS_FAMILIES = (AF_INET, AF_INET6)
+
+
+_FORWARDED_HEADER = 'Forwarded'
+_X_FORWARDED_FOR_HEADER = 'X-Forwarded-For'
+
+
+_RECAPTCHA_AJAX_API_URL = '//www.google.com/recaptcha/api/js/recaptcha_ajax.js'
+_RECAPTCHA_SCORE_API_URL = 'https://www.google.com/recaptcha/api.js'
+_RECAPTCHA_NOSCRIPT_CHALLENGE_URL = '//www.google.com/recaptcha/api/noscript'
+
+
+_SCORE_TOKEN_MARKUP_TEMPLATE = u"""
+<input type="hidden" name="{token_field_name}" id="{element_id}" />
+<script type="text/javascript" src="{score_api_url}"></script>
+<script type="text/javascript">
+    grecaptcha.ready(function () {{
+        function refreshToken() {{
+            grecaptcha.execute({site_key_json}, {{action: {action_json}}}).then(
+                function (token) {{
+                    document.getElementById({element_id_json}).value = token;
+                }}
+                );
+        }}
+        refreshToken();
+        // Tokens expire after two minutes
+        setInterval(refreshToken, {refresh_interval});
+    }});
+</script>
+"""
+
+
+_CLIENT_SIDE_CHALLENGE_MARKUP_TEMPLATE = u"""
+<div id="{element_id}"></div>
+<script type="text/javascript">
+    (function () {{
+        var script = document.createElement('script');
+        script.type = 'text/javascript';
+        script.src = '{ajax_api_url}';
+        script.onload = function () {{
+            Recaptcha.create(
+                {public_key_json},
+                {element_id_json},
+                {recaptcha_options_json}
+                );
+        }};
+        document.getElementsByTagName('head')[0].appendChild(script);
+    }})();
+</script>
+<noscript>
+   <iframe
+       src="{noscript_challenge_url}"
+       height="300"
+       width="500"
+       frameborder="0"
+       >
+   </iframe>
+   <br />
+   <textarea name="recaptcha_challenge_field" rows="3" cols="40"></textarea>
+   <input
+       type="hidden"
+       name="recaptcha_response_field"
+       value="manual_challenge"
+       />
+</noscript>
+"""
+
+
+_RECAPTCHA_VERIFICATION_URL = 'https://www.google.com/recaptcha/api/verify'
+
+
+_RECAPTCHA_SCORE_VERIFICATION_URL = \
+    'https://www.google.com/recaptcha/api/siteverify'
+
+
+_DEFAULT_SCORE_THRESHOLD = 0.5
+
+
+_SCORE_TOKEN_FIELD_NAME = 'recaptcha_score_token'
+
+
+_SCORE_TOKEN_REFRESH_INTERVAL_MILLISECONDS = 90 * 1000
+
+
+_DEFAULT_CONNECTION_POOL_SIZE = 4
+
+
+_DEFAULT_TRANSPORT_TIMEOUT = 10
+
+
+_STALE_CONNECTION_ERRNOS = (ECONNRESET, EPIPE)
+
+
+_TRANSPORT_USER_AGENT = 'django-recaptcha-field ' \
+    '(http://packages.python.org/django-recaptcha-field/)'
+
+
+_DEFAULT_BATCH_VERIFICATION_CONCURRENCY = 4
+
+
+_FORM_CLASS_REGISTRY_MAX_SIZE = 256
+
 
+_DEFAULT_CLIENT_REGISTRY_MAX_SIZE = 1024
 
-__all__ = ['create_form_subclass_with_recaptcha']
+
+_METRICS_OUTCOME_UNREACHABLE = 'unreachable'
+_METRICS_OUTCOME_INVALID_PRIVATE_KEY = 'invalid_private_key'
+_METRICS_OUTCOME_REPLAYED = 'replayed'
+
+
+_DEFAULT_METRICS_PREFIX = 'recaptcha'
 
 
 def create_form_subclass_with_recaptcha(
@@ -42,39 +282,576 @@ def create_form_subclass_with_recaptcha(
         constructor of the form field
     :type additional_field_kwargs: :class:`dict`
 
+    The same class is returned for the same arguments, as long as it's still
+    referenced elsewhere, so this can be called on every request.
+
     """
 
     additional_field_kwargs = additional_field_kwargs or {}
 
+    form_class_key = _get_form_class_key(
+        base_form_class,
+        recaptcha_client,
+        additional_field_kwargs,
+        )
+    form_class = _FORM_CLASS_REGISTRY.get_form_class(form_class_key)
+    if form_class is None:
+        form_class = _create_form_subclass_with_recaptcha(
+            base_form_class,
+            recaptcha_client,
+            additional_field_kwargs,
+            )
+        _FORM_CLASS_REGISTRY.register_form_class(form_class_key, form_class)
+
+    return form_class
+
+
+def _create_form_subclass_with_recaptcha(
+    base_form_class,
+    recaptcha_client,
+    additional_field_kwargs,
+    ):
+
     class RecaptchaProtectedForm(base_form_class):
 
+        recaptcha = _RecaptchaField(recaptcha_client, **additional_field_kwargs)
+
         def __init__(self, request, *args, **kwargs):
             super(RecaptchaProtectedForm, self).__init__(*args, **kwargs)
 
-            self.fields['recaptcha'] = _RecaptchaField(
-                recaptcha_client,
-                request.META['REMOTE_ADDR'],
+            recaptcha_field = self.fields['recaptcha']
+
+            self.recaptcha_state = _RecaptchaFormState(
+                recaptcha_field.get_remote_ip(request),
                 request.is_secure(),
-                **additional_field_kwargs
+                recaptcha_field.get_recaptcha_client(request),
                 )
+            # The field and its widget are shared by all the instances of this
+            # class, so the state of this instance is passed on to the widget
+            # as the initial value of the field
+            self.initial = dict(self.initial, recaptcha=self.recaptcha_state)
+
+            self._recaptcha_session = getattr(request, 'session', None)
+
+            is_recaptcha_waived = \
+                recaptcha_field.is_remote_ip_allowed(
+                    self.recaptcha_state.remote_ip,
+                    ) or \
+                self._has_valid_recaptcha_pass_token()
+            if is_recaptcha_waived:
+                # The user is trusted or solved a challenge recently, so
+                # there's no need to present or verify another one
+                del self.fields['recaptcha']
+                self.recaptcha_state.was_verification_waived = True
+            elif self.is_bound and (
+                recaptcha_field.score_verifier is not None or
+                recaptcha_field.verify_speculatively
+                ):
+                recaptcha_value = recaptcha_field.widget.value_from_datadict(
+                    self.data,
+                    self.files,
+                    self.add_prefix('recaptcha'),
+                    )
+
+                # Users who are solving a challenge already, or who couldn't
+                # get a score, have to keep solving challenges
+                if recaptcha_field.score_verifier is not None and \
+                        not _is_score_token_value(recaptcha_value):
+                    self.recaptcha_state.is_challenge_required = True
+
+                if recaptcha_value and recaptcha_field.verify_speculatively:
+                    recaptcha_field.start_verification(
+                        recaptcha_value,
+                        self.recaptcha_state,
+                        )
+
+        def _clean_fields(self):
+            super(RecaptchaProtectedForm, self)._clean_fields()
+
+            # The solution is verified here rather than in a clean_recaptcha()
+            # hook so that subclasses can define their own hook without
+            # bypassing the verification
+            if 'recaptcha' in self.cleaned_data:
+                try:
+                    self._verify_recaptcha_solution()
+                except ValidationError as exc:
+                    self._errors['recaptcha'] = self.error_class(exc.messages)
+                    del self.cleaned_data['recaptcha']
+
+        def _verify_recaptcha_solution(self):
+            recaptcha_value = self.cleaned_data['recaptcha']
+            recaptcha_field = self.fields['recaptcha']
+            recaptcha_field.verify(recaptcha_value, self.recaptcha_state)
+
+            should_issue_pass_token = \
+                recaptcha_field.pass_token_timeout is not None and \
+                self._recaptcha_session is not None and \
+                not self.recaptcha_state.was_verification_skipped
+            if should_issue_pass_token:
+                self._recaptcha_session[_PASS_TOKEN_SESSION_KEY] = \
+                    recaptcha_field.create_pass_token(
+                        self.recaptcha_state.remote_ip,
+                        )
+
+        def _has_valid_recaptcha_pass_token(self):
+            recaptcha_field = self.fields['recaptcha']
+            if recaptcha_field.pass_token_timeout is None or \
+                    self._recaptcha_session is None:
+                return False
+
+            pass_token = self._recaptcha_session.get(_PASS_TOKEN_SESSION_KEY)
+            is_pass_token_valid = pass_token is not None and \
+                recaptcha_field.is_pass_token_valid(
+                    pass_token,
+                    self.recaptcha_state.remote_ip,
+                    )
+            return is_pass_token_valid
 
     return RecaptchaProtectedForm
 
 
+def verify_solutions(
+    recaptcha_client,
+    submissions,
+    max_concurrency=_DEFAULT_BATCH_VERIFICATION_CONCURRENCY,
+    verification_transport=None,
+    circuit_breaker=None,
+    ):
+    """
+    Verify the solutions in ``submissions`` concurrently.
+
+    :param recaptcha_client:
+    :type recaptcha_client: :class:`recaptcha.RecaptchaClient`
+    :param submissions: The challenge id, solution text and remote IP address
+        of each submission
+    :type submissions: iterable of :class:`tuple`
+    :param max_concurrency: Maximum number of verifications in progress at any
+        given time
+    :type max_concurrency: :class:`int`
+    :param verification_transport: The transport to communicate with reCAPTCHA
+        instead of ``recaptcha_client``
+    :param circuit_breaker:
+    :type circuit_breaker: :class:`RecaptchaCircuitBreaker`
+    :return: The result of each verification, as soon as it's available
+    :rtype: iterator of :class:`RecaptchaVerificationResult`
+    :raises ValueError: If ``max_concurrency`` is lower than one
+
+    The results aren't necessarily in the same order as ``submissions``, which
+    is consumed lazily. Any exception raised while getting the next submission
+    is raised by the returned iterator once the verifications in progress have
+    finished.
+
+    """
+    if max_concurrency < 1:
+        raise ValueError(
+            'The maximum concurrency must be at least one; got {!r}'.format(
+                max_concurrency,
+                ),
+            )
+
+    verification_results = _verify_solutions(
+        recaptcha_client,
+        submissions,
+        max_concurrency,
+        verification_transport,
+        circuit_breaker,
+        )
+    return verification_results
+
+
+def _verify_solutions(
+    recaptcha_client,
+    submissions,
+    max_concurrency,
+    verification_transport,
+    circuit_breaker,
+    ):
+    submissions_iterator = iter(submissions)
+    no_more_submissions = object()
+    submissions_lock = Lock()
+    submissions_errors = []
+    verification_results = Queue()
+    is_cancelled = Event()
+
+    def verify_next_submissions():
+        try:
+            while not is_cancelled.is_set():
+                with submissions_lock:
+                    try:
+                        submission = \
+                            next(submissions_iterator, no_more_submissions)
+                    except Exception:
+                        # Passed on to the consumer, and no further
+                        # submissions are verified
+                        submissions_errors.append(exc_info())
+                        is_cancelled.set()
+                        break
+                if submission is no_more_submissions:
+                    break
+
+                verification_result = _get_verification_result(
+                    recaptcha_client,
+                    submission,
+                    verification_transport,
+                    circuit_breaker,
+                    )
+                verification_results.put(verification_result)
+        finally:
+            verification_results.put(None)
+
+    for _ in range(max_concurrency):
+        verification_thread = Thread(target=verify_next_submissions)
+        verification_thread.daemon = True
+        verification_thread.start()
+
+    running_thread_count = max_concurrency
+    try:
+        while running_thread_count:
+            verification_result = verification_results.get()
+            if verification_result is None:
+                running_thread_count -= 1
+            else:
+                yield verification_result
+
+        if submissions_errors:
+            exception_type, exception, traceback = submissions_errors[0]
+            raise exception_type, exception, traceback
+    finally:
+        is_cancelled.set()
+
+
+class RecaptchaVerificationResult(object):
+    """
+    Result of the verification of a solution to a reCAPTCHA challenge.
+
+    """
+
+    def __init__(
+        self,
+        challenge_id,
+        solution_text,
+        remote_ip,
+        verification_outcome=None,
+        error=None,
+        error_message=None,
+        ):
+        super(RecaptchaVerificationResult, self).__init__()
+
+        self.challenge_id = challenge_id
+        self.solution_text = solution_text
+        self.remote_ip = remote_ip
+
+        self._verification_outcome = verification_outcome
+
+        self.error = error
+        """
+        The exception that prevented the verification, if any (typically a
+        :exc:`recaptcha.RecaptchaException`).
+
+        """
+
+        self.error_message = error_message
+        """
+        The message the field would have shown to the user if the submission
+        was rejected by a :class:`RecaptchaRequestVerifier`.
+
+        """
+
+    @property
+    def is_accepted(self):
+        """
+        Whether the submission was accepted, either because the solution was
+        correct or because the verification was skipped or waived.
+
+        """
+        is_accepted = \
+            self.error is None and \
+            self.error_message is None and \
+            self._verification_outcome in _ACCEPTED_VERIFICATION_OUTCOMES
+        return is_accepted
+
+    @property
+    def is_solution_correct(self):
+        return self._verification_outcome == _VERIFICATION_OUTCOME_CORRECT
+
+    @property
+    def is_challenge_invalid(self):
+        verification_outcome = self._verification_outcome
+        return verification_outcome == _VERIFICATION_OUTCOME_INVALID_CHALLENGE
+
+    @property
+    def was_verification_skipped(self):
+        """Whether reCAPTCHA was unavailable and the policy was to accept."""
+        was_verification_skipped = \
+            self.error_message is None and \
+            self._verification_outcome == _VERIFICATION_OUTCOME_UNAVAILABLE
+        return was_verification_skipped
+
+    @property
+    def was_verification_waived(self):
+        """Whether the submission came from one of the allowed networks."""
+        return self._verification_outcome == _VERIFICATION_OUTCOME_WAIVED
+
+    def __repr__(self):
+        return '<{} for challenge {!r}: {}>'.format(
+            self.__class__.__name__,
+            self.challenge_id,
+            self._verification_outcome or repr(self.error),
+            )
+
+
+class RecaptchaRequestVerifier(object):
+    """
+    Verifier of the solutions submitted to views without a form, such as those
+    of JSON APIs.
+
+    It takes the same options as the field added by
+    :func:`create_form_subclass_with_recaptcha` and applies them in the same
+    way, so a submission is accepted by the verifier if and only if it'd be
+    accepted by the field. Create it once and share it among your views.
+
+    Pass tokens are only honoured and issued by :meth:`verify_request`, since
+    they're kept in the session of the request.
+
+    """
+
+    def __init__(self, recaptcha_client, **field_kwargs):
+        """
+
+        :param recaptcha_client:
+        :type recaptcha_client: :class:`recaptcha.RecaptchaClient`
+        :param field_kwargs: Any additional arguments for the constructor of
+            the form field
+
+        """
+        super(RecaptchaRequestVerifier, self).__init__()
+
+        self._field = _RecaptchaField(recaptcha_client, **field_kwargs)
+
+    def verify_request(self, request, data):
+        """
+        Verify the submission in ``data`` made by ``request``.
+
+        :param request: The request with the submission
+        :type request: :class:`django.http.HttpRequest`
+        :param data: The reCAPTCHA parameters, named as in the forms (e.g.,
+            ``request.POST`` or the decoded body of a JSON request)
+        :type data: :class:`dict`
+        :rtype: :class:`RecaptchaVerificationResult`
+
+        """
+        form_state = _RecaptchaFormState(
+            self._field.get_remote_ip(request),
+            request.is_secure(),
+            self._field.get_recaptcha_client(request),
+            )
+        field_value = self._field.widget.value_from_datadict(data, None, None)
+        session = getattr(request, 'session', None)
+        verification_result = self._verify(field_value, form_state, session)
+        return verification_result
+
+    def verify(
+        self,
+        challenge_id,
+        solution_text,
+        remote_ip,
+        recaptcha_client=None,
+        ):
+        """
+        Verify ``solution_text`` to the challenge ``challenge_id``, submitted
+        from ``remote_ip``.
+
+        :param recaptcha_client: The client for the tenant the challenge was
+            presented to, if it differs from that of the verifier
+        :type recaptcha_client: :class:`recaptcha.RecaptchaClient`
+        :rtype: :class:`RecaptchaVerificationResult`
+        :raises ValueError: If there's no client to verify the solution with
+
+        With a ``recaptcha_client_registry``, which needs a request to pick the
+        client, either pass ``recaptcha_client`` or use
+        :meth:`verify_request`.
+
+        """
+        recaptcha_client = recaptcha_client or self._field.recaptcha_client
+        if recaptcha_client is None:
+            raise ValueError(
+                'A reCAPTCHA client is required to verify solutions without a '
+                'request',
+                )
+
+        if challenge_id and solution_text:
+            field_value = {
+                'solution_text': solution_text,
+                'challenge_id': challenge_id,
+                }
+        else:
+            field_value = None
+        form_state = _RecaptchaFormState(
+            remote_ip,
+            recaptcha_client=recaptcha_client,
+            )
+        verification_result = self._verify(field_value, form_state)
+        return verification_result
+
+    def _verify(self, field_value, form_state, session=None):
+        field = self._field
+
+        verification_outcome = None
+        error = None
+        error_message = None
+        if field.is_remote_ip_allowed(form_state.remote_ip) or \
+                self._has_valid_pass_token(session, form_state.remote_ip):
+            verification_outcome = _VERIFICATION_OUTCOME_WAIVED
+        else:
+            try:
+                field_value = field.clean(field_value)
+                verification_outcome = \
+                    field.get_verification_outcome(field_value, form_state)
+                field.check_verification_outcome(
+                    verification_outcome,
+                    form_state,
+                    )
+            except ValidationError as exc:
+                error_message = u' '.join(exc.messages)
+            except RecaptchaException as exc:
+                error = exc
+
+        field_value = field_value or {}
+        verification_result = RecaptchaVerificationResult(
+            field_value.get('challenge_id'),
+            field_value.get('solution_text'),
+            form_state.remote_ip,
+            verification_outcome,
+            error,
+            error_message,
+            )
+
+        should_issue_pass_token = \
+            field.pass_token_timeout is not None and \
+            session is not None and \
+            verification_result.is_solution_correct and \
+            verification_result.is_accepted
+        if should_issue_pass_token:
+            session[_PASS_TOKEN_SESSION_KEY] = \
+                field.create_pass_token(form_state.remote_ip)
+
+        return verification_result
+
+    def _has_valid_pass_token(self, session, remote_ip):
+        if self._field.pass_token_timeout is None or session is None:
+            return False
+
+        pass_token = session.get(_PASS_TOKEN_SESSION_KEY)
+        is_pass_token_valid = pass_token is not None and \
+            self._field.is_pass_token_valid(pass_token, remote_ip)
+        return is_pass_token_valid
+
+
+class _FormClassRegistry(object):
+    """
+    Registry of the form classes created by
+    :func:`create_form_subclass_with_recaptcha`.
+
+    Form classes are referenced weakly, so that they can be garbage collected
+    when they're no longer used, and no more than ``max_size`` form classes
+    are registered at any given time.
+
+    """
+
+    def __init__(self, max_size):
+        super(_FormClassRegistry, self).__init__()
+
+        self.max_size = max_size
+
+        self._form_classes = WeakValueDictionary()
+        self._lock = Lock()
+
+    def get_form_class(self, form_class_key):
+        if form_class_key is None:
+            return None
+
+        with self._lock:
+            form_class = self._form_classes.get(form_class_key)
+        return form_class
+
+    def register_form_class(self, form_class_key, form_class):
+        if form_class_key is None:
+            return
+
+        with self._lock:
+            if len(self._form_classes) < self.max_size:
+                self._form_classes[form_class_key] = form_class
+
+
+_FORM_CLASS_REGISTRY = _FormClassRegistry(_FORM_CLASS_REGISTRY_MAX_SIZE)
+
+
 class _RecaptchaField(Field):
+    """
+    Field for the solution to a reCAPTCHA challenge.
+
+    Instances are immutable so that they can be shared by all the instances of
+    a form class. The state specific to each form instance is kept in a
+    :class:`_RecaptchaFormState`.
+
+    """
 
     default_error_messages = {
         'incorrect_solution': 'Your solution to the CAPTCHA was incorrect',
+        'unavailable': 'The CAPTCHA could not be verified. Please try again '
+            'later',
+        'rate_limited': 'Too many CAPTCHAs have been submitted from your '
+            'address. Please try again later',
+        'challenge_required': 'Please solve the CAPTCHA',
         }
 
     def __init__(
         self,
         recaptcha_client,
-        remote_ip,
-        transmit_challenge_over_ssl=False,
+        verification_cache=None,
+        verification_cache_timeout=_DEFAULT_VERIFICATION_CACHE_TIMEOUT,
+        verification_lease_timeout=None,
+        verification_transport=None,
+        recaptcha_client_registry=None,
+        circuit_breaker=None,
+        verification_hedger=None,
+        score_verifier=None,
+        unavailability_policy=None,
+        verify_speculatively=False,
+        metrics=None,
+        rate_limiter=None,
+        replay_guard=None,
+        pass_token_timeout=None,
+        max_solution_length=_DEFAULT_MAX_SOLUTION_LENGTH,
+        max_challenge_id_length=_DEFAULT_MAX_CHALLENGE_ID_LENGTH,
+        max_score_token_length=_DEFAULT_MAX_SCORE_TOKEN_LENGTH,
+        challenge_id_pattern=None,
+        remote_ip_resolver=None,
+        allowed_networks=None,
+        render_client_side=False,
         **kwargs
         ):
-        widget = _RecaptchaWidget(recaptcha_client, transmit_challenge_over_ssl)
+        if unavailability_policy not in _UNAVAILABILITY_POLICIES:
+            raise ValueError(
+                'Unknown unavailability policy {!r}'.format(
+                    unavailability_policy,
+                    ),
+                )
+
+        if verification_lease_timeout is not None and \
+                verification_cache is None:
+            raise ValueError(
+                'A verification cache is required to coalesce verifications',
+                )
+
+        metrics = metrics or _NULL_METRICS
+
+        widget = _RecaptchaWidget(
+            recaptcha_client,
+            metrics,
+            render_client_side,
+            score_verifier,
+            )
         super(_RecaptchaField, self).__init__(
             widget=widget,
             required=True,
@@ -82,69 +859,2274 @@ class _RecaptchaField(Field):
             )
 
         self.recaptcha_client = recaptcha_client
-        self.remote_ip = remote_ip
+
+        self.verification_cache = verification_cache
+        self.verification_cache_timeout = verification_cache_timeout
+        self.verification_lease_timeout = verification_lease_timeout
+
+        self.verification_transport = verification_transport
+
+        self.recaptcha_client_registry = recaptcha_client_registry
+
+        self.circuit_breaker = circuit_breaker
+        self.verification_hedger = verification_hedger
+        self.score_verifier = score_verifier
+        self.unavailability_policy = unavailability_policy
+
+        self.verify_speculatively = verify_speculatively
+
+        self.metrics = metrics
+
+        self.rate_limiter = rate_limiter
+
+        self.replay_guard = replay_guard
+
+        self.pass_token_timeout = pass_token_timeout
+
+        self.max_solution_length = max_solution_length
+        self.max_challenge_id_length = max_challenge_id_length
+        self.max_score_token_length = max_score_token_length
+        if isinstance(challenge_id_pattern, basestring):
+            challenge_id_pattern = compile_regex(challenge_id_pattern)
+        self.challenge_id_pattern = challenge_id_pattern
+
+        self.remote_ip_resolver = remote_ip_resolver
+
+        self._allowed_network_index = \
+            _IpAddressRangeIndex(allowed_networks or ())
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def bound_data(self, data, initial):
+        # The solution is never presented back to the user
+        return initial
+
+    def has_changed(self, initial, data):
+        return data is not None
+
+    _has_changed = has_changed
 
     def validate(self, value):
         super(_RecaptchaField, self).validate(value)
 
-        solution_text = _encode_input_for_recaptcha(value['solution_text'])
-        challenge_id = _encode_input_for_recaptcha(value['challenge_id'])
-        try:
-            is_solution_correct = self.recaptcha_client.is_solution_correct(
-                solution_text,
-                challenge_id,
-                self.remote_ip,
-                )
-        except RecaptchaInvalidChallengeError:
+        # Reject junk before it's encoded or sent to reCAPTCHA
+        if not self._is_value_well_formed(value):
             raise ValidationError(self.error_messages['invalid'])
 
-        if not is_solution_correct:
-            self.widget.was_previous_solution_incorrect = True
-            raise ValidationError(self.error_messages['incorrect_solution'])
+    def get_remote_ip(self, request):
+        """Return the IP address of the user who made ``request``."""
+        if self.remote_ip_resolver is None:
+            remote_ip = request.META['REMOTE_ADDR']
+        else:
+            remote_ip = self.remote_ip_resolver.get_remote_ip(request)
+        return remote_ip
 
+    def get_recaptcha_client(self, request):
+        """Return the reCAPTCHA client for the tenant of ``request``."""
+        if self.recaptcha_client_registry is None:
+            recaptcha_client = self.recaptcha_client
+        else:
+            recaptcha_client = \
+                self.recaptcha_client_registry.get_client(request)
+        return recaptcha_client
 
-class _RecaptchaWidget(Widget):
+    def is_remote_ip_allowed(self, remote_ip):
+        """
+        Report whether ``remote_ip`` is in any of the ``allowed_networks``,
+        from which no CAPTCHA has to be solved.
 
-    def __init__(self, recaptcha_client, transmit_challenge_over_ssl=False):
-        super(_RecaptchaWidget, self).__init__()
+        """
+        return remote_ip in self._allowed_network_index
 
-        self.recaptcha_client = recaptcha_client
-        self.transmit_challenge_over_ssl = transmit_challenge_over_ssl
+    def create_pass_token(self, remote_ip):
+        """
+        Return a token proving that a solution submitted from ``remote_ip``
+        was just verified.
 
-        self.was_previous_solution_incorrect = False
+        """
+        issue_time = str(int(time()))
+        signature = _sign_pass_token(issue_time, remote_ip)
+        pass_token = '{}:{}'.format(issue_time, signature)
+        return pass_token
 
-    def value_from_datadict(self, data, files, name):
-        solution_text = data.get('recaptcha_response_field')
-        challenge_id = data.get('recaptcha_challenge_field')
+    def is_pass_token_valid(self, pass_token, remote_ip):
+        """
+        Report whether ``pass_token`` was created by :meth:`create_pass_token`
+        for ``remote_ip`` no more than ``pass_token_timeout`` seconds ago.
 
-        if solution_text and challenge_id:
-            value = {
-                'solution_text': solution_text,
-                'challenge_id': challenge_id,
-                }
-        else:
-            value = None
+        """
+        try:
+            issue_time, signature = pass_token.split(':')
+            pass_token_age = time() - int(issue_time)
+        except (AttributeError, ValueError):
+            return False
 
-        return value
+        is_pass_token_valid = \
+            0 <= pass_token_age <= self.pass_token_timeout and \
+            constant_time_compare(
+                signature,
+                _sign_pass_token(issue_time, remote_ip),
+                )
+        return is_pass_token_valid
 
-    def render(self, name, value, attrs=None):
-        challenge_markup = self.recaptcha_client.get_challenge_markup(
-            self.was_previous_solution_incorrect,
-            self.transmit_challenge_over_ssl,
-            )
-        return challenge_markup
+    def start_verification(self, value, form_state):
+        """
+        Start verifying ``value`` in the background, so that :meth:`verify`
+        only has to wait for the remainder of the verification.
 
+        Score tokens are verified in :meth:`verify`.
 
-#{ Utilities
+        """
+        if _is_score_token_value(value) or \
+                not self._is_value_well_formed(value):
+            return
 
+        verification_input = _get_verification_input(value)
+        if _get_pending_verification(form_state, verification_input) is None:
+            background_verification = _BackgroundCall(
+                self._get_verification_outcome,
+                form_state.recaptcha_client or self.recaptcha_client,
+                form_state.remote_ip,
+                *verification_input
+                )
+            form_state.pending_verification = \
+                (verification_input, background_verification)
 
-def _encode_input_for_recaptcha(string):
-    string_encoded = force_unicode(
-        string,
-        settings.DEFAULT_CHARSET,
+    def verify(self, value, form_state):
+        """
+        Verify the solution in ``value`` on behalf of the form instance whose
+        state is ``form_state``.
+
+        :raises ValidationError: If the solution or the challenge is not valid
+
+        """
+        verification_outcome = self.get_verification_outcome(value, form_state)
+        self.check_verification_outcome(verification_outcome, form_state)
+
+    def get_verification_outcome(self, value, form_state):
+        """
+        Return the outcome of the verification of ``value``, waiting for the
+        one started by :meth:`start_verification` if any.
+
+        """
+        if _is_score_token_value(value):
+            verification_outcome = self._request_score_verification_outcome(
+                form_state.remote_ip,
+                value['score_token'],
+                )
+        else:
+            verification_input = _get_verification_input(value)
+            background_verification = \
+                _get_pending_verification(form_state, verification_input)
+            if background_verification is None:
+                verification_outcome = self._get_verification_outcome(
+                    form_state.recaptcha_client or self.recaptcha_client,
+                    form_state.remote_ip,
+                    *verification_input
+                    )
+            else:
+                verification_outcome = background_verification.get_result()
+
+        return verification_outcome
+
+    def check_verification_outcome(self, verification_outcome, form_state):
+        """
+        Record ``verification_outcome`` in ``form_state``.
+
+        :raises ValidationError: If the outcome means that the solution or the
+            challenge is not valid
+
+        """
+        if verification_outcome == _VERIFICATION_OUTCOME_LOW_SCORE:
+            form_state.is_challenge_required = True
+            raise ValidationError(self.error_messages['challenge_required'])
+
+        if verification_outcome == _VERIFICATION_OUTCOME_INVALID_CHALLENGE:
+            raise ValidationError(self.error_messages['invalid'])
+
+        if verification_outcome == _VERIFICATION_OUTCOME_INCORRECT:
+            form_state.was_previous_solution_incorrect = True
+            raise ValidationError(self.error_messages['incorrect_solution'])
+
+        if verification_outcome == _VERIFICATION_OUTCOME_RATE_LIMITED:
+            raise ValidationError(self.error_messages['rate_limited'])
+
+        if verification_outcome == _VERIFICATION_OUTCOME_UNAVAILABLE:
+            if self.unavailability_policy == _UNAVAILABILITY_POLICY_REJECT:
+                raise ValidationError(self.error_messages['unavailable'])
+            form_state.was_verification_skipped = True
+
+    def _is_value_well_formed(self, value):
+        if _is_score_token_value(value):
+            score_token = value['score_token']
+            is_score_token_well_formed = \
+                isinstance(score_token, basestring) and \
+                len(score_token) <= self.max_score_token_length
+            return is_score_token_well_formed
+
+        solution_text = value['solution_text']
+        challenge_id = value['challenge_id']
+        # Values decoded from JSON may not be strings
+        if not isinstance(solution_text, basestring) or \
+                not isinstance(challenge_id, basestring):
+            return False
+
+        if self.max_solution_length < len(solution_text) or \
+                self.max_challenge_id_length < len(challenge_id):
+            return False
+
+        if self.challenge_id_pattern is not None:
+            challenge_id_match = self.challenge_id_pattern.match(challenge_id)
+            if challenge_id_match is None or \
+                    challenge_id_match.end() != len(challenge_id):
+                return False
+
+        return True
+
+    def _get_verification_outcome(
+        self,
+        recaptcha_client,
+        remote_ip,
+        solution_text,
+        challenge_id,
+        ):
+        if self.verification_cache is None:
+            verification_outcome = self._request_verification_outcome(
+                recaptcha_client,
+                remote_ip,
+                solution_text,
+                challenge_id,
+                )
+            return verification_outcome
+
+        cache_key = _get_verification_cache_key(
+            solution_text,
+            challenge_id,
+            remote_ip,
+            )
+        verification_outcome = self.verification_cache.get(cache_key)
+        if verification_outcome is not None:
+            return verification_outcome
+
+        if self.verification_lease_timeout is None:
+            verification_outcome = self._request_and_cache_verification_outcome(
+                cache_key,
+                recaptcha_client,
+                remote_ip,
+                solution_text,
+                challenge_id,
+                )
+            return verification_outcome
+
+        # Only the holder of the lease contacts reCAPTCHA, and any other
+        # process verifying the same solution waits for it to cache the outcome
+        lease_key = _VERIFICATION_LEASE_KEY_PREFIX + cache_key
+        is_lease_acquired = self.verification_cache.add(
+            lease_key,
+            True,
+            self.verification_lease_timeout,
+            )
+        if is_lease_acquired:
+            try:
+                verification_outcome = \
+                    self._request_and_cache_verification_outcome(
+                        cache_key,
+                        recaptcha_client,
+                        remote_ip,
+                        solution_text,
+                        challenge_id,
+                        )
+            finally:
+                self.verification_cache.delete(lease_key)
+        else:
+            verification_outcome = self._wait_for_cached_verification_outcome(
+                cache_key,
+                lease_key,
+                )
+            if verification_outcome is None:
+                # The lease expired or was released without an outcome
+                verification_outcome = \
+                    self._request_and_cache_verification_outcome(
+                        cache_key,
+                        recaptcha_client,
+                        remote_ip,
+                        solution_text,
+                        challenge_id,
+                        )
+
+        return verification_outcome
+
+    def _request_and_cache_verification_outcome(
+        self,
+        cache_key,
+        recaptcha_client,
+        remote_ip,
+        solution_text,
+        challenge_id,
+        ):
+        verification_outcome = self._request_verification_outcome(
+            recaptcha_client,
+            remote_ip,
+            solution_text,
+            challenge_id,
+            )
+        if verification_outcome not in _UNCACHEABLE_VERIFICATION_OUTCOMES:
+            self.verification_cache.set(
+                cache_key,
+                verification_outcome,
+                self.verification_cache_timeout,
+                )
+        return verification_outcome
+
+    def _wait_for_cached_verification_outcome(self, cache_key, lease_key):
+        deadline = time() + self.verification_lease_timeout
+        verification_outcome = None
+        while verification_outcome is None and time() < deadline:
+            sleep(_VERIFICATION_LEASE_POLL_INTERVAL)
+            verification_outcome = self.verification_cache.get(cache_key)
+            if verification_outcome is None and \
+                    self.verification_cache.get(lease_key) is None:
+                # Check again in case the outcome was cached right before the
+                # lease was released
+                verification_outcome = self.verification_cache.get(cache_key)
+                break
+        return verification_outcome
+
+    def _request_verification_outcome(
+        self,
+        recaptcha_client,
+        remote_ip,
+        solution_text,
+        challenge_id,
+        ):
+        verification_start_time = time()
+
+        if self.replay_guard is not None and \
+                self.replay_guard.is_consumed(challenge_id):
+            self.metrics.record_verification(
+                _METRICS_OUTCOME_REPLAYED,
+                time() - verification_start_time,
+                )
+            return _VERIFICATION_OUTCOME_INVALID_CHALLENGE
+
+        if self._is_rate_limited(remote_ip, verification_start_time):
+            return _VERIFICATION_OUTCOME_RATE_LIMITED
+
+        verification_outcome = self._call_recaptcha(
+            verification_start_time,
+            _request_verification_outcome,
+            recaptcha_client,
+            solution_text,
+            challenge_id,
+            remote_ip,
+            self.verification_transport,
+            self.circuit_breaker,
+            self.verification_hedger,
+            )
+
+        # The challenge is only used up once reCAPTCHA has answered, so that
+        # the solution can be submitted again when it couldn't be verified
+        if self.replay_guard is not None and \
+                verification_outcome != _VERIFICATION_OUTCOME_UNAVAILABLE:
+            self.replay_guard.consume(challenge_id)
+
+        return verification_outcome
+
+    def _request_score_verification_outcome(self, remote_ip, score_token):
+        verification_start_time = time()
+
+        if self.score_verifier is None:
+            # The form wasn't rendered with this field
+            return _VERIFICATION_OUTCOME_INVALID_CHALLENGE
+
+        if self._is_rate_limited(remote_ip, verification_start_time):
+            return _VERIFICATION_OUTCOME_RATE_LIMITED
+
+        verification_outcome = self._call_recaptcha(
+            verification_start_time,
+            _request_score_verification_outcome,
+            self.score_verifier,
+            _encode_input_for_recaptcha(score_token),
+            remote_ip,
+            self.circuit_breaker,
+            )
+        return verification_outcome
+
+    def _is_rate_limited(self, remote_ip, verification_start_time):
+        if self.rate_limiter is None or self.rate_limiter.consume(remote_ip):
+            return False
+
+        self.metrics.record_verification(
+            _VERIFICATION_OUTCOME_RATE_LIMITED,
+            time() - verification_start_time,
+            )
+        return True
+
+    def _call_recaptcha(self, verification_start_time, function, *args):
+        """
+        Return the verification outcome from ``function``, recording it in the
+        metrics and applying the unavailability policy.
+
+        """
+        try:
+            verification_outcome = function(*args)
+        except RecaptchaUnreachableError:
+            self.metrics.record_verification(
+                _METRICS_OUTCOME_UNREACHABLE,
+                time() - verification_start_time,
+                )
+            if self.unavailability_policy is None:
+                raise
+            verification_outcome = _VERIFICATION_OUTCOME_UNAVAILABLE
+        except RecaptchaInvalidPrivateKeyError:
+            self.metrics.record_verification(
+                _METRICS_OUTCOME_INVALID_PRIVATE_KEY,
+                time() - verification_start_time,
+                )
+            raise
+        else:
+            self.metrics.record_verification(
+                verification_outcome,
+                time() - verification_start_time,
+                )
+
+        return verification_outcome
+
+
+class _RecaptchaWidget(Widget):
+    """
+    Widget for the reCAPTCHA challenge.
+
+    Like :class:`_RecaptchaField`, instances are immutable and the state of
+    the form instance is received as the value of the field.
+
+    """
+
+    def __init__(
+        self,
+        recaptcha_client,
+        metrics=None,
+        render_client_side=False,
+        score_verifier=None,
+        ):
+        super(_RecaptchaWidget, self).__init__()
+
+        self.recaptcha_client = recaptcha_client
+        self.metrics = metrics or _NULL_METRICS
+        self.render_client_side = render_client_side
+        self.score_verifier = score_verifier
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def value_from_datadict(self, data, files, name):
+        solution_text = data.get('recaptcha_response_field')
+        challenge_id = data.get('recaptcha_challenge_field')
+        score_token = data.get(_SCORE_TOKEN_FIELD_NAME)
+
+        if score_token and not (solution_text and challenge_id):
+            value = {'score_token': score_token}
+        elif solution_text and challenge_id:
+            value = {
+                'solution_text': solution_text,
+                'challenge_id': challenge_id,
+                }
+        else:
+            value = None
+
+        return value
+
+    def _has_changed(self, initial, data):
+        return data is not None
+
+    def render(self, name, value, attrs=None):
+        if isinstance(value, _RecaptchaFormState):
+            form_state = value
+        else:
+            form_state = _RecaptchaFormState()
+        recaptcha_client = form_state.recaptcha_client or self.recaptcha_client
+
+        rendering_start_time = time()
+        should_render_score_token = \
+            self.score_verifier is not None and \
+            not form_state.is_challenge_required and \
+            not form_state.was_previous_solution_incorrect
+        if should_render_score_token:
+            challenge_markup = \
+                _CHALLENGE_MARKUP_CACHE.get_score_token_markup(
+                    recaptcha_client,
+                    self.score_verifier,
+                    name + '_score_token',
+                    )
+        # The response to a submission with an incorrect solution isn't
+        # cacheable anyway, so it gets the challenge that says so
+        elif self.render_client_side and \
+                not form_state.was_previous_solution_incorrect:
+            challenge_markup = \
+                _CHALLENGE_MARKUP_CACHE.get_client_side_challenge_markup(
+                    recaptcha_client,
+                    name + '_challenge',
+                    )
+        else:
+            challenge_markup = _CHALLENGE_MARKUP_CACHE.get_challenge_markup(
+                recaptcha_client,
+                form_state.was_previous_solution_incorrect,
+                form_state.transmit_challenge_over_ssl,
+                )
+        self.metrics.record_rendering(time() - rendering_start_time)
+
+        return challenge_markup
+
+
+class _RecaptchaFormState(object):
+    """
+    State of the reCAPTCHA field in a form instance.
+
+    """
+
+    __slots__ = (
+        'remote_ip',
+        'transmit_challenge_over_ssl',
+        'recaptcha_client',
+        'was_previous_solution_incorrect',
+        'was_verification_skipped',
+        'was_verification_waived',
+        'is_challenge_required',
+        'pending_verification',
+        )
+
+    def __init__(
+        self,
+        remote_ip=None,
+        transmit_challenge_over_ssl=False,
+        recaptcha_client=None,
+        ):
+        super(_RecaptchaFormState, self).__init__()
+
+        self.remote_ip = remote_ip
+        self.transmit_challenge_over_ssl = transmit_challenge_over_ssl
+        # The client for the tenant of the request, if it differs from that of
+        # the field
+        self.recaptcha_client = recaptcha_client
+
+        self.was_previous_solution_incorrect = False
+        self.was_verification_skipped = False
+        self.was_verification_waived = False
+
+        self.is_challenge_required = False
+
+        self.pending_verification = None
+
+
+class _ChallengeMarkupCache(object):
+    """
+    Cache of the challenge markup generated by each reCAPTCHA client.
+
+    The markup only depends on the arguments to
+    :meth:`recaptcha.RecaptchaClient.get_challenge_markup` and the public key
+    and options of the client, so there are at most four variations per
+    client, plus one per element for the markup loaded client-side. The markup
+    for a client is discarded when its public key or options change, and when
+    the client itself is garbage collected.
+
+    """
+
+    def __init__(self):
+        super(_ChallengeMarkupCache, self).__init__()
+
+        self._challenge_markups_by_client = WeakKeyDictionary()
+        self._lock = Lock()
+
+    def get_challenge_markup(
+        self,
+        recaptcha_client,
+        was_previous_solution_incorrect,
+        transmit_challenge_over_ssl,
+        ):
+        markup_variation = (
+            bool(was_previous_solution_incorrect),
+            bool(transmit_challenge_over_ssl),
+            )
+        challenge_markup = self._get_markup(
+            recaptcha_client,
+            markup_variation,
+            recaptcha_client.get_challenge_markup,
+            was_previous_solution_incorrect,
+            transmit_challenge_over_ssl,
+            )
+        return challenge_markup
+
+    def get_client_side_challenge_markup(self, recaptcha_client, element_id):
+        """
+        Return the markup to load the challenge into the element identified by
+        ``element_id`` from the browser.
+
+        The markup doesn't depend on the request, so the page can be cached.
+
+        """
+        challenge_markup = self._get_markup(
+            recaptcha_client,
+            element_id,
+            _generate_client_side_challenge_markup,
+            recaptcha_client,
+            element_id,
+            )
+        return challenge_markup
+
+    def get_score_token_markup(
+        self,
+        recaptcha_client,
+        score_verifier,
+        element_id,
+        ):
+        """
+        Return the markup to get a score token from the browser into the
+        element identified by ``element_id``.
+
+        """
+        challenge_markup = self._get_markup(
+            recaptcha_client,
+            (score_verifier.site_key, score_verifier.action, element_id),
+            _generate_score_token_markup,
+            score_verifier,
+            element_id,
+            )
+        return challenge_markup
+
+    def _get_markup(
+        self,
+        recaptcha_client,
+        markup_variation,
+        markup_generator,
+        *markup_generator_args
+        ):
+        client_settings = _get_recaptcha_client_settings(recaptcha_client)
+
+        with self._lock:
+            cached_client_settings, challenge_markups = \
+                self._challenge_markups_by_client.get(
+                    recaptcha_client,
+                    (None, None),
+                    )
+            if cached_client_settings != client_settings:
+                challenge_markups = {}
+                self._challenge_markups_by_client[recaptcha_client] = \
+                    (client_settings, challenge_markups)
+
+            challenge_markup = challenge_markups.get(markup_variation)
+
+        if challenge_markup is None:
+            challenge_markup = markup_generator(*markup_generator_args)
+            with self._lock:
+                challenge_markups[markup_variation] = challenge_markup
+
+        return challenge_markup
+
+
+_CHALLENGE_MARKUP_CACHE = _ChallengeMarkupCache()
+
+
+class RecaptchaClientRegistry(object):
+    """
+    Registry of the reCAPTCHA client for each tenant of a multi-tenant site, so
+    that a single form class can serve them all.
+
+    Each client is created by ``client_factory`` the first time its tenant
+    makes a request, and reused afterwards. When more than ``max_size``
+    clients are registered, the least recently used one is discarded, along
+    with the challenge markup cached for it.
+
+    """
+
+    def __init__(
+        self,
+        client_factory,
+        tenant_resolver=None,
+        max_size=_DEFAULT_CLIENT_REGISTRY_MAX_SIZE,
+        ):
+        """
+
+        :param client_factory: Callable returning the
+            :class:`recaptcha.RecaptchaClient` for the tenant passed to it
+        :param tenant_resolver: Callable returning the tenant of the request
+            passed to it
+        :param max_size: The maximum number of clients kept at any given time
+        :type max_size: :class:`int`
+
+        When ``tenant_resolver`` is ``None``, requests are told apart by their
+        host name. Tenants must be hashable.
+
+        """
+        super(RecaptchaClientRegistry, self).__init__()
+
+        self.client_factory = client_factory
+        self.tenant_resolver = tenant_resolver or _get_request_host_name
+        self.max_size = max_size
+
+        self._clients = OrderedDict()
+        self._lock = Lock()
+
+    def get_client(self, request):
+        """Return the reCAPTCHA client for the tenant of ``request``."""
+        tenant = self.tenant_resolver(request)
+
+        with self._lock:
+            recaptcha_client = self._clients.pop(tenant, None)
+            if recaptcha_client is not None:
+                self._clients[tenant] = recaptcha_client
+        if recaptcha_client is not None:
+            return recaptcha_client
+
+        # The client is created outside the lock because the factory may
+        # take a while (e.g., to look up the keys in a database)
+        new_recaptcha_client = self.client_factory(tenant)
+
+        with self._lock:
+            # Keep the client created by any concurrent request instead, so
+            # that there's only ever one client per tenant
+            recaptcha_client = \
+                self._clients.pop(tenant, None) or new_recaptcha_client
+            self._clients[tenant] = recaptcha_client
+            if self.max_size < len(self._clients):
+                self._clients.popitem(last=False)
+
+        return recaptcha_client
+
+
+class PooledVerificationTransport(object):
+    """
+    Thread-safe pool of persistent HTTP connections to the reCAPTCHA
+    verification API.
+
+    Connections are kept alive between verifications, so that only the first
+    verification on each connection pays for establishing it.
+
+    """
+
+    def __init__(
+        self,
+        verification_url=_RECAPTCHA_VERIFICATION_URL,
+        pool_size=_DEFAULT_CONNECTION_POOL_SIZE,
+        timeout=_DEFAULT_TRANSPORT_TIMEOUT,
+        ):
+        """
+
+        :param verification_url: The URL to the reCAPTCHA verification API
+        :type verification_url: :class:`str`
+        :param pool_size: Maximum number of idle connections to keep open
+        :type pool_size: :class:`int`
+        :param timeout: Maximum number of seconds to wait for reCAPTCHA to
+            respond to a verification request
+        :type timeout: :class:`float`
+
+        When ``timeout`` is ``None``, the default socket timeout will be used,
+        which means no timeout unless it's been set.
+
+        """
+        super(PooledVerificationTransport, self).__init__()
+
+        verification_url_components = urlsplit(verification_url)
+        if verification_url_components.scheme == 'https':
+            self._connection_class = HTTPSConnection
+        else:
+            self._connection_class = HTTPConnection
+        self._host = verification_url_components.netloc
+        self._path = verification_url_components.path or '/'
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._idle_connections = LifoQueue(pool_size)
+
+    def prewarm(self):
+        """
+        Open as many connections as the pool can keep idle.
+
+        :raises RecaptchaUnreachableError: If it couldn't connect to reCAPTCHA
+
+        This is meant to be called when the worker process starts, so that
+        the first verifications don't pay for establishing the connections.
+
+        """
+        connections = []
+        try:
+            while len(connections) + self._idle_connections.qsize() < \
+                    self.pool_size:
+                connection = self._create_connection()
+                connection.connect()
+                connections.append(connection)
+        except (HTTPException, SocketError) as exc:
+            # The connection that failed mustn't be pooled, or it'd be taken
+            # for a reused one
+            connection.close()
+            raise RecaptchaUnreachableError(exc)
+        finally:
+            for connection in connections:
+                self._release_connection(connection)
+
+    def post(self, form_data, timeout=None):
+        """
+        Send ``form_data`` to the verification API and return the response.
+
+        :param form_data: The fields to be sent URL-encoded
+        :type form_data: :class:`dict`
+        :param timeout: The timeout for this request, if it differs from that
+            of the transport
+        :type timeout: :class:`float`
+        :rtype: :class:`str`
+        :raises RecaptchaUnreachableError: If it couldn't communicate with the
+            reCAPTCHA API or the connection timed out
+
+        """
+        request_body = urlencode(form_data)
+        if timeout is None:
+            timeout = self.timeout
+
+        connection, is_connection_reused = self._acquire_connection()
+        try:
+            try:
+                response = self._send_request(connection, request_body, timeout)
+            except (HTTPException, SocketError) as exc:
+                if not is_connection_reused or \
+                        not _is_stale_connection_error(exc):
+                    raise
+
+                # The server closed the connection while it was idle, before
+                # getting the request, so it's safe to send it once more
+                connection.close()
+                connection = self._create_connection()
+                response = self._send_request(connection, request_body, timeout)
+            response_body = response.read()
+        except (HTTPException, SocketError) as exc:
+            connection.close()
+            raise RecaptchaUnreachableError(exc)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release_connection(connection)
+
+        if response.status != 200:
+            raise RecaptchaUnreachableError(
+                'reCAPTCHA responded with HTTP status {}'.format(
+                    response.status,
+                    ),
+                )
+
+        return response_body
+
+    def _send_request(self, connection, request_body, timeout):
+        _set_connection_timeout(connection, timeout)
+        connection.request(
+            'POST',
+            self._path,
+            request_body,
+            {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'User-Agent': _TRANSPORT_USER_AGENT,
+                },
+            )
+        response = connection.getresponse()
+        return response
+
+    def _acquire_connection(self):
+        try:
+            connection = self._idle_connections.get_nowait()
+        except Empty:
+            connection = self._create_connection()
+            is_connection_reused = False
+        else:
+            is_connection_reused = True
+        return connection, is_connection_reused
+
+    def _release_connection(self, connection):
+        try:
+            self._idle_connections.put_nowait(connection)
+        except Full:
+            connection.close()
+
+    def _create_connection(self):
+        connection_kwargs = {}
+        if self.timeout is not None:
+            connection_kwargs['timeout'] = self.timeout
+        connection = self._connection_class(self._host, **connection_kwargs)
+        return connection
+
+
+class RecaptchaCircuitBreaker(object):
+    """
+    Circuit breaker for the communication with reCAPTCHA.
+
+    The circuit is opened when the proportion of recent verifications that
+    failed reaches ``failure_rate_threshold``, in which case verifications are
+    rejected immediately with :exc:`RecaptchaCircuitOpenError`. After
+    ``open_duration`` seconds, a single verification is let through to probe
+    reCAPTCHA: The circuit is closed if it succeeds and opened again
+    otherwise.
+
+    A verification fails when reCAPTCHA can't be reached or, if
+    ``slow_call_duration`` is set, when reCAPTCHA takes that many seconds or
+    longer to respond.
+
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold=0.5,
+        window_size=20,
+        minimum_call_count=10,
+        slow_call_duration=None,
+        open_duration=30,
+        ):
+        """
+
+        :param failure_rate_threshold: The proportion of failed verifications
+            that opens the circuit
+        :type failure_rate_threshold: :class:`float`
+        :param window_size: The number of recent verifications considered
+        :type window_size: :class:`int`
+        :param minimum_call_count: The number of recent verifications required
+            before the circuit can be opened
+        :type minimum_call_count: :class:`int`
+        :param slow_call_duration: Number of seconds after which a response is
+            considered a failure
+        :type slow_call_duration: :class:`float`
+        :param open_duration: Number of seconds to wait before probing
+            reCAPTCHA again
+        :type open_duration: :class:`float`
+
+        """
+        super(RecaptchaCircuitBreaker, self).__init__()
+
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_call_count = min(minimum_call_count, window_size)
+        self.slow_call_duration = slow_call_duration
+        self.open_duration = open_duration
+
+        self._recent_call_failures = deque(maxlen=window_size)
+        self._opening_time = None
+        self._is_probe_in_progress = False
+        self._lock = Lock()
+
+    @property
+    def is_open(self):
+        return self._opening_time is not None
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call ``function`` with ``args`` and ``kwargs`` unless the circuit is
+        open.
+
+        :raises RecaptchaCircuitOpenError: If the circuit is open
+
+        """
+        is_probe = self._acquire_call_permission()
+
+        call_start_time = time()
+        try:
+            function_result = function(*args, **kwargs)
+        except RecaptchaUnreachableError:
+            self._record_call(True, is_probe)
+            raise
+        except:
+            self._record_call(False, is_probe)
+            raise
+
+        call_duration = time() - call_start_time
+        is_call_slow = self.slow_call_duration is not None and \
+            self.slow_call_duration <= call_duration
+        self._record_call(is_call_slow, is_probe)
+
+        return function_result
+
+    def _acquire_call_permission(self):
+        with self._lock:
+            if self._opening_time is None:
+                return False
+
+            if self._is_probe_in_progress or \
+                    time() < self._opening_time + self.open_duration:
+                raise RecaptchaCircuitOpenError()
+
+            self._is_probe_in_progress = True
+            return True
+
+    def _record_call(self, is_failure, is_probe):
+        with self._lock:
+            if is_probe:
+                self._is_probe_in_progress = False
+                if is_failure:
+                    self._opening_time = time()
+                else:
+                    self._opening_time = None
+                    self._recent_call_failures.clear()
+            elif self._opening_time is None:
+                self._recent_call_failures.append(is_failure)
+                if self._is_failure_rate_exceeded():
+                    self._opening_time = time()
+
+    def _is_failure_rate_exceeded(self):
+        call_count = len(self._recent_call_failures)
+        if call_count < self.minimum_call_count:
+            return False
+
+        failure_count = sum(self._recent_call_failures)
+        failure_rate = float(failure_count) / call_count
+        return self.failure_rate_threshold <= failure_rate
+
+
+class RecaptchaCircuitOpenError(RecaptchaUnreachableError):
+    """
+    reCAPTCHA wasn't contacted because it's been failing recently.
+
+    """
+    pass
+
+
+class RecaptchaVerificationHedger(object):
+    """
+    Sender of a second, identical verification request when reCAPTCHA takes
+    longer than ``delay`` seconds to respond to the first one.
+
+    A solution reported as correct by either request is accepted straightaway.
+    Otherwise, the response to the first request is used unless reCAPTCHA
+    couldn't be reached, since the second request may have been rejected
+    merely because the first one used up the challenge. Requests that lose
+    the race are abandoned: Their responses are discarded when they arrive.
+
+    No more than ``max_outstanding_hedges`` second requests are in progress
+    at any given time, so that reCAPTCHA isn't flooded when it's slow for
+    everyone.
+
+    """
+
+    def __init__(self, delay, max_outstanding_hedges=4):
+        """
+
+        :param delay: Number of seconds to wait for the first request before
+            sending the second one (e.g., the 95th percentile of the duration
+            of verifications)
+        :type delay: :class:`float`
+        :param max_outstanding_hedges: Maximum number of second requests in
+            progress at any given time
+        :type max_outstanding_hedges: :class:`int`
+
+        """
+        super(RecaptchaVerificationHedger, self).__init__()
+
+        self.delay = delay
+        self.max_outstanding_hedges = max_outstanding_hedges
+
+        self.hedge_count = 0
+        """The number of second requests sent."""
+
+        self.hedge_win_count = 0
+        """The number of second requests whose response was used."""
+
+        self.suppressed_hedge_count = 0
+        """
+        The number of second requests not sent because too many were in
+        progress.
+
+        """
+
+        self._outstanding_hedge_count = 0
+        self._lock = Lock()
+
+    def call(self, function, *args):
+        """
+        Call ``function`` with ``args``, and call it again concurrently if it
+        doesn't return within :attr:`delay` seconds.
+
+        ``function`` must return whether the solution is correct.
+
+        """
+        call_results = Queue()
+        _start_hedged_call(call_results, False, function, args)
+
+        try:
+            call_result = call_results.get(timeout=self.delay)
+        except Empty:
+            is_hedge_sent = self._acquire_hedge()
+            if is_hedge_sent:
+                _start_hedged_call(
+                    call_results,
+                    True,
+                    function,
+                    args,
+                    self._release_hedge,
+                    )
+            call_result = call_results.get()
+        else:
+            is_hedge_sent = False
+
+        if is_hedge_sent and not _is_hedged_call_successful(call_result):
+            call_result = _choose_hedged_call_result(
+                call_result,
+                call_results.get(),
+                )
+
+        is_hedge, function_result, exception = call_result
+        if is_hedge:
+            with self._lock:
+                self.hedge_win_count += 1
+
+        if exception is not None:
+            raise exception
+        return function_result
+
+    def _acquire_hedge(self):
+        with self._lock:
+            if self.max_outstanding_hedges <= self._outstanding_hedge_count:
+                self.suppressed_hedge_count += 1
+                return False
+
+            self._outstanding_hedge_count += 1
+            self.hedge_count += 1
+            return True
+
+    def _release_hedge(self):
+        with self._lock:
+            self._outstanding_hedge_count -= 1
+
+
+class RecaptchaScoreVerifier(object):
+    """
+    Verifier of the tokens with which reCAPTCHA scores users without
+    presenting them with a challenge.
+
+    """
+
+    def __init__(
+        self,
+        site_key,
+        secret_key,
+        score_threshold=_DEFAULT_SCORE_THRESHOLD,
+        action='submit',
+        verification_transport=None,
+        ):
+        """
+
+        :param site_key: The key used in the browser to get the tokens
+        :type site_key: :class:`str`
+        :param secret_key: The key used to verify the tokens
+        :type secret_key: :class:`str`
+        :param score_threshold: The lowest score accepted, between 0 and 1
+        :type score_threshold: :class:`float`
+        :param action: The name of the action the tokens are requested for
+        :type action: :class:`str`
+        :param verification_transport: The transport to communicate with the
+            reCAPTCHA verification API
+        :type verification_transport: :class:`PooledVerificationTransport`
+
+        """
+        super(RecaptchaScoreVerifier, self).__init__()
+
+        self.site_key = site_key
+        self.secret_key = secret_key
+        self.score_threshold = score_threshold
+        self.action = action
+
+        if verification_transport is None:
+            verification_transport = \
+                PooledVerificationTransport(_RECAPTCHA_SCORE_VERIFICATION_URL)
+        self.verification_transport = verification_transport
+
+    def get_score(self, score_token, remote_ip):
+        """
+        Return the score given by reCAPTCHA to the user who got
+        ``score_token``.
+
+        :rtype: :class:`float`
+        :raises RecaptchaInvalidChallengeError: If ``score_token`` is not valid
+            or was requested for another action
+        :raises RecaptchaInvalidPrivateKeyError:
+        :raises RecaptchaUnreachableError: If it couldn't communicate with the
+            reCAPTCHA API or the connection timed out
+
+        """
+        response_body = self.verification_transport.post({
+            'secret': self.secret_key,
+            'response': score_token.encode(RECAPTCHA_CHARACTER_ENCODING),
+            'remoteip': remote_ip or '',
+            })
+        try:
+            verification_result = json_decode(response_body)
+            is_token_valid = verification_result['success']
+        except (ValueError, TypeError, KeyError) as exc:
+            raise RecaptchaUnreachableError(exc)
+
+        if not is_token_valid:
+            error_codes = verification_result.get('error-codes', [])
+            if 'invalid-input-secret' in error_codes:
+                raise RecaptchaInvalidPrivateKeyError(self.secret_key)
+            raise RecaptchaInvalidChallengeError(score_token)
+
+        if verification_result.get('action', self.action) != self.action:
+            raise RecaptchaInvalidChallengeError(score_token)
+
+        try:
+            score = float(verification_result.get('score', 0))
+        except (ValueError, TypeError) as exc:
+            raise RecaptchaUnreachableError(exc)
+        return score
+
+
+class RecaptchaMetrics(object):
+    """
+    Recorder of metrics about the rendering and verification of reCAPTCHA
+    challenges.
+
+    This implementation discards the metrics; subclasses record them.
+
+    """
+
+    def record_verification(self, outcome, duration):
+        """
+        Record a request to verify a solution.
+
+        :param outcome: One of ``"correct"``, ``"incorrect"``,
+            ``"invalid_challenge"``, ``"unreachable"``,
+            ``"invalid_private_key"``, ``"rate_limited"``, ``"replayed"`` and
+            ``"low_score"``
+        :type outcome: :class:`str`
+        :param duration: The number of seconds the verification took
+        :type duration: :class:`float`
+
+        Verifications whose outcome was cached aren't recorded. Those rejected
+        by the rate limiter or the replay guard are recorded even though
+        reCAPTCHA wasn't contacted.
+
+        """
+        pass
+
+    def record_rendering(self, duration):
+        """
+        Record the rendering of a challenge.
+
+        :param duration: The number of seconds the rendering took
+        :type duration: :class:`float`
+
+        """
+        pass
+
+
+class StatsdRecaptchaMetrics(RecaptchaMetrics):
+    """
+    Recorder of metrics in a StatsD client.
+
+    Verifications are recorded as a counter and a timer per outcome (e.g.,
+    ``recaptcha.verification.correct``) and renderings as the counter and
+    timer ``recaptcha.rendering``.
+
+    """
+
+    def __init__(self, statsd_client, prefix=_DEFAULT_METRICS_PREFIX):
+        """
+
+        :param statsd_client: A client with the methods ``incr(name)`` and
+            ``timing(name, milliseconds)``, like :class:`statsd.StatsClient`
+        :param prefix: The prefix of the names of the metrics
+        :type prefix: :class:`str`
+
+        """
+        super(StatsdRecaptchaMetrics, self).__init__()
+
+        self.statsd_client = statsd_client
+        self.prefix = prefix
+
+    def record_verification(self, outcome, duration):
+        metric_name = '{}.verification.{}'.format(self.prefix, outcome)
+        self._record(metric_name, duration)
+
+    def record_rendering(self, duration):
+        self._record(self.prefix + '.rendering', duration)
+
+    def _record(self, metric_name, duration):
+        self.statsd_client.incr(metric_name)
+        self.statsd_client.timing(metric_name, duration * 1000)
+
+
+class PrometheusRecaptchaMetrics(RecaptchaMetrics):
+    """
+    Recorder of metrics in a Prometheus registry.
+
+    Verifications are recorded in the histogram
+    ``recaptcha_verification_duration_seconds`` and renderings in the
+    histogram ``recaptcha_rendering_duration_seconds``. The former is labelled
+    with the ``outcome``, so its counts are the counters of each outcome.
+
+    This requires the package ``prometheus_client``.
+
+    """
+
+    def __init__(self, registry=None, namespace=_DEFAULT_METRICS_PREFIX):
+        """
+
+        :param registry: The registry to add the metrics to, or ``None`` to
+            use the default one
+        :type registry: :class:`prometheus_client.CollectorRegistry`
+        :param namespace: The prefix of the names of the metrics
+        :type namespace: :class:`str`
+
+        """
+        from prometheus_client import REGISTRY
+        from prometheus_client import Histogram
+
+        super(PrometheusRecaptchaMetrics, self).__init__()
+
+        if registry is None:
+            registry = REGISTRY
+
+        self._verification_histogram = Histogram(
+            'verification_duration_seconds',
+            'Duration of the verifications of reCAPTCHA solutions',
+            ['outcome'],
+            namespace=namespace,
+            registry=registry,
+            )
+        self._rendering_histogram = Histogram(
+            'rendering_duration_seconds',
+            'Duration of the renderings of reCAPTCHA challenges',
+            namespace=namespace,
+            registry=registry,
+            )
+
+    def record_verification(self, outcome, duration):
+        self._verification_histogram.labels(outcome).observe(duration)
+
+    def record_rendering(self, duration):
+        self._rendering_histogram.observe(duration)
+
+
+_NULL_METRICS = RecaptchaMetrics()
+
+
+class RecaptchaRateLimiter(object):
+    """
+    Token bucket per remote IP address, to limit the verifications requested
+    on behalf of each address.
+
+    Each address can have up to ``capacity`` solutions verified in a burst,
+    and then ``rate`` per second.
+
+    The buckets are kept in-process unless a Django cache backend is given, in
+    which case they're shared by all the processes using it. Buckets in a
+    cache are updated without locking it, so concurrent submissions from the
+    same address in different processes may occasionally get an extra token.
+
+    """
+
+    def __init__(
+        self,
+        rate,
+        capacity,
+        cache=None,
+        max_size=_DEFAULT_RATE_LIMITER_MAX_SIZE,
+        ):
+        """
+
+        :param rate: The number of tokens added to each bucket per second
+        :type rate: :class:`float`
+        :param capacity: The maximum number of tokens in each bucket
+        :type capacity: :class:`int`
+        :param cache: The Django cache backend to keep the buckets in
+        :param max_size: The maximum number of buckets kept in-process
+        :type max_size: :class:`int`
+        :raises ValueError: If ``rate`` isn't positive
+
+        When more than ``max_size`` addresses are tracked in-process, the
+        least recently used bucket is discarded.
+
+        """
+        super(RecaptchaRateLimiter, self).__init__()
+
+        if not 0 < rate:
+            raise ValueError(
+                'The rate must be greater than zero; got {!r}'.format(rate),
+                )
+
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.cache = cache
+        self.max_size = max_size
+
+        # A bucket can be discarded once it'd have been refilled completely
+        self._bucket_timeout = int(ceil(capacity / self.rate))
+
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def consume(self, remote_ip):
+        """
+        Take a token from the bucket for ``remote_ip``.
+
+        :return: Whether there was a token to take
+        :rtype: :class:`bool`
+
+        """
+        bucket_key = remote_ip or ''
+        if self.cache is None:
+            with self._lock:
+                is_token_available = self._consume(bucket_key)
+        else:
+            # Locking wouldn't protect the buckets from other processes, and
+            # it'd make every verification wait for the cache
+            is_token_available = self._consume(bucket_key)
+        return is_token_available
+
+    def _consume(self, bucket_key):
+        bucket = self._get_bucket(bucket_key)
+
+        current_time = time()
+        if bucket is None:
+            token_count = self.capacity
+        else:
+            previous_token_count, last_update_time = bucket
+            refill_token_count = (current_time - last_update_time) * self.rate
+            token_count = min(
+                self.capacity,
+                previous_token_count + refill_token_count,
+                )
+
+        is_token_available = 1 <= token_count
+        if is_token_available:
+            token_count -= 1
+
+        self._set_bucket(bucket_key, (token_count, current_time))
+
+        return is_token_available
+
+    def _get_bucket(self, bucket_key):
+        if self.cache is None:
+            bucket = self._buckets.pop(bucket_key, None)
+        else:
+            bucket = self.cache.get(_RATE_LIMIT_CACHE_KEY_PREFIX + bucket_key)
+        return bucket
+
+    def _set_bucket(self, bucket_key, bucket):
+        if self.cache is None:
+            self._buckets[bucket_key] = bucket
+            if self.max_size < len(self._buckets):
+                self._buckets.popitem(last=False)
+        else:
+            self.cache.set(
+                _RATE_LIMIT_CACHE_KEY_PREFIX + bucket_key,
+                bucket,
+                self._bucket_timeout,
+                )
+
+
+class RecaptchaReplayGuard(object):
+    """
+    Record of the challenges whose solutions have been verified, to reject
+    further solutions to them without contacting reCAPTCHA.
+
+    Challenges are recorded for at least ``challenge_lifetime`` seconds.
+
+    In-process, challenges are recorded in two Bloom filters that are rotated
+    every ``challenge_lifetime`` seconds, so the memory used doesn't depend on
+    the traffic: Each filter takes about ``2.4 * capacity`` bytes with the
+    default false positive rate. If more than ``capacity`` challenges are
+    recorded in a filter, new challenges are rejected more often than
+    ``false_positive_rate``.
+
+    When a Django cache backend is given, each challenge is recorded exactly
+    in the cache instead, and shared by all the processes using it.
+
+    """
+
+    def __init__(
+        self,
+        challenge_lifetime=_DEFAULT_CHALLENGE_LIFETIME,
+        cache=None,
+        capacity=_DEFAULT_REPLAY_GUARD_CAPACITY,
+        false_positive_rate=_DEFAULT_REPLAY_GUARD_FALSE_POSITIVE_RATE,
+        ):
+        """
+
+        :param challenge_lifetime: The number of seconds for which reCAPTCHA
+            accepts solutions to a challenge
+        :type challenge_lifetime: :class:`int`
+        :param cache: The Django cache backend to record the challenges in
+        :param capacity: The number of challenges expected in
+            ``challenge_lifetime`` seconds
+        :type capacity: :class:`int`
+        :param false_positive_rate: The proportion of new challenges that may
+            be taken for recorded ones
+        :type false_positive_rate: :class:`float`
+
+        """
+        super(RecaptchaReplayGuard, self).__init__()
+
+        self.challenge_lifetime = challenge_lifetime
+        self.cache = cache
+
+        self._bloom_filter_size = \
+            _get_bloom_filter_size(capacity, false_positive_rate)
+        self._bloom_filter_hash_count = \
+            _get_bloom_filter_hash_count(self._bloom_filter_size, capacity)
+
+        self._current_bloom_filter = None
+        self._previous_bloom_filter = None
+        self._rotation_time = None
+        self._lock = Lock()
+
+    def is_consumed(self, challenge_id):
+        """
+        Report whether ``challenge_id`` has been recorded, without recording
+        it.
+
+        :rtype: :class:`bool`
+
+        """
+        challenge_id_hash = _hash_challenge_id(challenge_id)
+
+        if self.cache is not None:
+            is_challenge_consumed = self.cache.get(
+                _CONSUMED_CHALLENGE_CACHE_KEY_PREFIX + challenge_id_hash,
+                ) is not None
+            return is_challenge_consumed
+
+        bit_indices = _get_bloom_filter_bit_indices(
+            challenge_id_hash,
+            self._bloom_filter_size,
+            self._bloom_filter_hash_count,
+            )
+        with self._lock:
+            self._rotate_bloom_filters()
+
+            is_challenge_consumed = any(
+                _is_in_bloom_filter(bloom_filter, bit_indices)
+                for bloom_filter in (
+                    self._previous_bloom_filter,
+                    self._current_bloom_filter,
+                    )
+                )
+
+        return is_challenge_consumed
+
+    def consume(self, challenge_id):
+        """
+        Record ``challenge_id``, unless it's been recorded already.
+
+        :return: Whether ``challenge_id`` hadn't been recorded
+        :rtype: :class:`bool`
+
+        """
+        challenge_id_hash = _hash_challenge_id(challenge_id)
+
+        if self.cache is not None:
+            was_challenge_unused = self.cache.add(
+                _CONSUMED_CHALLENGE_CACHE_KEY_PREFIX + challenge_id_hash,
+                True,
+                self.challenge_lifetime,
+                )
+            return was_challenge_unused
+
+        bit_indices = _get_bloom_filter_bit_indices(
+            challenge_id_hash,
+            self._bloom_filter_size,
+            self._bloom_filter_hash_count,
+            )
+        with self._lock:
+            self._rotate_bloom_filters()
+
+            was_challenge_unused = \
+                not _is_in_bloom_filter(self._previous_bloom_filter, bit_indices)
+            if not _add_to_bloom_filter(self._current_bloom_filter, bit_indices):
+                was_challenge_unused = False
+
+        return was_challenge_unused
+
+    def _rotate_bloom_filters(self):
+        current_time = time()
+        if self._rotation_time is not None and \
+                current_time < self._rotation_time + self.challenge_lifetime:
+            return
+
+        if self._rotation_time is not None and \
+                current_time < self._rotation_time + 2 * self.challenge_lifetime:
+            self._previous_bloom_filter = self._current_bloom_filter
+        else:
+            self._previous_bloom_filter = None
+        self._current_bloom_filter = \
+            bytearray((self._bloom_filter_size + 7) // 8)
+        self._rotation_time = current_time
+
+
+class ProxyAwareRemoteIpResolver(object):
+    """
+    Resolver of the IP address of the user behind trusted reverse proxies.
+
+    The address of the peer is used unless it's a trusted proxy, in which case
+    the addresses it forwarded in ``forwarded_header`` are walked from right to
+    left until one that isn't a trusted proxy is found.
+
+    """
+
+    def __init__(
+        self,
+        trusted_proxies,
+        forwarded_header=_X_FORWARDED_FOR_HEADER,
+        ):
+        """
+
+        :param trusted_proxies: The addresses of the trusted proxies, in CIDR
+            notation (e.g., ``"10.0.0.0/8"``) or as individual addresses
+        :type trusted_proxies: iterable of :class:`str`
+        :param forwarded_header: The header the trusted proxies append the
+            address of their peers to: ``"X-Forwarded-For"`` or
+            ``"Forwarded"``
+        :type forwarded_header: :class:`str`
+        :raises ValueError: If any of the addresses is malformed or the header
+            isn't supported
+
+        Only the header set by the trusted proxies must be used, since any
+        other header is passed on from users unchanged.
+
+        """
+        super(ProxyAwareRemoteIpResolver, self).__init__()
+
+        if forwarded_header == _FORWARDED_HEADER:
+            self._get_forwarded_ips = _get_forwarded_header_ips
+        elif forwarded_header == _X_FORWARDED_FOR_HEADER:
+            self._get_forwarded_ips = _get_x_forwarded_for_header_ips
+        else:
+            raise ValueError(
+                'Unsupported forwarded header {!r}'.format(forwarded_header),
+                )
+        self.forwarded_header = forwarded_header
+
+        self._trusted_proxy_index = _IpAddressRangeIndex(trusted_proxies)
+
+    def get_remote_ip(self, request):
+        """
+        Return the IP address of the user who made ``request``.
+
+        Should a trusted proxy have forwarded a malformed or obfuscated
+        address, the address of that proxy is returned.
+
+        """
+        remote_ip = request.META['REMOTE_ADDR']
+
+        forwarded_ips = self._get_forwarded_ips(request)
+        while remote_ip in self._trusted_proxy_index and forwarded_ips:
+            forwarded_ip = forwarded_ips.pop()
+            if _parse_ip_address(forwarded_ip) is None:
+                break
+            remote_ip = forwarded_ip
+
+        return remote_ip
+
+
+class _IpAddressRangeIndex(object):
+    """
+    Set of IP address ranges, with lookups in logarithmic time.
+
+    The ranges of each address family are merged and sorted when the index is
+    created, so that the range that may contain an address can be bisected.
+
+    """
+
+    def __init__(self, networks):
+        super(_IpAddressRangeIndex, self).__init__()
+
+        address_ranges_by_family = \
+            dict((family, []) for family in _IP_ADDRESS_FAMILIES)
+        for network in networks:
+            family, first_address, last_address = _parse_network(network)
+            address_ranges_by_family[family].append(
+                (first_address, last_address),
+                )
+
+        self._range_boundaries_by_family = {}
+        for family, address_ranges in address_ranges_by_family.items():
+            merged_address_ranges = _merge_address_ranges(address_ranges)
+            self._range_boundaries_by_family[family] = (
+                [first_address for first_address, _ in merged_address_ranges],
+                [last_address for _, last_address in merged_address_ranges],
+                )
+
+    def __contains__(self, ip_address):
+        parsed_ip_address = _parse_ip_address(ip_address)
+        if parsed_ip_address is None:
+            return False
+
+        family, address = parsed_ip_address
+        first_addresses, last_addresses = \
+            self._range_boundaries_by_family[family]
+        range_index = bisect_right(first_addresses, address) - 1
+        return 0 <= range_index and address <= last_addresses[range_index]
+
+
+#{ Utilities
+
+
+class _BackgroundCall(object):
+    """Call to a function in a separate thread."""
+
+    def __init__(self, function, *args):
+        super(_BackgroundCall, self).__init__()
+
+        self._function = function
+        self._args = args
+
+        self._result = None
+        self._exception = None
+
+        self._thread = Thread(target=self._call_function)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_result(self):
+        """
+        Wait for the call to finish and return its result, or raise its
+        exception.
+
+        """
+        self._thread.join()
+
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def _call_function(self):
+        try:
+            self._result = self._function(*self._args)
+        except Exception as exc:
+            self._exception = exc
+
+
+def _start_hedged_call(
+    call_results,
+    is_hedge,
+    function,
+    args,
+    completion_callback=None,
+    ):
+    def call_function():
+        try:
+            call_result = (is_hedge, function(*args), None)
+        except Exception as exc:
+            call_result = (is_hedge, None, exc)
+        finally:
+            if completion_callback is not None:
+                completion_callback()
+        call_results.put(call_result)
+
+    call_thread = Thread(target=call_function)
+    call_thread.daemon = True
+    call_thread.start()
+
+
+def _is_hedged_call_successful(call_result):
+    _, function_result, exception = call_result
+    return exception is None and bool(function_result)
+
+
+def _choose_hedged_call_result(first_call_result, second_call_result):
+    if _is_hedged_call_successful(second_call_result):
+        return second_call_result
+
+    if first_call_result[0]:
+        hedge_call_result, original_call_result = \
+            first_call_result, second_call_result
+    else:
+        original_call_result, hedge_call_result = \
+            first_call_result, second_call_result
+
+    if isinstance(original_call_result[2], RecaptchaUnreachableError):
+        chosen_call_result = hedge_call_result
+    else:
+        chosen_call_result = original_call_result
+    return chosen_call_result
+
+
+def _get_verification_input(field_value):
+    solution_text = _encode_input_for_recaptcha(field_value['solution_text'])
+    challenge_id = _encode_input_for_recaptcha(field_value['challenge_id'])
+    return solution_text, challenge_id
+
+
+def _is_score_token_value(field_value):
+    return bool(field_value) and 'score_token' in field_value
+
+
+def _get_pending_verification(form_state, verification_input):
+    background_verification = None
+    if form_state.pending_verification:
+        pending_verification_input, pending_background_verification = \
+            form_state.pending_verification
+        if pending_verification_input == verification_input:
+            background_verification = pending_background_verification
+    return background_verification
+
+
+def _get_x_forwarded_for_header_ips(request):
+    x_forwarded_for_header = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    forwarded_ips = [
+        forwarded_ip.strip()
+        for forwarded_ip in x_forwarded_for_header.split(',')
+        if forwarded_ip.strip()
+        ]
+    return forwarded_ips
+
+
+def _get_forwarded_header_ips(request):
+    """Return the ``for`` address of each element in the header."""
+    forwarded_header = request.META.get('HTTP_FORWARDED', '')
+    if not forwarded_header.strip():
+        return []
+
+    forwarded_ips = []
+    for forwarded_element in forwarded_header.split(','):
+        forwarded_ip = ''
+        for forwarded_pair in forwarded_element.split(';'):
+            parameter_name, _, parameter_value = forwarded_pair.partition('=')
+            if parameter_name.strip().lower() == 'for':
+                forwarded_ip = _strip_port(parameter_value.strip().strip('"'))
+        forwarded_ips.append(forwarded_ip)
+    return forwarded_ips
+
+
+def _get_request_host_name(request):
+    host_name = _strip_port(request.get_host()).lower()
+    return host_name
+
+
+def _strip_port(node):
+    if node.startswith('['):
+        ip_address = node[1:].partition(']')[0]
+    elif node.count(':') == 1:
+        ip_address = node.partition(':')[0]
+    else:
+        ip_address = node
+    return ip_address
+
+
+def _parse_ip_address(ip_address):
+    """
+    Return the family of ``ip_address`` and its integer value, or ``None`` if
+    it's malformed.
+
+    """
+    for family in _IP_ADDRESS_FAMILIES:
+        try:
+            packed_ip_address = inet_pton(family, ip_address)
+        except (SocketError, TypeError, ValueError):
+            continue
+        return family, int(hexlify(packed_ip_address), 16)
+    return None
+
+
+def _parse_network(network):
+    ip_address, _, prefix_length = network.partition('/')
+
+    parsed_ip_address = _parse_ip_address(ip_address)
+    if parsed_ip_address is None:
+        raise ValueError('Malformed IP address in {!r}'.format(network))
+    family, address = parsed_ip_address
+
+    address_length = 32 if family == AF_INET else 128
+    if prefix_length:
+        if not prefix_length.isdigit() or address_length < int(prefix_length):
+            raise ValueError('Malformed prefix length in {!r}'.format(network))
+        host_length = address_length - int(prefix_length)
+    else:
+        host_length = 0
+
+    first_address = (address >> host_length) << host_length
+    last_address = first_address | ((1 << host_length) - 1)
+    return family, first_address, last_address
+
+
+def _merge_address_ranges(address_ranges):
+    merged_address_ranges = []
+    for first_address, last_address in sorted(address_ranges):
+        if merged_address_ranges and \
+                first_address <= merged_address_ranges[-1][1] + 1:
+            previous_first_address, previous_last_address = \
+                merged_address_ranges[-1]
+            merged_address_ranges[-1] = (
+                previous_first_address,
+                max(previous_last_address, last_address),
+                )
+        else:
+            merged_address_ranges.append((first_address, last_address))
+    return merged_address_ranges
+
+
+def _hash_challenge_id(challenge_id):
+    if isinstance(challenge_id, unicode):
+        challenge_id = challenge_id.encode(RECAPTCHA_CHARACTER_ENCODING)
+    return sha1(challenge_id).hexdigest()
+
+
+def _get_bloom_filter_size(capacity, false_positive_rate):
+    bloom_filter_size = \
+        -capacity * log(false_positive_rate) / (log(2) ** 2)
+    return max(8, int(ceil(bloom_filter_size)))
+
+
+def _get_bloom_filter_hash_count(bloom_filter_size, capacity):
+    bloom_filter_hash_count = float(bloom_filter_size) / capacity * log(2)
+    return max(1, int(round(bloom_filter_hash_count)))
+
+
+def _get_bloom_filter_bit_indices(item_hash, bloom_filter_size, hash_count):
+    # Derive all the hashes from two halves of the item hash (Kirsch and
+    # Mitzenmacher's double hashing)
+    hash1 = int(item_hash[:16], 16)
+    hash2 = int(item_hash[16:32], 16)
+    bit_indices = [
+        (hash1 + hash_index * hash2) % bloom_filter_size
+        for hash_index in range(hash_count)
+        ]
+    return bit_indices
+
+
+def _is_in_bloom_filter(bloom_filter, bit_indices):
+    if bloom_filter is None:
+        return False
+
+    is_in_bloom_filter = all(
+        bloom_filter[bit_index // 8] & (1 << (bit_index % 8))
+        for bit_index in bit_indices
+        )
+    return is_in_bloom_filter
+
+
+def _add_to_bloom_filter(bloom_filter, bit_indices):
+    """
+    Set the bits at ``bit_indices`` in ``bloom_filter``.
+
+    :return: Whether any of the bits was unset
+
+    """
+    was_any_bit_unset = False
+    for bit_index in bit_indices:
+        bit_mask = 1 << (bit_index % 8)
+        if not bloom_filter[bit_index // 8] & bit_mask:
+            bloom_filter[bit_index // 8] |= bit_mask
+            was_any_bit_unset = True
+    return was_any_bit_unset
+
+
+def _sign_pass_token(issue_time, remote_ip):
+    signed_value = '{}:{}'.format(issue_time, remote_ip or '')
+    signature = salted_hmac(_PASS_TOKEN_KEY_SALT, signed_value).hexdigest()
+    return signature
+
+
+def _encode_input_for_recaptcha(string):
+    if isinstance(string, str):
+        # Most input is ASCII, which doesn't require the default charset
+        try:
+            return string.decode('ascii')
+        except UnicodeDecodeError:
+            pass
+
+    string_encoded = force_unicode(
+        string,
+        settings.DEFAULT_CHARSET,
         errors='replace',
         )
     return string_encoded
 
 
+def _get_verification_result(
+    recaptcha_client,
+    submission,
+    verification_transport,
+    circuit_breaker,
+    ):
+    try:
+        challenge_id, solution_text, remote_ip = submission
+    except (TypeError, ValueError) as exc:
+        verification_result = RecaptchaVerificationResult(
+            None,
+            None,
+            None,
+            error=exc,
+            )
+        return verification_result
+
+    try:
+        verification_outcome = _request_verification_outcome(
+            recaptcha_client,
+            _encode_input_for_recaptcha(solution_text),
+            _encode_input_for_recaptcha(challenge_id),
+            remote_ip,
+            verification_transport,
+            circuit_breaker,
+            )
+    except Exception as exc:
+        # Any error is reported so that no submission goes missing from the
+        # results
+        verification_result = RecaptchaVerificationResult(
+            challenge_id,
+            solution_text,
+            remote_ip,
+            error=exc,
+            )
+    else:
+        verification_result = RecaptchaVerificationResult(
+            challenge_id,
+            solution_text,
+            remote_ip,
+            verification_outcome,
+            )
+    return verification_result
+
+
+def _request_verification_outcome(
+    recaptcha_client,
+    solution_text,
+    challenge_id,
+    remote_ip,
+    verification_transport=None,
+    circuit_breaker=None,
+    verification_hedger=None,
+    ):
+    verification_args = (
+        recaptcha_client,
+        solution_text,
+        challenge_id,
+        remote_ip,
+        verification_transport,
+        )
+    if verification_hedger is not None:
+        verification_args = (_is_solution_correct,) + verification_args
+        verification_function = verification_hedger.call
+    else:
+        verification_function = _is_solution_correct
+
+    try:
+        if circuit_breaker is None:
+            is_solution_correct = verification_function(*verification_args)
+        else:
+            is_solution_correct = circuit_breaker.call(
+                verification_function,
+                *verification_args
+                )
+    except RecaptchaInvalidChallengeError:
+        verification_outcome = _VERIFICATION_OUTCOME_INVALID_CHALLENGE
+    else:
+        if is_solution_correct:
+            verification_outcome = _VERIFICATION_OUTCOME_CORRECT
+        else:
+            verification_outcome = _VERIFICATION_OUTCOME_INCORRECT
+
+    return verification_outcome
+
+
+def _request_score_verification_outcome(
+    score_verifier,
+    score_token,
+    remote_ip,
+    circuit_breaker=None,
+    ):
+    try:
+        if circuit_breaker is None:
+            score = score_verifier.get_score(score_token, remote_ip)
+        else:
+            score = circuit_breaker.call(
+                score_verifier.get_score,
+                score_token,
+                remote_ip,
+                )
+    except RecaptchaInvalidChallengeError:
+        verification_outcome = _VERIFICATION_OUTCOME_INVALID_CHALLENGE
+    else:
+        if score_verifier.score_threshold <= score:
+            verification_outcome = _VERIFICATION_OUTCOME_CORRECT
+        else:
+            verification_outcome = _VERIFICATION_OUTCOME_LOW_SCORE
+
+    return verification_outcome
+
+
+def _is_solution_correct(
+    recaptcha_client,
+    solution_text,
+    challenge_id,
+    remote_ip,
+    verification_transport,
+    ):
+    if verification_transport is None:
+        is_solution_correct = recaptcha_client.is_solution_correct(
+            solution_text,
+            challenge_id,
+            remote_ip,
+            )
+    else:
+        is_solution_correct = _is_solution_correct_via_transport(
+            verification_transport,
+            recaptcha_client,
+            solution_text,
+            challenge_id,
+            remote_ip,
+            )
+    return is_solution_correct
+
+
+def _is_solution_correct_via_transport(
+    verification_transport,
+    recaptcha_client,
+    solution_text,
+    challenge_id,
+    remote_ip,
+    ):
+    """
+    Equivalent to :meth:`recaptcha.RecaptchaClient.is_solution_correct`, using
+    ``verification_transport`` to communicate with reCAPTCHA.
+
+    """
+    if not solution_text or not challenge_id:
+        return False
+
+    verification_form_data = {
+        'privatekey': recaptcha_client.private_key,
+        'remoteip': remote_ip or '',
+        'challenge': challenge_id.encode(RECAPTCHA_CHARACTER_ENCODING),
+        'response': solution_text.encode(RECAPTCHA_CHARACTER_ENCODING),
+        }
+    # The timeout of the client takes precedence, as it would without a
+    # transport
+    response_body = verification_transport.post(
+        verification_form_data,
+        getattr(recaptcha_client, 'verification_timeout', None),
+        )
+    response_lines = response_body.splitlines()
+
+    is_solution_correct = bool(response_lines) and response_lines[0] == 'true'
+    if not is_solution_correct and 1 < len(response_lines):
+        error_code = response_lines[1]
+        if error_code == 'invalid-request-cookie':
+            raise RecaptchaInvalidChallengeError(challenge_id)
+        elif error_code == 'invalid-site-private-key':
+            raise RecaptchaInvalidPrivateKeyError(recaptcha_client.private_key)
+
+    return is_solution_correct
+
+
+def _is_stale_connection_error(exception):
+    """
+    Report whether ``exception`` means that the server closed the connection
+    before getting the request, as opposed to a timeout or a failure to
+    process it.
+
+    """
+    if isinstance(exception, BadStatusLine):
+        # The status line received, if any, is reported
+        status_line = exception.line
+        is_stale_connection_error = \
+            status_line in ('', "''") or \
+            status_line.startswith('No status line received')
+    elif isinstance(exception, SocketError):
+        is_stale_connection_error = \
+            exception.errno in _STALE_CONNECTION_ERRNOS
+    else:
+        is_stale_connection_error = False
+    return is_stale_connection_error
+
+
+def _set_connection_timeout(connection, timeout):
+    if timeout is None:
+        timeout = getdefaulttimeout()
+    connection.timeout = timeout
+    if connection.sock is not None:
+        connection.sock.settimeout(timeout)
+
+
+def _get_form_class_key(
+    base_form_class,
+    recaptcha_client,
+    additional_field_kwargs,
+    ):
+    """
+    Return the key for the form class created with the arguments, or ``None``
+    if any of them is unhashable.
+
+    """
+    form_class_key = (
+        base_form_class,
+        recaptcha_client,
+        _freeze(additional_field_kwargs),
+        )
+    try:
+        hash(form_class_key)
+    except TypeError:
+        form_class_key = None
+    return form_class_key
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        frozen_items = sorted(
+            (key, _freeze(item)) for key, item in value.items()
+            )
+        frozen_value = (dict, tuple(frozen_items))
+    elif isinstance(value, (list, tuple)):
+        frozen_value = (type(value), tuple(_freeze(item) for item in value))
+    else:
+        frozen_value = value
+    return frozen_value
+
+
+def _generate_client_side_challenge_markup(recaptcha_client, element_id):
+    noscript_challenge_url = '{}?{}'.format(
+        _RECAPTCHA_NOSCRIPT_CHALLENGE_URL,
+        urlencode({'k': recaptcha_client.public_key}),
+        )
+    challenge_markup = _CLIENT_SIDE_CHALLENGE_MARKUP_TEMPLATE.format(
+        element_id=escape(element_id),
+        element_id_json=_encode_for_script(element_id),
+        ajax_api_url=_RECAPTCHA_AJAX_API_URL,
+        public_key_json=_encode_for_script(recaptcha_client.public_key),
+        recaptcha_options_json=recaptcha_client.recaptcha_options_json,
+        noscript_challenge_url=escape(noscript_challenge_url),
+        )
+    return challenge_markup
+
+
+def _generate_score_token_markup(score_verifier, element_id):
+    score_api_url = '{}?{}'.format(
+        _RECAPTCHA_SCORE_API_URL,
+        urlencode({'render': score_verifier.site_key}),
+        )
+    score_token_markup = _SCORE_TOKEN_MARKUP_TEMPLATE.format(
+        token_field_name=_SCORE_TOKEN_FIELD_NAME,
+        element_id=escape(element_id),
+        element_id_json=_encode_for_script(element_id),
+        score_api_url=escape(score_api_url),
+        site_key_json=_encode_for_script(score_verifier.site_key),
+        action_json=_encode_for_script(score_verifier.action),
+        refresh_interval=_SCORE_TOKEN_REFRESH_INTERVAL_MILLISECONDS,
+        )
+    return score_token_markup
+
+
+def _encode_for_script(value):
+    # Prevent the value from closing the script element
+    return json_encode(value).replace('<', '\\u003c')
+
+
+def _get_recaptcha_client_settings(recaptcha_client):
+    client_settings = (
+        getattr(recaptcha_client, 'public_key', None),
+        getattr(recaptcha_client, 'recaptcha_options_json', None),
+        )
+    return client_settings
+
+
+def _get_verification_cache_key(solution_text, challenge_id, remote_ip):
+    verification_input = json_encode([solution_text, challenge_id, remote_ip])
+    verification_input_hash = sha1(verification_input).hexdigest()
+    cache_key = _VERIFICATION_CACHE_KEY_PREFIX + verification_input_hash
+    return cache_key
+
+
 #}
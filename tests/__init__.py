@@ -24,6 +24,7 @@ __all__ = [
     'RANDOM_CHALLENGE_ID',
     'RANDOM_REMOTE_IP',
     'RANDOM_SOLUTION_TEXT',
+    'create_local_memory_cache',
     'setup',
     'teardown',
     ]
@@ -43,3 +44,9 @@ def setup():
 
 def teardown():
     del environ['DJANGO_SETTINGS_MODULE']
+
+
+def create_local_memory_cache(name):
+    # Importing the cache framework requires the settings to be set up
+    from django.core.cache.backends.locmem import LocMemCache
+    return LocMemCache(name, {})
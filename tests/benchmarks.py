@@ -0,0 +1,326 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+"""
+Benchmarks for the creation, rendering and validation of forms.
+
+Run them with::
+
+    python -m tests.benchmarks --output=results.json
+
+The results are written as JSON, so that those of different releases can be
+compared. Verifications are made against a local stand-in for the reCAPTCHA
+API, whose latency can be set with ``--verification-latency``.
+
+"""
+
+from json import dump as json_dump
+from optparse import OptionParser
+from os import path
+from platform import python_version
+from sys import stdout
+from time import time
+
+from django.forms.fields import CharField
+from django.forms.fields import EmailField
+from django.forms.forms import Form
+from django.http import HttpRequest
+from recaptcha import RecaptchaClient
+
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+from tests import setup
+from tests.verification_server import FakeVerificationServer
+
+
+__all__ = ['get_latency_statistics', 'main', 'run_benchmarks', 'write_results']
+
+
+_DEFAULT_ITERATIONS = 10000
+_DEFAULT_VERIFICATION_ITERATIONS = 200
+_DEFAULT_VERIFICATION_LATENCY = 0.01
+
+
+_LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+
+
+_FORM_DATA = {
+    'full_name': 'Alice',
+    'email_address': 'alice@example.com',
+    'recaptcha_response_field': RANDOM_SOLUTION_TEXT,
+    'recaptcha_challenge_field': RANDOM_CHALLENGE_ID,
+    }
+
+
+def main():
+    option_parser = OptionParser(description=__doc__.split('\n\n')[0])
+    option_parser.add_option(
+        '--iterations',
+        type='int',
+        default=_DEFAULT_ITERATIONS,
+        help='Number of iterations of the benchmarks that make no requests',
+        )
+    option_parser.add_option(
+        '--verification-iterations',
+        type='int',
+        default=_DEFAULT_VERIFICATION_ITERATIONS,
+        help='Number of iterations of the benchmarks that make requests',
+        )
+    option_parser.add_option(
+        '--verification-latency',
+        type='float',
+        default=_DEFAULT_VERIFICATION_LATENCY,
+        help='Seconds taken by the stand-in reCAPTCHA API to respond',
+        )
+    option_parser.add_option(
+        '--output',
+        help='File to write the results to (standard output by default)',
+        )
+    options = option_parser.parse_args()[0]
+
+    setup()
+    benchmark_results = run_benchmarks(
+        options.iterations,
+        options.verification_iterations,
+        options.verification_latency,
+        )
+
+    write_results(benchmark_results, options.output)
+
+
+def run_benchmarks(
+    iterations=_DEFAULT_ITERATIONS,
+    verification_iterations=_DEFAULT_VERIFICATION_ITERATIONS,
+    verification_latency=_DEFAULT_VERIFICATION_LATENCY,
+    ):
+    """
+    Run all the benchmarks and return their results.
+
+    :rtype: :class:`dict`
+
+    """
+    # Django must be set up before importing the library
+    from django_recaptcha_field import PooledVerificationTransport
+    from django_recaptcha_field import RecaptchaRequestVerifier
+    from django_recaptcha_field import create_form_subclass_with_recaptcha
+
+    recaptcha_client = RecaptchaClient('private key', 'public key')
+    form_class = create_form_subclass_with_recaptcha(
+        _RegistrationForm,
+        recaptcha_client,
+        )
+    request = _BenchmarkHttpRequest()
+    unbound_form = form_class(request)
+    recaptcha_field = unbound_form.fields['recaptcha']
+    recaptcha_widget = recaptcha_field.widget
+    recaptcha_value = recaptcha_widget.value_from_datadict(
+        _FORM_DATA,
+        {},
+        'recaptcha',
+        )
+
+    benchmark_results = {}
+
+    def benchmark(benchmark_name, function, iteration_count=iterations):
+        benchmark_results[benchmark_name] = \
+            _measure_function(function, iteration_count)
+
+    benchmark(
+        'form_class_creation',
+        lambda: create_form_subclass_with_recaptcha(
+            _RegistrationForm,
+            RecaptchaClient('private key', 'public key'),
+            ),
+        )
+    benchmark(
+        'form_class_reuse',
+        lambda: create_form_subclass_with_recaptcha(
+            _RegistrationForm,
+            recaptcha_client,
+            ),
+        )
+    benchmark('unbound_form_instantiation', lambda: form_class(request))
+    benchmark(
+        'bound_form_instantiation',
+        lambda: form_class(request, _FORM_DATA),
+        )
+    benchmark(
+        'widget_rendering',
+        lambda: recaptcha_widget.render(
+            'recaptcha',
+            unbound_form.recaptcha_state,
+            ),
+        )
+    benchmark(
+        'value_extraction',
+        lambda: recaptcha_widget.value_from_datadict(
+            _FORM_DATA,
+            {},
+            'recaptcha',
+            ),
+        )
+
+    verification_server = \
+        FakeVerificationServer(response_delay=verification_latency)
+    verification_server.start()
+    try:
+        verification_transport = PooledVerificationTransport(
+            verification_server.verification_url,
+            )
+        verification_transport.prewarm()
+        verifying_form_class = create_form_subclass_with_recaptcha(
+            _RegistrationForm,
+            recaptcha_client,
+            {'verification_transport': verification_transport},
+            )
+        verifying_field = verifying_form_class.base_fields['recaptcha']
+        request_verifier = RecaptchaRequestVerifier(
+            recaptcha_client,
+            verification_transport=verification_transport,
+            )
+
+        benchmark(
+            'field_verification',
+            lambda: verifying_field.verify(
+                recaptcha_value,
+                unbound_form.recaptcha_state,
+                ),
+            verification_iterations,
+            )
+        benchmark(
+            'form_validation',
+            lambda: verifying_form_class(request, _FORM_DATA).is_valid(),
+            verification_iterations,
+            )
+        # The same verification without a form, as made by API views
+        benchmark(
+            'request_verification',
+            lambda: request_verifier.verify_request(request, _FORM_DATA),
+            verification_iterations,
+            )
+    finally:
+        verification_server.stop()
+
+    results = {
+        'verification_latency': verification_latency,
+        'benchmarks': benchmark_results,
+        }
+    return results
+
+
+def _measure_function(function, iteration_count):
+    latencies = []
+    benchmark_start_time = time()
+    for _ in range(iteration_count):
+        call_start_time = time()
+        function()
+        latencies.append(time() - call_start_time)
+    benchmark_duration = time() - benchmark_start_time
+
+    measurement = get_latency_statistics(latencies)
+    measurement['iterations'] = iteration_count
+    measurement['throughput'] = iteration_count / benchmark_duration
+    return measurement
+
+
+def get_latency_statistics(latencies, prefix='latency'):
+    """
+    Return the mean, maximum and percentiles of ``latencies``.
+
+    :param latencies: The latencies in seconds
+    :type latencies: :class:`list`
+    :param prefix: The prefix of the names of the statistics
+    :type prefix: :class:`basestring`
+    :rtype: :class:`dict`
+
+    """
+    if not latencies:
+        return {}
+
+    sorted_latencies = sorted(latencies)
+    latency_count = len(sorted_latencies)
+    latency_statistics = {
+        prefix + '_mean': sum(sorted_latencies) / latency_count,
+        prefix + '_max': sorted_latencies[-1],
+        }
+    for percentile in _LATENCY_PERCENTILES:
+        percentile_index = \
+            min(latency_count - 1, int(latency_count * percentile / 100.0))
+        latency_statistics['{}_p{}'.format(prefix, percentile)] = \
+            sorted_latencies[percentile_index]
+    return latency_statistics
+
+
+def write_results(results, output_file_path=None):
+    """
+    Write ``results`` as JSON, along with the versions of the software used.
+
+    :param results: The results to be written
+    :type results: :class:`dict`
+    :param output_file_path: The file to write the results to, or ``None``
+        to write them to the standard output
+    :type output_file_path: :class:`basestring`
+
+    """
+    # Django must be set up before importing the library
+    from django import get_version as get_django_version
+
+    results = dict(
+        results,
+        timestamp=time(),
+        library_version=_get_library_version(),
+        python_version=python_version(),
+        django_version=get_django_version(),
+        )
+
+    if output_file_path:
+        with open(output_file_path, 'w') as output_file:
+            _write_json(results, output_file)
+    else:
+        _write_json(results, stdout)
+
+
+def _write_json(results, output_file):
+    json_dump(results, output_file, indent=4, sort_keys=True)
+    output_file.write('\n')
+
+
+def _get_library_version():
+    version_file_path = \
+        path.join(path.dirname(path.dirname(__file__)), 'VERSION.txt')
+    with open(version_file_path) as version_file:
+        library_version = version_file.readline().rstrip()
+    return library_version
+
+
+class _BenchmarkHttpRequest(HttpRequest):
+
+    def __init__(self):
+        super(_BenchmarkHttpRequest, self).__init__()
+
+        self.META['REMOTE_ADDR'] = RANDOM_REMOTE_IP
+
+
+class _RegistrationForm(Form):
+
+    full_name = CharField(max_length=255)
+
+    email_address = EmailField(max_length=255)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+"""
+Load test of reCAPTCHA-protected forms against a local stand-in for the
+reCAPTCHA API.
+
+Run it with::
+
+    python -m tests.load_test --rate=200 --duration=10 --workers=8 \
+        --latency=exponential:0.05 --error-rate=0.01 --output=results.json
+
+Submissions are made at a constant rate regardless of how long they take to
+be validated, so when the workers can't keep up, the backlog and the latency
+grow. The results report the throughput, the latency (including the time
+spent waiting for a worker), the time spent by the workers on each
+submission and the proportion of the time the workers were busy.
+
+"""
+
+from Queue import Queue
+from itertools import count
+from optparse import OptionParser
+from random import expovariate
+from random import uniform
+from threading import Lock
+from threading import Thread
+from time import sleep
+from time import time
+
+from django.forms.fields import CharField
+from django.forms.forms import Form
+from django.http import HttpRequest
+from recaptcha import RecaptchaClient
+
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+from tests import setup
+from tests.benchmarks import get_latency_statistics
+from tests.benchmarks import write_results
+from tests.verification_server import FakeVerificationServer
+
+
+__all__ = ['main', 'run_load_test']
+
+
+# Not a test module, despite its name
+__test__ = False
+
+
+_DEFAULT_SUBMISSION_RATE = 100
+_DEFAULT_DURATION = 10
+_DEFAULT_WORKER_COUNT = 4
+_DEFAULT_VERIFICATION_TIMEOUT = 5
+
+
+def main():
+    option_parser = OptionParser(description=__doc__.split('\n\n')[0])
+    option_parser.add_option(
+        '--rate',
+        type='float',
+        default=_DEFAULT_SUBMISSION_RATE,
+        help='Number of submissions per second',
+        )
+    option_parser.add_option(
+        '--duration',
+        type='float',
+        default=_DEFAULT_DURATION,
+        help='Seconds during which submissions are made',
+        )
+    option_parser.add_option(
+        '--workers',
+        type='int',
+        default=_DEFAULT_WORKER_COUNT,
+        help='Number of threads validating the submissions',
+        )
+    option_parser.add_option(
+        '--latency',
+        default='0',
+        help='Latency of the stand-in reCAPTCHA API in seconds, either '
+            'constant (e.g., "0.05") or drawn from a distribution: '
+            '"exponential:MEAN" or "uniform:MINIMUM:MAXIMUM"',
+        )
+    option_parser.add_option(
+        '--error-rate',
+        type='float',
+        default=0,
+        help='Proportion of verifications that fail with an HTTP error',
+        )
+    option_parser.add_option(
+        '--timeout-rate',
+        type='float',
+        default=0,
+        help='Proportion of verifications that time out',
+        )
+    option_parser.add_option(
+        '--invalid-challenge-rate',
+        type='float',
+        default=0,
+        help='Proportion of challenges reported as invalid',
+        )
+    option_parser.add_option(
+        '--verification-timeout',
+        type='float',
+        default=_DEFAULT_VERIFICATION_TIMEOUT,
+        help='Seconds after which verification requests time out',
+        )
+    option_parser.add_option(
+        '--output',
+        help='File to write the results to (standard output by default)',
+        )
+    options = option_parser.parse_args()[0]
+
+    try:
+        verification_latency = _parse_latency(options.latency)
+    except ValueError as exc:
+        option_parser.error(str(exc))
+
+    setup()
+    load_test_results = run_load_test(
+        options.rate,
+        options.duration,
+        options.workers,
+        verification_latency,
+        options.error_rate,
+        options.timeout_rate,
+        options.invalid_challenge_rate,
+        options.verification_timeout,
+        )
+    load_test_results['latency_distribution'] = options.latency
+    write_results(load_test_results, options.output)
+
+
+def run_load_test(
+    submission_rate=_DEFAULT_SUBMISSION_RATE,
+    duration=_DEFAULT_DURATION,
+    worker_count=_DEFAULT_WORKER_COUNT,
+    verification_latency=0,
+    error_rate=0,
+    timeout_rate=0,
+    invalid_challenge_rate=0,
+    verification_timeout=_DEFAULT_VERIFICATION_TIMEOUT,
+    ):
+    """
+    Submit reCAPTCHA-protected forms at ``submission_rate`` per second for
+    ``duration`` seconds and return the results.
+
+    The stand-in reCAPTCHA API is set up with ``verification_latency``,
+    ``error_rate``, ``timeout_rate`` and ``invalid_challenge_rate``, as in
+    :class:`~tests.verification_server.FakeVerificationServer`.
+
+    :rtype: :class:`dict`
+
+    """
+    # Django must be set up before importing the library
+    from django_recaptcha_field import PooledVerificationTransport
+    from django_recaptcha_field import create_form_subclass_with_recaptcha
+
+    verification_server = FakeVerificationServer(
+        response_delay=verification_latency,
+        error_rate=error_rate,
+        timeout_rate=timeout_rate,
+        timeout_duration=verification_timeout * 2,
+        invalid_challenge_rate=invalid_challenge_rate,
+        )
+    verification_server.start()
+    try:
+        verification_transport = PooledVerificationTransport(
+            verification_server.verification_url,
+            pool_size=worker_count,
+            timeout=verification_timeout,
+            )
+        verification_transport.prewarm()
+        form_class = create_form_subclass_with_recaptcha(
+            _CommentForm,
+            RecaptchaClient('private key', 'public key'),
+            {
+                'verification_transport': verification_transport,
+                'unavailability_policy': 'reject',
+                },
+            )
+
+        load_test = _LoadTest(form_class, submission_rate, worker_count)
+        load_test_results = load_test.run(duration)
+    finally:
+        verification_server.stop()
+
+    load_test_results.update({
+        'submission_rate': submission_rate,
+        'duration': duration,
+        'worker_count': worker_count,
+        'error_rate': error_rate,
+        'timeout_rate': timeout_rate,
+        'invalid_challenge_rate': invalid_challenge_rate,
+        'verification_timeout': verification_timeout,
+        })
+    return load_test_results
+
+
+class _LoadTest(object):
+
+    def __init__(self, form_class, submission_rate, worker_count):
+        super(_LoadTest, self).__init__()
+
+        self._form_class = form_class
+        self._submission_rate = submission_rate
+        self._worker_count = worker_count
+
+        self._submissions = Queue()
+        self._maximum_backlog = 0
+
+        self._results_lock = Lock()
+        self._latencies = []
+        self._service_times = []
+        self._outcome_counts = {}
+
+    def run(self, duration):
+        workers = []
+        for _ in range(self._worker_count):
+            worker = Thread(target=self._process_submissions)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        start_time = time()
+        submission_count = self._make_submissions(start_time, duration)
+        for _ in workers:
+            self._submissions.put(None)
+        for worker in workers:
+            worker.join()
+        elapsed_time = time() - start_time
+
+        busy_time = sum(self._service_times)
+        load_test_results = {
+            'submission_count': submission_count,
+            'throughput': len(self._latencies) / elapsed_time,
+            'elapsed_time': elapsed_time,
+            'worker_saturation':
+                busy_time / (self._worker_count * elapsed_time),
+            'maximum_backlog': self._maximum_backlog,
+            'outcomes': self._outcome_counts,
+            }
+        load_test_results.update(get_latency_statistics(self._latencies))
+        load_test_results.update(
+            get_latency_statistics(self._service_times, 'service_time'),
+            )
+        return load_test_results
+
+    def _make_submissions(self, start_time, duration):
+        submission_interval = 1.0 / self._submission_rate
+        for submission_index in count():
+            scheduled_time = start_time + submission_index * submission_interval
+            if duration <= (scheduled_time - start_time):
+                break
+
+            delay = scheduled_time - time()
+            if 0 < delay:
+                sleep(delay)
+
+            self._submissions.put((submission_index, scheduled_time))
+            self._maximum_backlog = \
+                max(self._maximum_backlog, self._submissions.qsize())
+
+        return submission_index
+
+    def _process_submissions(self):
+        request = _LoadTestHttpRequest()
+        while True:
+            submission = self._submissions.get()
+            if submission is None:
+                break
+
+            submission_index, scheduled_time = submission
+            service_start_time = time()
+            outcome = self._validate_submission(request, submission_index)
+            service_end_time = time()
+
+            with self._results_lock:
+                self._latencies.append(service_end_time - scheduled_time)
+                self._service_times.append(
+                    service_end_time - service_start_time,
+                    )
+                self._outcome_counts[outcome] = \
+                    self._outcome_counts.get(outcome, 0) + 1
+
+    def _validate_submission(self, request, submission_index):
+        form_data = {
+            'comment': 'Comment #{}'.format(submission_index),
+            'recaptcha_response_field': RANDOM_SOLUTION_TEXT,
+            'recaptcha_challenge_field':
+                '{}-{}'.format(RANDOM_CHALLENGE_ID, submission_index),
+            }
+        form = self._form_class(request, form_data)
+        try:
+            is_form_valid = form.is_valid()
+        except Exception as exc:
+            outcome = 'exception:{}'.format(exc.__class__.__name__)
+        else:
+            if is_form_valid:
+                outcome = 'valid'
+            else:
+                outcome = 'invalid'
+        return outcome
+
+
+def _parse_latency(latency_specification):
+    latency_specification_parts = latency_specification.split(':')
+    distribution_name = latency_specification_parts[0]
+    try:
+        distribution_parameters = \
+            [float(p) for p in latency_specification_parts[1:]]
+        if len(latency_specification_parts) == 1:
+            latency = float(latency_specification)
+        elif distribution_name == 'exponential':
+            mean_latency, = distribution_parameters
+            latency = lambda: expovariate(1 / mean_latency)
+        elif distribution_name == 'uniform':
+            minimum_latency, maximum_latency = distribution_parameters
+            latency = lambda: uniform(minimum_latency, maximum_latency)
+        else:
+            raise ValueError()
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(
+            'Invalid latency: {!r}'.format(latency_specification),
+            )
+    return latency
+
+
+class _LoadTestHttpRequest(HttpRequest):
+
+    def __init__(self):
+        super(_LoadTestHttpRequest, self).__init__()
+
+        self.META['REMOTE_ADDR'] = RANDOM_REMOTE_IP
+
+
+class _CommentForm(Form):
+
+    comment = CharField()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from threading import Lock
+from time import sleep
+
+from nose.tools import assert_false
+from nose.tools import assert_is_none
+from nose.tools import assert_is_instance
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import verify_solutions
+
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+
+
+__all__ = ['TestBatchVerification']
+
+
+_CORRECT_SOLUTION_TEXT = 'correct'
+_INCORRECT_SOLUTION_TEXT = 'incorrect'
+
+
+_RANDOM_SUBMISSION = (
+    RANDOM_CHALLENGE_ID,
+    RANDOM_SOLUTION_TEXT,
+    RANDOM_REMOTE_IP,
+    )
+
+
+class TestBatchVerification(object):
+
+    def test_no_submissions(self):
+        client = _ConcurrencyTrackingVerificationClient()
+
+        verification_results = list(verify_solutions(client, []))
+
+        eq_([], verification_results)
+
+    def test_outcomes(self):
+        client = _ConcurrencyTrackingVerificationClient()
+        submissions = [
+            ('challenge1', _CORRECT_SOLUTION_TEXT, RANDOM_REMOTE_IP),
+            ('challenge2', _INCORRECT_SOLUTION_TEXT, RANDOM_REMOTE_IP),
+            ]
+
+        verification_results = _get_verification_results_by_challenge_id(
+            verify_solutions(client, submissions),
+            )
+
+        eq_(2, len(verification_results))
+        ok_(verification_results['challenge1'].is_solution_correct)
+        assert_false(verification_results['challenge2'].is_solution_correct)
+        assert_false(verification_results['challenge2'].is_challenge_invalid)
+
+    def test_submission(self):
+        client = _ConcurrencyTrackingVerificationClient()
+        verification_result, = verify_solutions(client, [_RANDOM_SUBMISSION])
+
+        eq_(RANDOM_CHALLENGE_ID, verification_result.challenge_id)
+        eq_(RANDOM_SOLUTION_TEXT, verification_result.solution_text)
+        eq_(RANDOM_REMOTE_IP, verification_result.remote_ip)
+        eq_([_RANDOM_SUBMISSION], client.submissions)
+
+    def test_invalid_challenge_id(self):
+        client = _ConcurrencyTrackingVerificationClient(
+            RecaptchaInvalidChallengeError,
+            )
+        verification_result, = verify_solutions(client, [_RANDOM_SUBMISSION])
+
+        ok_(verification_result.is_challenge_invalid)
+        assert_false(verification_result.is_solution_correct)
+        assert_is_none(verification_result.error)
+
+    def test_remote_api_unreachable(self):
+        """Errors are reported in the results instead of being raised."""
+        client = _ConcurrencyTrackingVerificationClient(
+            RecaptchaUnreachableError,
+            )
+        verification_result, = verify_solutions(client, [_RANDOM_SUBMISSION])
+
+        assert_is_instance(verification_result.error, RecaptchaUnreachableError)
+        assert_false(verification_result.is_solution_correct)
+        assert_false(verification_result.is_challenge_invalid)
+
+    def test_bounded_concurrency(self):
+        client = _ConcurrencyTrackingVerificationClient(verification_delay=0.01)
+        submissions = [
+            ('challenge{}'.format(index), _CORRECT_SOLUTION_TEXT, None)
+            for index in range(12)
+            ]
+
+        verification_results = list(
+            verify_solutions(client, submissions, max_concurrency=3),
+            )
+
+        eq_(12, len(verification_results))
+        eq_(3, client.max_concurrent_verifications)
+
+    def test_malformed_submission(self):
+        """Malformed submissions are reported without stopping the others."""
+        client = _ConcurrencyTrackingVerificationClient()
+        submissions = [
+            ('challenge1', _CORRECT_SOLUTION_TEXT, RANDOM_REMOTE_IP),
+            ('challenge2', ),
+            ('challenge3', _CORRECT_SOLUTION_TEXT, RANDOM_REMOTE_IP),
+            ('challenge4', _CORRECT_SOLUTION_TEXT, RANDOM_REMOTE_IP),
+            ]
+
+        verification_results = _get_verification_results_by_challenge_id(
+            verify_solutions(client, submissions, max_concurrency=1),
+            )
+
+        eq_(4, len(verification_results))
+        assert_is_instance(verification_results[None].error, ValueError)
+        assert_false(verification_results[None].is_solution_correct)
+        ok_(verification_results['challenge4'].is_solution_correct)
+
+    def test_unexpected_verification_error(self):
+        client = _ConcurrencyTrackingVerificationClient(RuntimeError)
+        verification_result, = verify_solutions(client, [_RANDOM_SUBMISSION])
+
+        assert_is_instance(verification_result.error, RuntimeError)
+        eq_(RANDOM_CHALLENGE_ID, verification_result.challenge_id)
+
+    def test_failing_submissions(self):
+        """Errors getting the submissions are passed on."""
+        client = _ConcurrencyTrackingVerificationClient()
+
+        def get_submissions():
+            yield _RANDOM_SUBMISSION
+            raise IOError('Connection to the database lost')
+
+        verification_results = []
+        with assert_raises(IOError):
+            for verification_result in verify_solutions(
+                client,
+                get_submissions(),
+                max_concurrency=2,
+                ):
+                verification_results.append(verification_result)
+
+        eq_(1, len(verification_results))
+
+    def test_no_concurrency(self):
+        client = _ConcurrencyTrackingVerificationClient()
+
+        with assert_raises(ValueError):
+            verify_solutions(client, [_RANDOM_SUBMISSION], max_concurrency=0)
+
+
+#{ Utilities
+
+
+def _get_verification_results_by_challenge_id(verification_results):
+    verification_results_by_challenge_id = dict(
+        (verification_result.challenge_id, verification_result)
+        for verification_result in verification_results
+        )
+    return verification_results_by_challenge_id
+
+
+#{ Stubs
+
+
+class _ConcurrencyTrackingVerificationClient(object):
+
+    def __init__(self, exception=None, verification_delay=0):
+        super(_ConcurrencyTrackingVerificationClient, self).__init__()
+
+        self.exception = exception
+        self.verification_delay = verification_delay
+
+        self.submissions = []
+        self.max_concurrent_verifications = 0
+
+        self._concurrent_verifications = 0
+        self._lock = Lock()
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        with self._lock:
+            self.submissions.append((challenge_id, solution_text, remote_ip))
+            self._concurrent_verifications += 1
+            self.max_concurrent_verifications = max(
+                self.max_concurrent_verifications,
+                self._concurrent_verifications,
+                )
+
+        sleep(self.verification_delay)
+
+        with self._lock:
+            self._concurrent_verifications -= 1
+
+        if self.exception:
+            raise self.exception()
+
+        return solution_text == _CORRECT_SOLUTION_TEXT
+
+
+#}
@@ -0,0 +1,189 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from time import sleep
+
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import RecaptchaCircuitBreaker
+from django_recaptcha_field import RecaptchaCircuitOpenError
+
+
+__all__ = [
+    'TestCircuitClosing',
+    'TestCircuitOpening',
+    ]
+
+
+class TestCircuitOpening(object):
+
+    def test_successful_calls(self):
+        circuit_breaker = _create_circuit_breaker()
+
+        for _ in range(4):
+            eq_(True, circuit_breaker.call(_succeed))
+
+        assert_false(circuit_breaker.is_open)
+
+    def test_failure_rate_below_threshold(self):
+        circuit_breaker = _create_circuit_breaker()
+
+        _call_repeatedly(circuit_breaker, _succeed, 3)
+        _call_repeatedly(circuit_breaker, _fail, 1)
+
+        assert_false(circuit_breaker.is_open)
+
+    def test_failure_rate_reaching_threshold(self):
+        circuit_breaker = _create_circuit_breaker()
+
+        _call_repeatedly(circuit_breaker, _succeed, 2)
+        _call_repeatedly(circuit_breaker, _fail, 2)
+
+        ok_(circuit_breaker.is_open)
+        with assert_raises(RecaptchaCircuitOpenError):
+            circuit_breaker.call(_succeed)
+
+    def test_minimum_call_count(self):
+        """The circuit isn't opened until there are enough recent calls."""
+        circuit_breaker = _create_circuit_breaker()
+
+        _call_repeatedly(circuit_breaker, _fail, 3)
+        assert_false(circuit_breaker.is_open)
+
+        _call_repeatedly(circuit_breaker, _fail, 1)
+        ok_(circuit_breaker.is_open)
+
+    def test_old_calls(self):
+        """Calls outside of the window aren't taken into account."""
+        circuit_breaker = _create_circuit_breaker()
+
+        _call_repeatedly(circuit_breaker, _fail, 1)
+        _call_repeatedly(circuit_breaker, _succeed, 4)
+        _call_repeatedly(circuit_breaker, _fail, 1)
+
+        assert_false(circuit_breaker.is_open)
+
+    def test_slow_calls(self):
+        circuit_breaker = _create_circuit_breaker(slow_call_duration=0)
+
+        _call_repeatedly(circuit_breaker, _succeed, 4)
+
+        ok_(circuit_breaker.is_open)
+
+    def test_other_recaptcha_errors(self):
+        """Errors other than failures to reach reCAPTCHA aren't failures."""
+        circuit_breaker = _create_circuit_breaker()
+
+        _call_repeatedly(
+            circuit_breaker,
+            _raise_invalid_challenge_error,
+            4,
+            RecaptchaInvalidChallengeError,
+            )
+
+        assert_false(circuit_breaker.is_open)
+
+
+class TestCircuitClosing(object):
+
+    def test_open_duration(self):
+        circuit_breaker = _create_open_circuit_breaker(open_duration=60)
+
+        with assert_raises(RecaptchaCircuitOpenError):
+            circuit_breaker.call(_succeed)
+
+    def test_successful_probe(self):
+        circuit_breaker = _create_open_circuit_breaker()
+
+        circuit_breaker.call(_succeed)
+
+        assert_false(circuit_breaker.is_open)
+        _call_repeatedly(circuit_breaker, _fail, 3)
+        assert_false(circuit_breaker.is_open)
+
+    def test_failed_probe(self):
+        circuit_breaker = _create_open_circuit_breaker(open_duration=0.05)
+        sleep(0.05)
+
+        with assert_raises(RecaptchaUnreachableError):
+            circuit_breaker.call(_fail)
+
+        ok_(circuit_breaker.is_open)
+        with assert_raises(RecaptchaCircuitOpenError):
+            circuit_breaker.call(_succeed)
+
+    def test_concurrent_probes(self):
+        """Only one call is let through while probing reCAPTCHA."""
+        circuit_breaker = _create_open_circuit_breaker()
+
+        def probe():
+            with assert_raises(RecaptchaCircuitOpenError):
+                circuit_breaker.call(_succeed)
+
+        circuit_breaker.call(probe)
+
+
+#{ Utilities
+
+
+def _create_circuit_breaker(**kwargs):
+    circuit_breaker = RecaptchaCircuitBreaker(
+        failure_rate_threshold=0.5,
+        window_size=4,
+        minimum_call_count=4,
+        **kwargs
+        )
+    return circuit_breaker
+
+
+def _create_open_circuit_breaker(open_duration=0):
+    circuit_breaker = _create_circuit_breaker(open_duration=open_duration)
+    _call_repeatedly(circuit_breaker, _fail, 4)
+    return circuit_breaker
+
+
+def _call_repeatedly(
+    circuit_breaker,
+    function,
+    call_count,
+    expected_exception=RecaptchaUnreachableError,
+    ):
+    for _ in range(call_count):
+        try:
+            circuit_breaker.call(function)
+        except expected_exception:
+            pass
+
+
+def _succeed():
+    return True
+
+
+def _fail():
+    raise RecaptchaUnreachableError()
+
+
+def _raise_invalid_challenge_error():
+    raise RecaptchaInvalidChallengeError()
+
+
+#}
@@ -0,0 +1,124 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from django.http import HttpRequest
+from nose.tools import assert_not_equal
+from nose.tools import eq_
+from recaptcha import RecaptchaClient
+
+from django_recaptcha_field import RecaptchaClientRegistry
+
+
+__all__ = [
+    'TestClientRegistry',
+    ]
+
+
+class TestClientRegistry(object):
+
+    def setup(self):
+        self.client_factory = _CountingClientFactory()
+
+    def test_client_creation(self):
+        registry = RecaptchaClientRegistry(self.client_factory)
+
+        recaptcha_client = registry.get_client(_make_request('example.com'))
+
+        eq_('example.com', recaptcha_client.public_key)
+        eq_(['example.com'], self.client_factory.tenants)
+
+    def test_client_reuse(self):
+        registry = RecaptchaClientRegistry(self.client_factory)
+
+        recaptcha_client = registry.get_client(_make_request('example.com'))
+
+        eq_(recaptcha_client, registry.get_client(_make_request('example.com')))
+        eq_(1, len(self.client_factory.tenants))
+
+    def test_different_tenants(self):
+        registry = RecaptchaClientRegistry(self.client_factory)
+
+        assert_not_equal(
+            registry.get_client(_make_request('example.com')),
+            registry.get_client(_make_request('example.org')),
+            )
+
+    def test_host_name_normalization(self):
+        """The port and the case of the host don't make a different tenant."""
+        registry = RecaptchaClientRegistry(self.client_factory)
+
+        registry.get_client(_make_request('example.com'))
+        registry.get_client(_make_request('Example.COM:8000'))
+
+        eq_(['example.com'], self.client_factory.tenants)
+
+    def test_tenant_resolver(self):
+        registry = RecaptchaClientRegistry(
+            self.client_factory,
+            lambda request: request.META['HTTP_X_TENANT'],
+            )
+        request = _make_request('example.com')
+        request.META['HTTP_X_TENANT'] = 'acme'
+
+        recaptcha_client = registry.get_client(request)
+
+        eq_('acme', recaptcha_client.public_key)
+
+    def test_eviction(self):
+        """The least recently used client is discarded first."""
+        registry = RecaptchaClientRegistry(self.client_factory, max_size=2)
+
+        registry.get_client(_make_request('a.example.com'))
+        registry.get_client(_make_request('b.example.com'))
+        registry.get_client(_make_request('a.example.com'))
+        registry.get_client(_make_request('c.example.com'))
+        registry.get_client(_make_request('a.example.com'))
+        registry.get_client(_make_request('b.example.com'))
+
+        eq_(
+            [
+                'a.example.com',
+                'b.example.com',
+                'c.example.com',
+                'b.example.com',
+                ],
+            self.client_factory.tenants,
+            )
+
+
+#{ Stubs
+
+
+class _CountingClientFactory(object):
+
+    def __init__(self):
+        super(_CountingClientFactory, self).__init__()
+
+        self.tenants = []
+
+    def __call__(self, tenant):
+        self.tenants.append(tenant)
+        return RecaptchaClient('private key', tenant)
+
+
+def _make_request(host):
+    request = HttpRequest()
+    request.META['HTTP_HOST'] = host
+    return request
+
+
+#}
@@ -17,6 +17,11 @@
 
 import codecs
 
+from copy import deepcopy
+from threading import Event
+from threading import Thread
+from threading import Timer
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.encoding import force_unicode
@@ -32,17 +37,32 @@ from recaptcha import RecaptchaInvalidChallengeError
 from recaptcha import RecaptchaInvalidPrivateKeyError
 from recaptcha import RecaptchaUnreachableError
 
+from django_recaptcha_field import RecaptchaCircuitBreaker
+from django_recaptcha_field import RecaptchaCircuitOpenError
+from django_recaptcha_field import RecaptchaRateLimiter
+from django_recaptcha_field import RecaptchaReplayGuard
 from django_recaptcha_field import _RecaptchaField as RecaptchaField
+from django_recaptcha_field import _RecaptchaFormState as RecaptchaFormState
+from django_recaptcha_field import _VERIFICATION_LEASE_KEY_PREFIX
+from django_recaptcha_field import _get_verification_cache_key
 
 from tests import FAKE_RECAPTCHA_CLIENT
 from tests import RANDOM_CHALLENGE_ID
 from tests import RANDOM_REMOTE_IP
 from tests import RANDOM_SOLUTION_TEXT
+from tests import create_local_memory_cache
 
 
 __all__ = [
     'TestFieldValidation',
-    'TestWidgetInitialization',
+    'TestPassTokens',
+    'TestPreValidation',
+    'TestRateLimiting',
+    'TestReplayProtection',
+    'TestSpeculativeVerification',
+    'TestUnavailability',
+    'TestFieldSharing',
+    'TestVerificationCaching',
     ]
 
 
@@ -55,37 +75,43 @@ _RANDOM_RECAPTCHA_FIELD_VALUE = {
     }
 
 
+def test_malformed_allowed_network():
+    with assert_raises(ValueError):
+        RecaptchaField(FAKE_RECAPTCHA_CLIENT, allowed_networks=['192.0.2'])
+
+
 def test_field_requireness():
     """The reCAPTCHA field is required in the form."""
-    field = RecaptchaField(FAKE_RECAPTCHA_CLIENT, RANDOM_REMOTE_IP)
+    field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
 
     ok_(field.required)
 
 
-class TestWidgetInitialization(object):
+class TestFieldSharing(object):
 
     def test_recaptcha_client(self):
-        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT, RANDOM_REMOTE_IP)
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
 
         eq_(FAKE_RECAPTCHA_CLIENT, field.widget.recaptcha_client)
 
-    def test_challenge_not_over_ssl(self):
-        field = RecaptchaField(
-            FAKE_RECAPTCHA_CLIENT,
-            RANDOM_REMOTE_IP,
-            transmit_challenge_over_ssl=False,
-            )
+    def test_field_copy(self):
+        """Form instances share the field of their class."""
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
 
-        assert_false(field.widget.transmit_challenge_over_ssl)
+        ok_(field is deepcopy(field))
 
-    def test_challenge_over_ssl(self):
-        field = RecaptchaField(
-            FAKE_RECAPTCHA_CLIENT,
-            RANDOM_REMOTE_IP,
-            transmit_challenge_over_ssl=True,
-            )
+    def test_widget_copy(self):
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
+
+        ok_(field.widget is deepcopy(field.widget))
+
+    def test_rendering_state(self):
+        """The state of the form is what the widget renders."""
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
 
-        ok_(field.widget.transmit_challenge_over_ssl)
+        bound_data = field.bound_data(_RANDOM_RECAPTCHA_FIELD_VALUE, form_state)
+        eq_(form_state, bound_data)
 
 
 class TestFieldValueConversion(object):
@@ -95,7 +121,8 @@ class TestFieldValueConversion(object):
     def setup(self):
         self.recaptcha_client = \
             _OfflineVerificationClient(is_solution_correct=True)
-        self.field = RecaptchaField(self.recaptcha_client, RANDOM_REMOTE_IP)
+        self.field = RecaptchaField(self.recaptcha_client)
+        self.form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
 
     def teardown(self):
         settings.DEFAULT_CHARSET = 'UTF-8'
@@ -119,7 +146,7 @@ class TestFieldValueConversion(object):
             'challenge_id': random_string_unsupported,
             }
 
-        self.field.validate(field_value)
+        self.field.verify(field_value, self.form_state)
         eq_(random_string_unicode, self.recaptcha_client.solution_text)
         eq_(random_string_unicode, self.recaptcha_client.challenge_id)
 
@@ -134,7 +161,7 @@ class TestFieldValueConversion(object):
             'challenge_id': random_unicode_byte_string,
             }
 
-        self.field.validate(field_value)
+        self.field.verify(field_value, self.form_state)
         eq_(random_unicode_string, self.recaptcha_client.solution_text)
         eq_(random_unicode_string, self.recaptcha_client.challenge_id)
 
@@ -149,7 +176,7 @@ class TestFieldValueConversion(object):
             }
 
         solution_unicode_string = _UNICODE_REPLACEMENT_CHARACTER
-        self.field.validate(field_value)
+        self.field.verify(field_value, self.form_state)
         eq_(solution_unicode_string, self.recaptcha_client.solution_text)
         eq_(solution_unicode_string, self.recaptcha_client.challenge_id)
 
@@ -160,7 +187,15 @@ class TestFieldValueConversion(object):
             'challenge_id': random_string_unicode,
             }
 
-        assert_is_none(self.field.validate(field_value))
+        assert_is_none(self.field.verify(field_value, self.form_state))
+
+    def test_ascii_byte_string(self):
+        settings.DEFAULT_CHARSET = 'Latin-1'
+
+        self.field.verify(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+
+        ok_(isinstance(self.recaptcha_client.solution_text, unicode))
+        eq_(RANDOM_SOLUTION_TEXT, self.recaptcha_client.solution_text)
 
     def test_ascii_value(self):
         eq_(
@@ -237,9 +272,9 @@ class TestFieldValidation(object):
 
     def test_correct_solution(self):
         client = _OfflineVerificationClient(is_solution_correct=True)
-        field = RecaptchaField(client, RANDOM_REMOTE_IP)
+        field = RecaptchaField(client)
 
-        field.validate(_RANDOM_RECAPTCHA_FIELD_VALUE)
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
 
     #{ Utilities
 
@@ -247,27 +282,573 @@ class TestFieldValidation(object):
         client = _ExceptionRaisingVerificationClient(
             exception,
             )
-        field = RecaptchaField(client, RANDOM_REMOTE_IP)
+        field = RecaptchaField(client)
 
         with assert_raises(exception):
-            field.validate(_RANDOM_RECAPTCHA_FIELD_VALUE)
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
 
     def _assert_validation_error_raised(self, field_value, client, error_code):
-        field = RecaptchaField(client, RANDOM_REMOTE_IP)
+        field = RecaptchaField(client)
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
 
         expected_error_message = force_unicode(field.error_messages[error_code])
         with assert_raises_regexp(ValidationError, expected_error_message):
-            field.validate(field_value)
+            _clean_field(field, field_value, form_state)
 
         should_mark_solution_as_incorrect = error_code == 'incorrect_solution'
         eq_(
             should_mark_solution_as_incorrect,
-            field.widget.was_previous_solution_incorrect,
+            form_state.was_previous_solution_incorrect,
+            )
+
+    #}
+
+
+class TestPreValidation(object):
+
+    def test_long_solution(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, max_solution_length=5)
+
+        self._assert_value_rejected(
+            field,
+            {'solution_text': 'a' * 6, 'challenge_id': RANDOM_CHALLENGE_ID},
+            )
+        eq_(0, client.communication_attempts)
+
+    def test_long_challenge_id(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, max_challenge_id_length=5)
+
+        self._assert_value_rejected(
+            field,
+            {'solution_text': RANDOM_SOLUTION_TEXT, 'challenge_id': 'a' * 6},
+            )
+        eq_(0, client.communication_attempts)
+
+    def test_long_score_token(self):
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT, max_score_token_length=5)
+
+        self._assert_value_rejected(field, {'score_token': 'a' * 6})
+
+    def test_maximum_lengths(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(
+            client,
+            max_solution_length=len(RANDOM_SOLUTION_TEXT),
+            max_challenge_id_length=len(RANDOM_CHALLENGE_ID),
+            )
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+    def test_malformed_challenge_id(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, challenge_id_pattern=r'[a-z]+')
+
+        self._assert_value_rejected(
+            field,
+            {'solution_text': RANDOM_SOLUTION_TEXT, 'challenge_id': 'abc!'},
+            )
+        eq_(0, client.communication_attempts)
+
+    def test_well_formed_challenge_id(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, challenge_id_pattern=r'[a-z]+')
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+    def test_speculative_verification(self):
+        """Junk isn't verified speculatively either."""
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(
+            client,
+            max_solution_length=5,
+            verify_speculatively=True,
+            )
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+        field.start_verification(
+            {'solution_text': 'a' * 6, 'challenge_id': RANDOM_CHALLENGE_ID},
+            form_state,
+            )
+
+        assert_is_none(form_state.pending_verification)
+
+    #{ Utilities
+
+    def _assert_value_rejected(self, field, field_value):
+        expected_error_message = force_unicode(field.error_messages['invalid'])
+        with assert_raises_regexp(ValidationError, expected_error_message):
+            field.clean(field_value)
+
+    #}
+
+
+class TestSpeculativeVerification(object):
+
+    def setup(self):
+        self.form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+    def test_verification_start(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, verify_speculatively=True)
+
+        field.start_verification(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+        self._wait_for_pending_verification()
+
+        eq_(1, client.communication_attempts)
+
+    def test_verification(self):
+        """Verification uses the outcome of the speculative verification."""
+        client = _OfflineVerificationClient(is_solution_correct=False)
+        field = RecaptchaField(client, verify_speculatively=True)
+
+        field.start_verification(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+        with assert_raises(ValidationError):
+            field.verify(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+
+        eq_(1, client.communication_attempts)
+        ok_(self.form_state.was_previous_solution_incorrect)
+
+    def test_different_value(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, verify_speculatively=True)
+
+        field.start_verification(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+        field.verify(
+            {'solution_text': 'foo', 'challenge_id': 'bar'},
+            self.form_state,
+            )
+
+        self._wait_for_pending_verification()
+        eq_(2, client.communication_attempts)
+
+    def test_remote_api_unreachable(self):
+        client = _ExceptionRaisingVerificationClient(RecaptchaUnreachableError)
+        field = RecaptchaField(client, verify_speculatively=True)
+
+        field.start_verification(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+        with assert_raises(RecaptchaUnreachableError):
+            field.verify(_RANDOM_RECAPTCHA_FIELD_VALUE, self.form_state)
+
+        eq_(1, client.communication_attempts)
+
+    #{ Utilities
+
+    def _wait_for_pending_verification(self):
+        background_verification = self.form_state.pending_verification[1]
+        background_verification.get_result()
+
+    #}
+
+
+class TestUnavailability(object):
+
+    def test_unknown_policy(self):
+        with assert_raises(ValueError):
+            RecaptchaField(
+                FAKE_RECAPTCHA_CLIENT,
+                unavailability_policy='ignore',
+                )
+
+    def test_no_policy(self):
+        """Failures to reach reCAPTCHA propagate by default."""
+        field = self._create_field(None)
+
+        with assert_raises(RecaptchaUnreachableError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+    def test_rejection_policy(self):
+        field = self._create_field('reject')
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+        expected_error_message = \
+            force_unicode(field.error_messages['unavailable'])
+        with assert_raises_regexp(ValidationError, expected_error_message):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE, form_state)
+
+        assert_false(form_state.was_verification_skipped)
+        assert_false(form_state.was_previous_solution_incorrect)
+
+    def test_acceptance_policy(self):
+        field = self._create_field('accept')
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE, form_state)
+
+        ok_(form_state.was_verification_skipped)
+
+    def test_open_circuit(self):
+        """reCAPTCHA isn't contacted while the circuit is open."""
+        client = _ExceptionRaisingVerificationClient(RecaptchaUnreachableError)
+        circuit_breaker = RecaptchaCircuitBreaker(
+            window_size=1,
+            minimum_call_count=1,
+            )
+        field = RecaptchaField(client, circuit_breaker=circuit_breaker)
+
+        with assert_raises(RecaptchaUnreachableError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+        with assert_raises(RecaptchaCircuitOpenError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        eq_(1, client.communication_attempts)
+
+    #{ Utilities
+
+    def _create_field(self, unavailability_policy):
+        client = _ExceptionRaisingVerificationClient(RecaptchaUnreachableError)
+        field = RecaptchaField(
+            client,
+            unavailability_policy=unavailability_policy,
+            )
+        return field
+
+    #}
+
+
+class TestPassTokens(object):
+
+    def setup(self):
+        self.field = RecaptchaField(
+            FAKE_RECAPTCHA_CLIENT,
+            pass_token_timeout=60,
+            )
+
+    def test_valid_token(self):
+        pass_token = self.field.create_pass_token(RANDOM_REMOTE_IP)
+
+        ok_(self.field.is_pass_token_valid(pass_token, RANDOM_REMOTE_IP))
+
+    def test_different_ip(self):
+        pass_token = self.field.create_pass_token(RANDOM_REMOTE_IP)
+
+        assert_false(self.field.is_pass_token_valid(pass_token, '192.0.2.1'))
+
+    def test_expired_token(self):
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT, pass_token_timeout=-1)
+        pass_token = field.create_pass_token(RANDOM_REMOTE_IP)
+
+        assert_false(field.is_pass_token_valid(pass_token, RANDOM_REMOTE_IP))
+
+    def test_tampered_issue_time(self):
+        pass_token = self.field.create_pass_token(RANDOM_REMOTE_IP)
+        issue_time, signature = pass_token.split(':')
+        tampered_pass_token = '{}:{}'.format(int(issue_time) + 30, signature)
+
+        assert_false(
+            self.field.is_pass_token_valid(
+                tampered_pass_token,
+                RANDOM_REMOTE_IP,
+                ),
+            )
+
+    def test_malformed_token(self):
+        for pass_token in ('', 'abc', 'abc:def', 1):
+            assert_false(
+                self.field.is_pass_token_valid(pass_token, RANDOM_REMOTE_IP),
+                )
+
+
+class TestRateLimiting(object):
+
+    def test_verifications_within_limit(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = self._create_field(client, capacity=2)
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        eq_(2, client.communication_attempts)
+
+    def test_verifications_exceeding_limit(self):
+        """reCAPTCHA isn't contacted once the limit is exceeded."""
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = self._create_field(client, capacity=1)
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        expected_error_message = \
+            force_unicode(field.error_messages['rate_limited'])
+        with assert_raises_regexp(ValidationError, expected_error_message):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE, form_state)
+
+        eq_(1, client.communication_attempts)
+        assert_false(form_state.was_previous_solution_incorrect)
+
+    def test_different_ips(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = self._create_field(client, capacity=1)
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+        _clean_field(
+            field,
+            _RANDOM_RECAPTCHA_FIELD_VALUE,
+            RecaptchaFormState('192.0.2.1'),
+            )
+
+        eq_(2, client.communication_attempts)
+
+    def test_cached_verification(self):
+        """Verifications whose outcome was cached don't take a token."""
+        verification_cache = \
+            create_local_memory_cache('recaptcha-verifications')
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = self._create_field(
+            client,
+            capacity=1,
+            verification_cache=verification_cache,
             )
 
+        try:
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+        finally:
+            verification_cache.clear()
+
+        eq_(1, client.communication_attempts)
+
+    #{ Utilities
+
+    def _create_field(self, client, capacity, **field_kwargs):
+        rate_limiter = RecaptchaRateLimiter(0.001, capacity)
+        field = RecaptchaField(client, rate_limiter=rate_limiter, **field_kwargs)
+        return field
+
     #}
 
 
+class TestReplayProtection(object):
+
+    def test_replayed_challenge(self):
+        """reCAPTCHA isn't contacted for challenges that have been used."""
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, replay_guard=RecaptchaReplayGuard())
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        expected_error_message = force_unicode(field.error_messages['invalid'])
+        with assert_raises_regexp(ValidationError, expected_error_message):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        eq_(1, client.communication_attempts)
+
+    def test_different_challenges(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        field = RecaptchaField(client, replay_guard=RecaptchaReplayGuard())
+
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+        _clean_field(field, {'solution_text': 'foo', 'challenge_id': 'bar'})
+
+        eq_(2, client.communication_attempts)
+
+    def test_unreachable_recaptcha(self):
+        """Challenges aren't used up if reCAPTCHA couldn't be reached."""
+        client = _ExceptionRaisingVerificationClient(RecaptchaUnreachableError())
+        field = RecaptchaField(client, replay_guard=RecaptchaReplayGuard())
+
+        with assert_raises(RecaptchaUnreachableError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        field.recaptcha_client = \
+            _OfflineVerificationClient(is_solution_correct=True)
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+    def test_unavailable_recaptcha(self):
+        client = _ExceptionRaisingVerificationClient(RecaptchaUnreachableError())
+        field = RecaptchaField(
+            client,
+            replay_guard=RecaptchaReplayGuard(),
+            unavailability_policy='reject',
+            )
+
+        with assert_raises(ValidationError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        field.recaptcha_client = \
+            _OfflineVerificationClient(is_solution_correct=True)
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+    def test_rate_limited_submission(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        replay_guard = RecaptchaReplayGuard()
+        field = RecaptchaField(
+            client,
+            replay_guard=replay_guard,
+            rate_limiter=RecaptchaRateLimiter(rate=0.001, capacity=0),
+            )
+
+        with assert_raises(ValidationError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        assert_false(replay_guard.is_consumed(RANDOM_CHALLENGE_ID))
+
+    def test_incorrect_solution(self):
+        """Challenges are used up once reCAPTCHA has verified a solution."""
+        client = _OfflineVerificationClient(is_solution_correct=False)
+        replay_guard = RecaptchaReplayGuard()
+        field = RecaptchaField(client, replay_guard=replay_guard)
+
+        with assert_raises(ValidationError):
+            _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE)
+
+        ok_(replay_guard.is_consumed(RANDOM_CHALLENGE_ID))
+
+
+class TestVerificationCaching(object):
+
+    def setup(self):
+        self.verification_cache = \
+            create_local_memory_cache('recaptcha-verifications')
+
+    def teardown(self):
+        self.verification_cache.clear()
+
+    def test_repeated_verification(self):
+        """Repeating a verification doesn't contact the reCAPTCHA API again."""
+        client = _OfflineVerificationClient(is_solution_correct=True)
+
+        self._validate_field_value(client)
+        self._validate_field_value(client)
+
+        eq_(1, client.communication_attempts)
+
+    def test_repeated_verification_from_different_ip(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+
+        self._validate_field_value(client)
+        self._validate_field_value(client, RecaptchaFormState('192.0.2.1'))
+
+        eq_(2, client.communication_attempts)
+
+    def test_incorrect_solution(self):
+        client = _OfflineVerificationClient(is_solution_correct=False)
+
+        with assert_raises(ValidationError):
+            self._validate_field_value(client)
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+        with assert_raises(ValidationError):
+            self._validate_field_value(client, form_state)
+
+        eq_(1, client.communication_attempts)
+        ok_(form_state.was_previous_solution_incorrect)
+
+    def test_invalid_challenge_id(self):
+        client = _ExceptionRaisingVerificationClient(
+            RecaptchaInvalidChallengeError,
+            )
+
+        with assert_raises(ValidationError):
+            self._validate_field_value(client)
+        with assert_raises(ValidationError):
+            self._validate_field_value(client)
+
+        eq_(1, client.communication_attempts)
+
+    def test_remote_api_unreachable(self):
+        """Failures to contact the reCAPTCHA API aren't cached."""
+        client = _ExceptionRaisingVerificationClient(RecaptchaUnreachableError)
+
+        with assert_raises(RecaptchaUnreachableError):
+            self._validate_field_value(client)
+        with assert_raises(RecaptchaUnreachableError):
+            self._validate_field_value(client)
+
+        eq_(2, client.communication_attempts)
+
+    def test_concurrent_verifications(self):
+        """Concurrent verifications of the same solution are coalesced."""
+        client = _BlockingVerificationClient()
+        verification_thread = Thread(
+            target=self._validate_field_value,
+            args=(client,),
+            kwargs={'verification_lease_timeout': 5},
+            )
+        verification_thread.start()
+        ok_(client.verification_started.wait(1))
+
+        coalesced_verification_thread = Thread(
+            target=self._validate_field_value,
+            args=(client,),
+            kwargs={'verification_lease_timeout': 5},
+            )
+        coalesced_verification_thread.start()
+        client.verification_finished.set()
+        verification_thread.join()
+        coalesced_verification_thread.join()
+
+        eq_(1, client.communication_attempts)
+
+    def test_released_lease(self):
+        """
+        Solutions are verified once the lease is released without an outcome.
+
+        """
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        lease_key = self._acquire_lease()
+
+        timer = Timer(0.1, self.verification_cache.delete, (lease_key,))
+        timer.start()
+        self._validate_field_value(client, verification_lease_timeout=5)
+        timer.join()
+
+        eq_(1, client.communication_attempts)
+
+    def test_expired_lease(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+        self._acquire_lease()
+
+        self._validate_field_value(client, verification_lease_timeout=0.1)
+
+        eq_(1, client.communication_attempts)
+
+    def test_cache_timeout(self):
+        client = _OfflineVerificationClient(is_solution_correct=True)
+
+        self._validate_field_value(client, verification_cache_timeout=-1)
+        self._validate_field_value(client, verification_cache_timeout=-1)
+
+        eq_(2, client.communication_attempts)
+
+    def test_lease_without_cache(self):
+        with assert_raises(ValueError):
+            RecaptchaField(FAKE_RECAPTCHA_CLIENT, verification_lease_timeout=5)
+
+    #{ Utilities
+
+    def _acquire_lease(self):
+        """Acquire the lease to verify the solution, as another process."""
+        cache_key = _get_verification_cache_key(
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_CHALLENGE_ID,
+            RANDOM_REMOTE_IP,
+            )
+        lease_key = _VERIFICATION_LEASE_KEY_PREFIX + cache_key
+        self.verification_cache.add(lease_key, True, 60)
+        return lease_key
+
+    def _validate_field_value(self, client, form_state=None, **field_kwargs):
+        field = RecaptchaField(
+            client,
+            verification_cache=self.verification_cache,
+            **field_kwargs
+            )
+        _clean_field(field, _RANDOM_RECAPTCHA_FIELD_VALUE, form_state)
+
+    #}
+
+
+#{ Utilities
+
+
+def _clean_field(field, field_value, form_state=None):
+    """Clean ``field_value`` like the form does."""
+    form_state = form_state or RecaptchaFormState(RANDOM_REMOTE_IP)
+    field.clean(field_value)
+    field.verify(field_value, form_state)
+
+
 #{ Stubs
 
 
@@ -292,6 +873,23 @@ class _OfflineVerificationClient(object):
         return self.is_solution_correct_
 
 
+class _BlockingVerificationClient(object):
+
+    def __init__(self):
+        super(_BlockingVerificationClient, self).__init__()
+
+        self.verification_started = Event()
+        self.verification_finished = Event()
+
+        self.communication_attempts = 0
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        self.communication_attempts += 1
+        self.verification_started.set()
+        self.verification_finished.wait()
+        return True
+
+
 class _ExceptionRaisingVerificationClient(object):
 
     def __init__(self, exception):
@@ -299,7 +897,11 @@ class _ExceptionRaisingVerificationClient(object):
 
         self.exception = exception
 
+        self.communication_attempts = 0
+
     def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        self.communication_attempts += 1
+
         raise self.exception
 
 
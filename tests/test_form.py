@@ -14,23 +14,42 @@
 #
 ################################################################################
 
+from gc import collect as collect_garbage
+from threading import Event
+from weakref import ref as weak_reference
+
 from django.forms.fields import CharField
 from django.forms.fields import EmailField
 from django.forms.forms import Form
 from django.http import HttpRequest
 from nose.tools import assert_false
+from nose.tools import assert_is_none
+from nose.tools import assert_not_equal
 from nose.tools import eq_
 from nose.tools import ok_
+from recaptcha import RecaptchaClient
+from recaptcha import RecaptchaUnreachableError
 
+from django_recaptcha_field import ProxyAwareRemoteIpResolver
+from django_recaptcha_field import RecaptchaClientRegistry
+from django_recaptcha_field import _PASS_TOKEN_SESSION_KEY
 from django_recaptcha_field import create_form_subclass_with_recaptcha
 
 from tests import FAKE_RECAPTCHA_CLIENT
+from tests import RANDOM_CHALLENGE_ID
 from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
 
 
 __all__ = [
     'TestFieldInitialization',
+    'TestAllowedNetworks',
+    'TestClientRegistry',
+    'TestFormClassReuse',
+    'TestFormState',
     'TestFormSubclass',
+    'TestPassTokens',
+    'TestSpeculativeVerification',
     ]
 
 
@@ -64,6 +83,31 @@ class TestFormSubclass(object):
         eq_(form_data, form.data)
         eq_(form_files, form.files)
 
+    def test_clean_recaptcha_override(self):
+        """
+        Solutions are still verified when the subclass has its own
+        ``clean_recaptcha()`` hook.
+
+        """
+        client = _IncorrectSolutionVerificationClient('private key', 'public')
+        base_form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            client,
+            )
+
+        class CustomRecaptchaProtectedForm(base_form_class):
+
+            def clean_recaptcha(self):
+                return self.cleaned_data['recaptcha']
+
+        form = CustomRecaptchaProtectedForm(
+            _MockHttpRequest(),
+            _VALID_FORM_DATA,
+            )
+
+        assert_false(form.is_valid())
+        ok_('recaptcha' in form.errors)
+
 
 class TestFieldInitialization(object):
 
@@ -76,8 +120,8 @@ class TestFieldInitialization(object):
         ssl_request = _MockHttpRequest(is_ssl_used=True)
         form = _MockRecaptchaProtectedRegistrationForm(ssl_request)
 
-        recaptcha_widget = form.fields['recaptcha'].widget
-        ok_(recaptcha_widget.transmit_challenge_over_ssl)
+        ok_(form.recaptcha_state.transmit_challenge_over_ssl)
+        ok_('https://' in unicode(form['recaptcha']))
 
     def test_non_ssl_request(self):
         """
@@ -88,15 +132,26 @@ class TestFieldInitialization(object):
         non_ssl_request = _MockHttpRequest(is_ssl_used=False)
         form = _MockRecaptchaProtectedRegistrationForm(non_ssl_request)
 
-        recaptcha_widget = form.fields['recaptcha'].widget
-        assert_false(recaptcha_widget.transmit_challenge_over_ssl)
+        assert_false(form.recaptcha_state.transmit_challenge_over_ssl)
+        assert_false('https://' in unicode(form['recaptcha']))
 
     def test_remote_ip(self):
         request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
         form = _MockRecaptchaProtectedRegistrationForm(request)
 
-        recaptcha_field = form.fields['recaptcha']
-        eq_(RANDOM_REMOTE_IP, recaptcha_field.remote_ip)
+        eq_(RANDOM_REMOTE_IP, form.recaptcha_state.remote_ip)
+
+    def test_remote_ip_resolver(self):
+        form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            FAKE_RECAPTCHA_CLIENT,
+            {'remote_ip_resolver': ProxyAwareRemoteIpResolver(['10.0.0.0/8'])},
+            )
+        request = _MockHttpRequest(remote_addr='10.0.0.1')
+        request.META['HTTP_X_FORWARDED_FOR'] = RANDOM_REMOTE_IP
+        form = form_class(request)
+
+        eq_(RANDOM_REMOTE_IP, form.recaptcha_state.remote_ip)
 
     def test_additional_field_arguments(self):
         field_label = 'Are you human?'
@@ -111,9 +166,419 @@ class TestFieldInitialization(object):
         eq_(field_label, recaptcha_field.label)
 
 
+class TestFormState(object):
+
+    def test_shared_field(self):
+        """All the instances of a form class share the same field."""
+        form1 = _MockRecaptchaProtectedRegistrationForm(_MockHttpRequest())
+        form2 = _MockRecaptchaProtectedRegistrationForm(_MockHttpRequest())
+
+        ok_(form1.fields['recaptcha'] is form2.fields['recaptcha'])
+
+    def test_separate_state(self):
+        form1 = _MockRecaptchaProtectedRegistrationForm(_MockHttpRequest())
+        form2 = _MockRecaptchaProtectedRegistrationForm(_MockHttpRequest())
+
+        assert_false(form1.recaptcha_state is form2.recaptcha_state)
+
+    def test_initial_data(self):
+        """The initial data passed to the form is left intact."""
+        initial_data = {'full_name': 'Alice'}
+        form = _MockRecaptchaProtectedRegistrationForm(
+            _MockHttpRequest(),
+            initial=initial_data,
+            )
+
+        eq_({'full_name': 'Alice'}, initial_data)
+        eq_('Alice', form.initial['full_name'])
+
+    def test_incorrect_solution(self):
+        """
+        The challenge is presented as such when the previous solution was
+        incorrect.
+
+        """
+        form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            _IncorrectSolutionVerificationClient('private key', 'public key'),
+            )
+        form = form_class(_MockHttpRequest(), _RANDOM_FORM_DATA)
+
+        assert_false(form.is_valid())
+        ok_('recaptcha' in form.errors)
+        ok_(form.recaptcha_state.was_previous_solution_incorrect)
+        recaptcha_markup = unicode(form['recaptcha'])
+        ok_(_RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY in recaptcha_markup)
+        ok_(_RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY in form.as_p())
+
+    def test_unrendered_form(self):
+        """The challenge markup is only generated when the form is rendered."""
+        recaptcha_client = _MarkupCountingRecaptchaClient(
+            'private key',
+            'public key',
+            )
+        form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            recaptcha_client,
+            )
+        form = form_class(_MockHttpRequest(), _VALID_FORM_DATA)
+
+        ok_(form.is_valid())
+        eq_(0, recaptcha_client.challenge_markup_generations)
+
+        form.as_p()
+        eq_(1, recaptcha_client.challenge_markup_generations)
+
+    def test_unchanged_form(self):
+        form = _MockRecaptchaProtectedRegistrationForm(_MockHttpRequest(), {})
+
+        assert_false(form.has_changed())
+
+
+class TestFormClassReuse(object):
+
+    def test_same_arguments(self):
+        form_class1 = self._create_form_class()
+        form_class2 = self._create_form_class()
+
+        eq_(form_class1, form_class2)
+
+    def test_different_base_form_class(self):
+        form_class1 = self._create_form_class()
+        form_class2 = self._create_form_class(base_form_class=Form)
+
+        assert_not_equal(form_class1, form_class2)
+
+    def test_different_client(self):
+        form_class1 = self._create_form_class()
+        form_class2 = self._create_form_class(
+            recaptcha_client=RecaptchaClient('private key', 'public key'),
+            )
+
+        assert_not_equal(form_class1, form_class2)
+
+    def test_different_field_arguments(self):
+        form_class1 = self._create_form_class({'label': 'Are you human?'})
+        form_class2 = self._create_form_class({'label': 'Are you a robot?'})
+
+        assert_not_equal(form_class1, form_class2)
+
+    def test_nested_field_arguments(self):
+        form_class1 = self._create_form_class(
+            {'error_messages': {'required': 'Please solve the CAPTCHA'}},
+            )
+        form_class2 = self._create_form_class(
+            {'error_messages': {'required': 'Please solve the CAPTCHA'}},
+            )
+
+        eq_(form_class1, form_class2)
+
+    def test_unhashable_field_arguments(self):
+        """Form classes created with unhashable arguments aren't reused."""
+        form_class1 = self._create_form_class({'label': _UnhashableLabel()})
+        form_class2 = self._create_form_class({'label': _UnhashableLabel()})
+
+        assert_not_equal(form_class1, form_class2)
+
+    def test_garbage_collection(self):
+        form_class = self._create_form_class({'label': 'Are you a replicant?'})
+        form_class_reference = weak_reference(form_class)
+
+        del form_class
+        collect_garbage()
+
+        assert_is_none(form_class_reference())
+
+    #{ Utilities
+
+    def _create_form_class(
+        self,
+        additional_field_kwargs=None,
+        base_form_class=None,
+        recaptcha_client=FAKE_RECAPTCHA_CLIENT,
+        ):
+        form_class = create_form_subclass_with_recaptcha(
+            base_form_class or _MockRegistrationForm,
+            recaptcha_client,
+            additional_field_kwargs,
+            )
+        return form_class
+
+    #}
+
+
+class TestSpeculativeVerification(object):
+
+    def setup(self):
+        self.recaptcha_client = _BlockingVerificationClient()
+        self.form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            self.recaptcha_client,
+            additional_field_kwargs={'verify_speculatively': True},
+            )
+
+    def teardown(self):
+        self.recaptcha_client.verification_finished.set()
+
+    def test_bound_form(self):
+        """The verification starts as soon as a bound form is initialized."""
+        self.form_class(_MockHttpRequest(), _RANDOM_FORM_DATA)
+
+        ok_(self.recaptcha_client.verification_started.wait(1))
+
+    def test_unbound_form(self):
+        self.form_class(_MockHttpRequest())
+
+        assert_false(self.recaptcha_client.verification_started.wait(0.01))
+
+    def test_validation(self):
+        form = self.form_class(_MockHttpRequest(), _RANDOM_FORM_DATA)
+        self.recaptcha_client.verification_finished.set()
+
+        assert_false(form.is_valid())
+        assert_false('recaptcha' in form.errors)
+        eq_(1, self.recaptcha_client.communication_attempts)
+
+
+class TestAllowedNetworks(object):
+
+    def setup(self):
+        self.recaptcha_client = _CountingVerificationClient()
+        self.form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            self.recaptcha_client,
+            {'allowed_networks': ['192.0.2.0/24', '2001:db8::/32']},
+            )
+
+    def test_allowed_address(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        form_data = {
+            'full_name': 'Alice',
+            'email_address': 'alice@example.com',
+            }
+        form = self.form_class(request, form_data)
+
+        ok_(form.is_valid())
+        ok_(form.recaptcha_state.was_verification_waived)
+        assert_false('recaptcha' in form.as_p())
+        eq_(0, self.recaptcha_client.communication_attempts)
+
+    def test_other_address(self):
+        request = _MockHttpRequest(remote_addr='198.51.100.1')
+        form = self.form_class(request, _VALID_FORM_DATA)
+
+        ok_(form.is_valid())
+        assert_false(form.recaptcha_state.was_verification_waived)
+        eq_(1, self.recaptcha_client.communication_attempts)
+
+    def test_no_allowed_networks(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        form = _MockRecaptchaProtectedRegistrationForm(request)
+
+        assert_false(form.recaptcha_state.was_verification_waived)
+        ok_('recaptcha' in form.fields)
+
+
+class TestPassTokens(object):
+
+    def setup(self):
+        self.recaptcha_client = _CountingVerificationClient()
+        self.form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            self.recaptcha_client,
+            additional_field_kwargs={'pass_token_timeout': 60},
+            )
+
+    def test_token_issuance(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        form = self.form_class(request, _VALID_FORM_DATA)
+
+        ok_(form.is_valid())
+        ok_(_PASS_TOKEN_SESSION_KEY in request.session)
+
+    def test_incorrect_solution(self):
+        client = _IncorrectSolutionVerificationClient('private key', 'public')
+        form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            client,
+            additional_field_kwargs={'pass_token_timeout': 60},
+            )
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        form = form_class(request, _VALID_FORM_DATA)
+
+        assert_false(form.is_valid())
+        assert_false(_PASS_TOKEN_SESSION_KEY in request.session)
+
+    def test_skipped_verification(self):
+        """No token is issued if reCAPTCHA couldn't verify the solution."""
+        form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            _UnreachableVerificationClient(),
+            additional_field_kwargs={
+                'pass_token_timeout': 60,
+                'unavailability_policy': 'accept',
+                },
+            )
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        form = form_class(request, _VALID_FORM_DATA)
+
+        ok_(form.is_valid())
+        assert_false(_PASS_TOKEN_SESSION_KEY in request.session)
+
+    def test_waived_verification(self):
+        """Forms submitted with a valid token don't have the field."""
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        self.form_class(request, _VALID_FORM_DATA).is_valid()
+
+        form_data = {
+            'full_name': 'Alice',
+            'email_address': 'alice@example.com',
+            }
+        form = self.form_class(request, form_data)
+
+        ok_(form.is_valid())
+        ok_(form.recaptcha_state.was_verification_waived)
+        assert_false('recaptcha' in form.fields)
+        assert_false('recaptcha' in form.as_p())
+        eq_(1, self.recaptcha_client.communication_attempts)
+
+    def test_token_from_different_ip(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        self.form_class(request, _VALID_FORM_DATA).is_valid()
+
+        request.META['REMOTE_ADDR'] = '192.0.2.1'
+        form = self.form_class(request)
+
+        assert_false(form.recaptcha_state.was_verification_waived)
+        ok_('recaptcha' in form.fields)
+
+    def test_no_session(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        del request.session
+        form = self.form_class(request, _VALID_FORM_DATA)
+
+        ok_(form.is_valid())
+
+    def test_disabled_tokens(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        request.session[_PASS_TOKEN_SESSION_KEY] = '0:signature'
+        form = _MockRecaptchaProtectedRegistrationForm(request)
+
+        assert_false(form.recaptcha_state.was_verification_waived)
+        ok_('recaptcha' in form.fields)
+
+
+class TestClientRegistry(object):
+
+    def setup(self):
+        self.recaptcha_clients = {
+            'example.com': _CountingVerificationClient(),
+            'example.org': _CountingVerificationClient(),
+            }
+        self.form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            None,
+            {
+                'recaptcha_client_registry':
+                    RecaptchaClientRegistry(self.recaptcha_clients.get),
+                },
+            )
+
+    def test_verification(self):
+        request = _MockHttpRequest(remote_addr=RANDOM_REMOTE_IP)
+        request.META['HTTP_HOST'] = 'example.org'
+        form = self.form_class(request, _VALID_FORM_DATA)
+
+        ok_(form.is_valid())
+        eq_(0, self.recaptcha_clients['example.com'].communication_attempts)
+        eq_(1, self.recaptcha_clients['example.org'].communication_attempts)
+
+    def test_rendering(self):
+        form_class = create_form_subclass_with_recaptcha(
+            _MockRegistrationForm,
+            None,
+            {
+                'recaptcha_client_registry': RecaptchaClientRegistry(
+                    lambda tenant: RecaptchaClient('private key', tenant),
+                    ),
+                },
+            )
+
+        for host in ('example.com', 'example.org'):
+            request = _MockHttpRequest()
+            request.META['HTTP_HOST'] = host
+            form = form_class(request)
+
+            ok_('k=' + host in unicode(form['recaptcha']))
+
+
 #{ Stubs
 
 
+class _IncorrectSolutionVerificationClient(RecaptchaClient):
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        return False
+
+
+class _MarkupCountingRecaptchaClient(RecaptchaClient):
+
+    def __init__(self, *args, **kwargs):
+        super(_MarkupCountingRecaptchaClient, self).__init__(*args, **kwargs)
+
+        self.challenge_markup_generations = 0
+
+    def get_challenge_markup(self, *args, **kwargs):
+        self.challenge_markup_generations += 1
+        return super(_MarkupCountingRecaptchaClient, self).get_challenge_markup(
+            *args,
+            **kwargs
+            )
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        return True
+
+
+class _CountingVerificationClient(object):
+
+    def __init__(self):
+        super(_CountingVerificationClient, self).__init__()
+
+        self.communication_attempts = 0
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        self.communication_attempts += 1
+        return True
+
+
+class _UnreachableVerificationClient(object):
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        raise RecaptchaUnreachableError()
+
+
+class _UnhashableLabel(object):
+
+    __hash__ = None
+
+
+class _BlockingVerificationClient(object):
+
+    def __init__(self):
+        super(_BlockingVerificationClient, self).__init__()
+
+        self.verification_started = Event()
+        self.verification_finished = Event()
+
+        self.communication_attempts = 0
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        self.communication_attempts += 1
+        self.verification_started.set()
+        self.verification_finished.wait()
+        return True
+
+
 class _MockHttpRequest(HttpRequest):
 
     def __init__(self, is_ssl_used=False, remote_addr=None):
@@ -121,6 +586,7 @@ class _MockHttpRequest(HttpRequest):
 
         self.is_ssl_used = is_ssl_used
         self.META['REMOTE_ADDR'] = remote_addr
+        self.session = {}
 
     def is_secure(self):
         return self.is_ssl_used
@@ -133,6 +599,22 @@ class _MockRegistrationForm(Form):
     email_address = EmailField(max_length=255)
 
 
+_RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY = 'error=incorrect-captcha-sol'
+
+
+_RANDOM_FORM_DATA = {
+    'full_name': 'Alice',
+    'recaptcha_response_field': RANDOM_SOLUTION_TEXT,
+    'recaptcha_challenge_field': RANDOM_CHALLENGE_ID,
+    }
+
+
+_VALID_FORM_DATA = dict(
+    _RANDOM_FORM_DATA,
+    email_address='alice@example.com',
+    )
+
+
 _MockRecaptchaProtectedRegistrationForm = create_form_subclass_with_recaptcha(
     _MockRegistrationForm,
     FAKE_RECAPTCHA_CLIENT,
@@ -0,0 +1,234 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import sleep
+from time import time
+
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import PooledVerificationTransport
+from django_recaptcha_field import RecaptchaVerificationHedger
+from django_recaptcha_field import _RecaptchaField as RecaptchaField
+from django_recaptcha_field import _RecaptchaFormState as RecaptchaFormState
+
+from tests import FAKE_RECAPTCHA_CLIENT
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+from tests.verification_server import FakeVerificationServer
+
+
+__all__ = [
+    'TestHedgeLimit',
+    'TestHedging',
+    'TestHedgingAgainstServer',
+    ]
+
+
+class TestHedging(object):
+
+    def setup(self):
+        self.hedger = RecaptchaVerificationHedger(0.05)
+
+    def test_fast_response(self):
+        """No hedge is sent if the first response arrives in time."""
+        function = _ScriptedFunction((0, True))
+
+        ok_(self.hedger.call(function))
+
+        eq_(1, function.call_count)
+        eq_(0, self.hedger.hedge_count)
+
+    def test_slow_response(self):
+        function = _ScriptedFunction((1, True), (0, True))
+
+        call_start_time = time()
+        ok_(self.hedger.call(function))
+
+        ok_(time() - call_start_time < 1)
+        eq_(2, function.call_count)
+        eq_(1, self.hedger.hedge_count)
+        eq_(1, self.hedger.hedge_win_count)
+
+    def test_slow_hedge(self):
+        function = _ScriptedFunction((0.1, True), (1, True))
+
+        ok_(self.hedger.call(function))
+
+        eq_(1, self.hedger.hedge_count)
+        eq_(0, self.hedger.hedge_win_count)
+
+    def test_negative_hedge_response(self):
+        """
+        The original response is used if the hedge doesn't accept the solution.
+
+        """
+        function = _ScriptedFunction(
+            (0.1, True),
+            (0, RecaptchaInvalidChallengeError),
+            )
+
+        ok_(self.hedger.call(function))
+        eq_(0, self.hedger.hedge_win_count)
+
+    def test_negative_original_response(self):
+        function = _ScriptedFunction((0.1, False), (0.2, True))
+
+        ok_(self.hedger.call(function))
+        eq_(1, self.hedger.hedge_win_count)
+
+    def test_negative_responses(self):
+        function = _ScriptedFunction((0.1, False), (0, False))
+
+        assert_false(self.hedger.call(function))
+        eq_(0, self.hedger.hedge_win_count)
+
+    def test_unreachable_original(self):
+        function = _ScriptedFunction(
+            (0.1, RecaptchaUnreachableError),
+            (0.1, False),
+            )
+
+        assert_false(self.hedger.call(function))
+        eq_(1, self.hedger.hedge_win_count)
+
+    def test_unreachable_recaptcha(self):
+        function = _ScriptedFunction(
+            (0.1, RecaptchaUnreachableError),
+            (0, RecaptchaUnreachableError),
+            )
+
+        with assert_raises(RecaptchaUnreachableError):
+            self.hedger.call(function)
+
+
+class TestHedgeLimit(object):
+
+    def test_outstanding_hedges(self):
+        hedger = RecaptchaVerificationHedger(0, max_outstanding_hedges=1)
+        calls_released = Event()
+        blocking_function = _ScriptedFunction(
+            (calls_released, True),
+            (calls_released, True),
+            )
+        blocking_call = Thread(target=hedger.call, args=(blocking_function,))
+        blocking_call.start()
+        try:
+            # The hedge is outstanding once the function has been called twice
+            while blocking_function.call_count < 2:
+                sleep(0.001)
+
+            function = _ScriptedFunction((0.05, True), (0, True))
+            ok_(hedger.call(function))
+        finally:
+            calls_released.set()
+            blocking_call.join()
+
+        eq_(1, function.call_count)
+        eq_(1, hedger.hedge_count)
+        eq_(1, hedger.suppressed_hedge_count)
+
+    def test_released_hedges(self):
+        hedger = RecaptchaVerificationHedger(0, max_outstanding_hedges=1)
+
+        hedger.call(_ScriptedFunction((0.05, True), (0, True)))
+        hedger.call(_ScriptedFunction((0.05, True), (0, True)))
+
+        eq_(2, hedger.hedge_count)
+        eq_(0, hedger.suppressed_hedge_count)
+
+
+class TestHedgingAgainstServer(object):
+
+    def setup(self):
+        response_delays = iter([1, 0])
+        self.verification_server = FakeVerificationServer(
+            response_delay=lambda: next(response_delays, 0),
+            )
+        self.verification_server.start()
+
+        self.hedger = RecaptchaVerificationHedger(0.1)
+        self.field = RecaptchaField(
+            FAKE_RECAPTCHA_CLIENT,
+            verification_transport=PooledVerificationTransport(
+                self.verification_server.verification_url,
+                ),
+            verification_hedger=self.hedger,
+            )
+
+    def teardown(self):
+        self.verification_server.stop()
+
+    def test_slow_server(self):
+        field_value = {
+            'solution_text': RANDOM_SOLUTION_TEXT,
+            'challenge_id': RANDOM_CHALLENGE_ID,
+            }
+
+        verification_start_time = time()
+        self.field.verify(field_value, RecaptchaFormState(RANDOM_REMOTE_IP))
+
+        ok_(time() - verification_start_time < 1)
+        eq_(2, len(self.verification_server.requests_data))
+        eq_(1, self.hedger.hedge_win_count)
+
+
+#{ Stubs
+
+
+class _ScriptedFunction(object):
+    """
+    Function whose calls wait and then return or raise as scripted.
+
+    Each script is a tuple with the number of seconds (or an event) to wait
+    for, and the value to return or the exception to raise.
+
+    """
+
+    def __init__(self, *call_scripts):
+        super(_ScriptedFunction, self).__init__()
+
+        self.call_scripts = list(call_scripts)
+
+        self.call_count = 0
+
+        self._lock = Lock()
+
+    def __call__(self):
+        with self._lock:
+            delay, result = self.call_scripts[self.call_count]
+            self.call_count += 1
+
+        if hasattr(delay, 'wait'):
+            delay.wait()
+        else:
+            sleep(delay)
+
+        if isinstance(result, type) and issubclass(result, Exception):
+            raise result()
+        return result
+
+
+#}
@@ -0,0 +1,403 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from sys import modules
+from types import ModuleType
+
+from django.core.exceptions import ValidationError
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaInvalidPrivateKeyError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import PrometheusRecaptchaMetrics
+from django_recaptcha_field import RecaptchaMetrics
+from django_recaptcha_field import RecaptchaRateLimiter
+from django_recaptcha_field import RecaptchaReplayGuard
+from django_recaptcha_field import StatsdRecaptchaMetrics
+from django_recaptcha_field import _RecaptchaField as RecaptchaField
+from django_recaptcha_field import _RecaptchaFormState as RecaptchaFormState
+
+from tests import FAKE_RECAPTCHA_CLIENT
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+from tests import create_local_memory_cache
+
+
+__all__ = [
+    'TestPrometheusMetrics',
+    'TestRenderingMetrics',
+    'TestStatsdMetrics',
+    'TestVerificationMetrics',
+    ]
+
+
+_RANDOM_RECAPTCHA_FIELD_VALUE = {
+    'solution_text': RANDOM_SOLUTION_TEXT,
+    'challenge_id': RANDOM_CHALLENGE_ID,
+    }
+
+
+def test_default_metrics():
+    """Metrics are discarded by default."""
+    field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
+
+    eq_(RecaptchaMetrics, type(field.metrics))
+    ok_(field.metrics is field.widget.metrics)
+
+
+class TestVerificationMetrics(object):
+
+    def test_correct_solution(self):
+        self._assert_outcome_recorded(_VerificationClient(True), 'correct')
+
+    def test_incorrect_solution(self):
+        client = _VerificationClient(False)
+        self._assert_outcome_recorded(client, 'incorrect', ValidationError)
+
+    def test_invalid_challenge(self):
+        client = _VerificationClient(exception=RecaptchaInvalidChallengeError)
+        self._assert_outcome_recorded(
+            client,
+            'invalid_challenge',
+            ValidationError,
+            )
+
+    def test_remote_api_unreachable(self):
+        client = _VerificationClient(exception=RecaptchaUnreachableError)
+        self._assert_outcome_recorded(
+            client,
+            'unreachable',
+            RecaptchaUnreachableError,
+            )
+
+    def test_unreachable_with_unavailability_policy(self):
+        client = _VerificationClient(exception=RecaptchaUnreachableError)
+        self._assert_outcome_recorded(
+            client,
+            'unreachable',
+            unavailability_policy='accept',
+            )
+
+    def test_invalid_private_key(self):
+        client = _VerificationClient(exception=RecaptchaInvalidPrivateKeyError)
+        self._assert_outcome_recorded(
+            client,
+            'invalid_private_key',
+            RecaptchaInvalidPrivateKeyError,
+            )
+
+    def test_rate_limited(self):
+        rate_limiter = RecaptchaRateLimiter(1, 0)
+        self._assert_outcome_recorded(
+            _VerificationClient(True),
+            'rate_limited',
+            ValidationError,
+            rate_limiter=rate_limiter,
+            )
+
+    def test_replayed_challenge(self):
+        replay_guard = RecaptchaReplayGuard()
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+        self._assert_outcome_recorded(
+            _VerificationClient(True),
+            'replayed',
+            ValidationError,
+            replay_guard=replay_guard,
+            )
+
+    def test_cached_outcome(self):
+        """Verifications whose outcome was cached aren't recorded."""
+        verification_cache = create_local_memory_cache('recaptcha-metrics')
+        metrics = _RecordingMetrics()
+        field = RecaptchaField(
+            _VerificationClient(True),
+            verification_cache=verification_cache,
+            metrics=metrics,
+            )
+
+        try:
+            _verify(field)
+            _verify(field)
+        finally:
+            verification_cache.clear()
+
+        eq_(1, len(metrics.verifications))
+
+    #{ Utilities
+
+    def _assert_outcome_recorded(
+        self,
+        client,
+        expected_outcome,
+        expected_exception=None,
+        **field_kwargs
+        ):
+        metrics = _RecordingMetrics()
+        field = RecaptchaField(client, metrics=metrics, **field_kwargs)
+
+        if expected_exception is None:
+            _verify(field)
+        else:
+            with assert_raises(expected_exception):
+                _verify(field)
+
+        eq_(1, len(metrics.verifications))
+        outcome, duration = metrics.verifications[0]
+        eq_(expected_outcome, outcome)
+        ok_(0 <= duration)
+
+    #}
+
+
+class TestRenderingMetrics(object):
+
+    def test_rendering(self):
+        metrics = _RecordingMetrics()
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT, metrics=metrics)
+
+        field.widget.render('recaptcha', RecaptchaFormState())
+        field.widget.render('recaptcha', RecaptchaFormState())
+
+        eq_(2, len(metrics.rendering_durations))
+        ok_(all(0 <= duration for duration in metrics.rendering_durations))
+
+
+class TestStatsdMetrics(object):
+
+    def setup(self):
+        self.statsd_client = _StatsdClient()
+
+    def test_verification(self):
+        metrics = StatsdRecaptchaMetrics(self.statsd_client)
+
+        metrics.record_verification('correct', 0.25)
+
+        eq_(['recaptcha.verification.correct'], self.statsd_client.counters)
+        eq_(
+            [('recaptcha.verification.correct', 250)],
+            self.statsd_client.timings,
+            )
+
+    def test_rendering(self):
+        metrics = StatsdRecaptchaMetrics(self.statsd_client)
+
+        metrics.record_rendering(0.001)
+
+        eq_(['recaptcha.rendering'], self.statsd_client.counters)
+        eq_([('recaptcha.rendering', 1)], self.statsd_client.timings)
+
+    def test_prefix(self):
+        metrics = StatsdRecaptchaMetrics(self.statsd_client, 'myapp.captcha')
+
+        metrics.record_verification('unreachable', 1)
+
+        eq_(
+            ['myapp.captcha.verification.unreachable'],
+            self.statsd_client.counters,
+            )
+
+
+class TestPrometheusMetrics(object):
+    """
+    Tests against a stand-in for ``prometheus_client``, which needn't be
+    installed.
+
+    """
+
+    def setup(self):
+        self.original_prometheus_client = modules.get('prometheus_client')
+
+        self.default_registry = _PrometheusRegistry()
+        prometheus_client = ModuleType('prometheus_client')
+        prometheus_client.REGISTRY = self.default_registry
+        prometheus_client.Histogram = _PrometheusHistogram
+        modules['prometheus_client'] = prometheus_client
+
+    def teardown(self):
+        if self.original_prometheus_client is None:
+            del modules['prometheus_client']
+        else:
+            modules['prometheus_client'] = self.original_prometheus_client
+
+    def test_histograms(self):
+        registry = _PrometheusRegistry()
+        PrometheusRecaptchaMetrics(registry)
+
+        eq_(
+            set([
+                'recaptcha_verification_duration_seconds',
+                'recaptcha_rendering_duration_seconds',
+                ]),
+            set(registry.histograms),
+            )
+        verification_histogram = \
+            registry.histograms['recaptcha_verification_duration_seconds']
+        eq_(('outcome', ), verification_histogram.label_names)
+        rendering_histogram = \
+            registry.histograms['recaptcha_rendering_duration_seconds']
+        eq_((), rendering_histogram.label_names)
+
+    def test_verification(self):
+        registry = _PrometheusRegistry()
+        metrics = PrometheusRecaptchaMetrics(registry)
+
+        metrics.record_verification('correct', 0.25)
+        metrics.record_verification('unreachable', 1)
+        metrics.record_verification('correct', 0.5)
+
+        verification_histogram = \
+            registry.histograms['recaptcha_verification_duration_seconds']
+        eq_(
+            {('correct', ): [0.25, 0.5], ('unreachable', ): [1]},
+            verification_histogram.observations,
+            )
+
+    def test_rendering(self):
+        registry = _PrometheusRegistry()
+        metrics = PrometheusRecaptchaMetrics(registry)
+
+        metrics.record_rendering(0.001)
+
+        rendering_histogram = \
+            registry.histograms['recaptcha_rendering_duration_seconds']
+        eq_({(): [0.001]}, rendering_histogram.observations)
+
+    def test_namespace(self):
+        registry = _PrometheusRegistry()
+        PrometheusRecaptchaMetrics(registry, 'myapp')
+
+        ok_('myapp_verification_duration_seconds' in registry.histograms)
+        ok_('myapp_rendering_duration_seconds' in registry.histograms)
+
+    def test_default_registry(self):
+        PrometheusRecaptchaMetrics()
+
+        eq_(2, len(self.default_registry.histograms))
+
+
+#{ Utilities
+
+
+def _verify(field):
+    form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+    field.verify(_RANDOM_RECAPTCHA_FIELD_VALUE, form_state)
+
+
+#{ Stubs
+
+
+class _RecordingMetrics(RecaptchaMetrics):
+
+    def __init__(self):
+        super(_RecordingMetrics, self).__init__()
+
+        self.verifications = []
+        self.rendering_durations = []
+
+    def record_verification(self, outcome, duration):
+        self.verifications.append((outcome, duration))
+
+    def record_rendering(self, duration):
+        self.rendering_durations.append(duration)
+
+
+class _VerificationClient(object):
+
+    def __init__(self, is_solution_correct=None, exception=None):
+        super(_VerificationClient, self).__init__()
+
+        self.is_solution_correct_ = is_solution_correct
+        self.exception = exception
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        if self.exception:
+            raise self.exception
+        return self.is_solution_correct_
+
+
+class _StatsdClient(object):
+
+    def __init__(self):
+        super(_StatsdClient, self).__init__()
+
+        self.counters = []
+        self.timings = []
+
+    def incr(self, metric_name):
+        self.counters.append(metric_name)
+
+    def timing(self, metric_name, milliseconds):
+        self.timings.append((metric_name, round(milliseconds)))
+
+
+class _PrometheusRegistry(object):
+
+    def __init__(self):
+        super(_PrometheusRegistry, self).__init__()
+
+        self.histograms = {}
+
+
+class _PrometheusHistogram(object):
+    """Stand-in for :class:`prometheus_client.Histogram`."""
+
+    def __init__(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        namespace='',
+        registry=None,
+        ):
+        super(_PrometheusHistogram, self).__init__()
+
+        self.name = '_'.join(part for part in (namespace, name) if part)
+        self.documentation = documentation
+        self.label_names = tuple(labelnames)
+
+        self.observations = {}
+
+        assert self.name not in registry.histograms, 'Duplicated histogram'
+        registry.histograms[self.name] = self
+
+    def labels(self, *label_values):
+        assert len(label_values) == len(self.label_names)
+        return _LabelledPrometheusHistogram(self, label_values)
+
+    def observe(self, value):
+        assert not self.label_names, 'Labels missing'
+        self.observations.setdefault((), []).append(value)
+
+
+class _LabelledPrometheusHistogram(object):
+
+    def __init__(self, histogram, label_values):
+        super(_LabelledPrometheusHistogram, self).__init__()
+
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def observe(self, value):
+        observations = self.histogram.observations
+        observations.setdefault(self.label_values, []).append(value)
+
+
+#}
@@ -0,0 +1,187 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+
+from django_recaptcha_field import RecaptchaRateLimiter
+
+from tests import RANDOM_REMOTE_IP
+from tests import create_local_memory_cache
+
+
+__all__ = [
+    'TestCachedBuckets',
+    'TestInProcessBuckets',
+    ]
+
+
+_OTHER_REMOTE_IP = '192.0.2.1'
+
+
+def test_non_positive_rate():
+    for rate in (0, -1):
+        with assert_raises(ValueError):
+            RecaptchaRateLimiter(rate, 1)
+
+
+class _RateLimiterTestCase(object):
+
+    def test_burst(self):
+        rate_limiter = self._create_rate_limiter(capacity=3)
+
+        for _ in range(3):
+            ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        assert_false(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+    def test_refill(self):
+        rate_limiter = self._create_rate_limiter(capacity=1)
+
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        assert_false(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+        self._age_bucket(rate_limiter, RANDOM_REMOTE_IP, 1)
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+    def test_partial_refill(self):
+        rate_limiter = self._create_rate_limiter(capacity=1)
+
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        self._age_bucket(rate_limiter, RANDOM_REMOTE_IP, 0.5)
+
+        assert_false(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+    def test_capacity(self):
+        """Buckets don't hold more tokens than their capacity."""
+        rate_limiter = self._create_rate_limiter(capacity=1)
+
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        self._age_bucket(rate_limiter, RANDOM_REMOTE_IP, 10)
+
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        assert_false(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+    def test_different_ips(self):
+        rate_limiter = self._create_rate_limiter(capacity=1)
+
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        ok_(rate_limiter.consume(_OTHER_REMOTE_IP))
+        assert_false(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+    #{ Utilities
+
+    def _create_rate_limiter(self, capacity, **kwargs):
+        raise NotImplementedError()
+
+    def _age_bucket(self, rate_limiter, remote_ip, seconds):
+        """Make it look like ``remote_ip`` was last seen ``seconds`` earlier."""
+        token_count, last_update_time = rate_limiter._get_bucket(remote_ip)
+        rate_limiter._set_bucket(
+            remote_ip,
+            (token_count, last_update_time - seconds),
+            )
+
+    #}
+
+
+class TestInProcessBuckets(_RateLimiterTestCase):
+
+    def test_maximum_size(self):
+        """The least recently used bucket is discarded."""
+        rate_limiter = self._create_rate_limiter(capacity=1, max_size=1)
+
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+        ok_(rate_limiter.consume(_OTHER_REMOTE_IP))
+
+        eq_(1, len(rate_limiter._buckets))
+        ok_(rate_limiter.consume(RANDOM_REMOTE_IP))
+
+    #{ Utilities
+
+    def _create_rate_limiter(self, capacity, **kwargs):
+        return RecaptchaRateLimiter(1, capacity, **kwargs)
+
+    #}
+
+
+class TestCachedBuckets(_RateLimiterTestCase):
+
+    def setup(self):
+        self.cache = create_local_memory_cache('recaptcha-rate-limits')
+
+    def teardown(self):
+        self.cache.clear()
+
+    def test_shared_buckets(self):
+        """Rate limiters using the same cache share their buckets."""
+        rate_limiter1 = self._create_rate_limiter(capacity=1)
+        rate_limiter2 = self._create_rate_limiter(capacity=1)
+
+        ok_(rate_limiter1.consume(RANDOM_REMOTE_IP))
+        assert_false(rate_limiter2.consume(RANDOM_REMOTE_IP))
+
+    def test_bucket_timeout(self):
+        rate_limiter = self._create_rate_limiter(capacity=2)
+
+        eq_(2, rate_limiter._bucket_timeout)
+
+    def test_no_locking(self):
+        """The cache isn't accessed with the in-process lock held."""
+        rate_limiter = self._create_rate_limiter(capacity=1)
+        lock_states = []
+        rate_limiter.cache = _LockRecordingCache(
+            self.cache,
+            rate_limiter._lock,
+            lock_states,
+            )
+
+        rate_limiter.consume(RANDOM_REMOTE_IP)
+
+        eq_([False, False], lock_states)
+
+    #{ Utilities
+
+    def _create_rate_limiter(self, capacity, **kwargs):
+        return RecaptchaRateLimiter(1, capacity, self.cache, **kwargs)
+
+    #}
+
+
+#{ Stubs
+
+
+class _LockRecordingCache(object):
+
+    def __init__(self, cache, lock, lock_states):
+        super(_LockRecordingCache, self).__init__()
+
+        self.cache = cache
+        self.lock = lock
+        self.lock_states = lock_states
+
+    def get(self, *args, **kwargs):
+        self.lock_states.append(self.lock.locked())
+        return self.cache.get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self.lock_states.append(self.lock.locked())
+        return self.cache.set(*args, **kwargs)
+
+
+#}
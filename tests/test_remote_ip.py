@@ -0,0 +1,321 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from django.forms.forms import Form
+from django.http import HttpRequest
+from django.http import QueryDict
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+
+from django_recaptcha_field import ProxyAwareRemoteIpResolver
+from django_recaptcha_field import create_form_subclass_with_recaptcha
+from django_recaptcha_field import _IpAddressRangeIndex as IpAddressRangeIndex
+
+from tests import FAKE_RECAPTCHA_CLIENT
+from tests import RANDOM_REMOTE_IP
+
+
+__all__ = [
+    'TestForwardedHeader',
+    'TestForwardedHeaderSelection',
+    'TestIpAddressRangeIndex',
+    'TestSpoofedHeaders',
+    'TestXForwardedForHeader',
+    ]
+
+
+_TRUSTED_PROXY_IP = '10.0.0.1'
+
+
+_OTHER_TRUSTED_PROXY_IP = '10.0.0.2'
+
+
+_UNTRUSTED_PROXY_IP = '198.51.100.1'
+
+
+_TRUSTED_PROXIES = ('10.0.0.0/8', '2001:db8::/32')
+
+
+_SPOOFED_IP = '192.0.2.50'
+
+
+class TestIpAddressRangeIndex(object):
+
+    def test_ipv4_network(self):
+        index = IpAddressRangeIndex(['192.0.2.0/24'])
+
+        ok_('192.0.2.0' in index)
+        ok_('192.0.2.255' in index)
+        assert_false('192.0.1.255' in index)
+        assert_false('192.0.3.0' in index)
+
+    def test_ipv6_network(self):
+        index = IpAddressRangeIndex(['2001:db8::/32'])
+
+        ok_('2001:db8::1' in index)
+        ok_('2001:db8:ffff:ffff:ffff:ffff:ffff:ffff' in index)
+        assert_false('2001:db9::' in index)
+
+    def test_address_families(self):
+        """IPv4 and IPv6 addresses with the same value are told apart."""
+        index = IpAddressRangeIndex(['0.0.0.1'])
+
+        ok_('0.0.0.1' in index)
+        assert_false('::1' in index)
+
+    def test_individual_address(self):
+        index = IpAddressRangeIndex([RANDOM_REMOTE_IP])
+
+        ok_(RANDOM_REMOTE_IP in index)
+        assert_false('192.0.2.1' in index)
+
+    def test_host_bits(self):
+        index = IpAddressRangeIndex(['192.0.2.77/24'])
+
+        ok_('192.0.2.0' in index)
+
+    def test_overlapping_networks(self):
+        index = IpAddressRangeIndex(
+            ['10.0.0.0/8', '10.1.0.0/16', '11.0.0.0/8', '192.0.2.0/24'],
+            )
+
+        ok_('10.255.255.255' in index)
+        ok_('11.0.0.0' in index)
+        ok_('192.0.2.1' in index)
+        assert_false('12.0.0.0' in index)
+
+    def test_many_networks(self):
+        networks = ['10.{}.0.0/16'.format(octet) for octet in range(0, 256, 2)]
+        index = IpAddressRangeIndex(networks)
+
+        ok_('10.254.1.1' in index)
+        assert_false('10.255.1.1' in index)
+
+    def test_malformed_addresses(self):
+        index = IpAddressRangeIndex(['0.0.0.0/0'])
+
+        for ip_address in ('', 'unknown', '10.0.0', '10.0.0.1:80', None):
+            assert_false(ip_address in index)
+
+    def test_malformed_networks(self):
+        for network in ('10.0.0', '10.0.0.0/33', '10.0.0.0/x', 'unknown/8'):
+            with assert_raises(ValueError):
+                IpAddressRangeIndex([network])
+
+
+class TestXForwardedForHeader(object):
+
+    def setup(self):
+        self.resolver = ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES)
+
+    def test_untrusted_peer(self):
+        request = _create_request(
+            _UNTRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR=RANDOM_REMOTE_IP,
+            )
+
+        eq_(_UNTRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+    def test_trusted_peer(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR=RANDOM_REMOTE_IP,
+            )
+
+        eq_(RANDOM_REMOTE_IP, self.resolver.get_remote_ip(request))
+
+    def test_no_header(self):
+        request = _create_request(_TRUSTED_PROXY_IP)
+
+        eq_(_TRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+    def test_chained_trusted_proxies(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR='{}, {}'.format(
+                RANDOM_REMOTE_IP,
+                _OTHER_TRUSTED_PROXY_IP,
+                ),
+            )
+
+        eq_(RANDOM_REMOTE_IP, self.resolver.get_remote_ip(request))
+
+    def test_spoofed_address(self):
+        """Addresses forwarded by untrusted proxies are ignored."""
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR='{}, {}'.format(
+                RANDOM_REMOTE_IP,
+                _UNTRUSTED_PROXY_IP,
+                ),
+            )
+
+        eq_(_UNTRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+    def test_only_trusted_proxies(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR=_OTHER_TRUSTED_PROXY_IP,
+            )
+
+        eq_(_OTHER_TRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+    def test_malformed_address(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR='{}, garbage'.format(RANDOM_REMOTE_IP),
+            )
+
+        eq_(_TRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+
+class TestForwardedHeader(object):
+
+    def setup(self):
+        self.resolver = \
+            ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES, 'Forwarded')
+
+    def test_ipv4_address(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for={};proto=https'.format(RANDOM_REMOTE_IP),
+            )
+
+        eq_(RANDOM_REMOTE_IP, self.resolver.get_remote_ip(request))
+
+    def test_ipv4_address_with_port(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for="{}:4711"'.format(RANDOM_REMOTE_IP),
+            )
+
+        eq_(RANDOM_REMOTE_IP, self.resolver.get_remote_ip(request))
+
+    def test_ipv6_address(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='For="[2001:db9::17]:4711"',
+            )
+
+        eq_('2001:db9::17', self.resolver.get_remote_ip(request))
+
+    def test_chained_trusted_proxies(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for={}, for="[2001:db8::1]"'.format(
+                RANDOM_REMOTE_IP,
+                ),
+            )
+
+        eq_(RANDOM_REMOTE_IP, self.resolver.get_remote_ip(request))
+
+    def test_obfuscated_address(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for=_hidden',
+            )
+
+        eq_(_TRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+    def test_no_header(self):
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_X_FORWARDED_FOR=RANDOM_REMOTE_IP,
+            )
+
+        eq_(_TRUSTED_PROXY_IP, self.resolver.get_remote_ip(request))
+
+
+class TestForwardedHeaderSelection(object):
+
+    def test_default_header(self):
+        resolver = ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES)
+
+        eq_('X-Forwarded-For', resolver.forwarded_header)
+
+    def test_unsupported_header(self):
+        with assert_raises(ValueError):
+            ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES, 'X-Real-IP')
+
+
+class TestSpoofedHeaders(object):
+    """
+    Headers the trusted proxies don't set are passed on from users unchanged,
+    so they must be ignored.
+
+    """
+
+    def test_forwarded_header(self):
+        resolver = ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES)
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for={}'.format(_SPOOFED_IP),
+            HTTP_X_FORWARDED_FOR=RANDOM_REMOTE_IP,
+            )
+
+        eq_(RANDOM_REMOTE_IP, resolver.get_remote_ip(request))
+
+    def test_x_forwarded_for_header(self):
+        resolver = ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES, 'Forwarded')
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for={}'.format(RANDOM_REMOTE_IP),
+            HTTP_X_FORWARDED_FOR=_SPOOFED_IP,
+            )
+
+        eq_(RANDOM_REMOTE_IP, resolver.get_remote_ip(request))
+
+    def test_allowed_network(self):
+        """Users can't get the CAPTCHA waived by spoofing their address."""
+        form_class = create_form_subclass_with_recaptcha(
+            _MockForm,
+            FAKE_RECAPTCHA_CLIENT,
+            {
+                'remote_ip_resolver':
+                    ProxyAwareRemoteIpResolver(_TRUSTED_PROXIES),
+                'allowed_networks': ['192.0.2.0/24'],
+                },
+            )
+        request = _create_request(
+            _TRUSTED_PROXY_IP,
+            HTTP_FORWARDED='for={}'.format(_SPOOFED_IP),
+            HTTP_X_FORWARDED_FOR=_UNTRUSTED_PROXY_IP,
+            )
+        form = form_class(request, QueryDict(''))
+
+        assert_false(form.recaptcha_state.was_verification_waived)
+        assert_false(form.is_valid())
+
+
+#{ Utilities
+
+
+class _MockForm(Form):
+
+    pass
+
+
+def _create_request(remote_addr, **meta):
+    request = HttpRequest()
+    request.META['REMOTE_ADDR'] = remote_addr
+    request.META.update(meta)
+    return request
+
+
+#}
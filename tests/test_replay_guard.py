@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from nose.tools import assert_false
+from nose.tools import eq_
+from nose.tools import ok_
+
+from django_recaptcha_field import RecaptchaReplayGuard
+
+from tests import RANDOM_CHALLENGE_ID
+from tests import create_local_memory_cache
+
+
+__all__ = [
+    'TestBloomFilters',
+    'TestCachedChallenges',
+    ]
+
+
+_OTHER_CHALLENGE_ID = 'fghij'
+
+
+class _ReplayGuardTestCase(object):
+
+    def test_new_challenge(self):
+        replay_guard = self._create_replay_guard()
+
+        ok_(replay_guard.consume(RANDOM_CHALLENGE_ID))
+
+    def test_replayed_challenge(self):
+        replay_guard = self._create_replay_guard()
+
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+
+        assert_false(replay_guard.consume(RANDOM_CHALLENGE_ID))
+
+    def test_different_challenges(self):
+        replay_guard = self._create_replay_guard()
+
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+
+        ok_(replay_guard.consume(_OTHER_CHALLENGE_ID))
+
+    def test_consumption_check(self):
+        """Checking whether a challenge was used doesn't record it."""
+        replay_guard = self._create_replay_guard()
+
+        assert_false(replay_guard.is_consumed(RANDOM_CHALLENGE_ID))
+        assert_false(replay_guard.is_consumed(RANDOM_CHALLENGE_ID))
+
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+
+        ok_(replay_guard.is_consumed(RANDOM_CHALLENGE_ID))
+        assert_false(replay_guard.is_consumed(_OTHER_CHALLENGE_ID))
+
+    def test_unicode_challenge(self):
+        replay_guard = self._create_replay_guard()
+
+        ok_(replay_guard.consume(u'абвгд'))
+        assert_false(replay_guard.consume(u'абвгд'))
+
+    #{ Utilities
+
+    def _create_replay_guard(self, **kwargs):
+        raise NotImplementedError()
+
+    #}
+
+
+class TestBloomFilters(_ReplayGuardTestCase):
+
+    def test_rotation(self):
+        """Challenges are remembered for a lifetime after the rotation."""
+        replay_guard = self._create_replay_guard()
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+
+        replay_guard._rotation_time -= replay_guard.challenge_lifetime
+
+        assert_false(replay_guard.consume(RANDOM_CHALLENGE_ID))
+
+    def test_expiry(self):
+        replay_guard = self._create_replay_guard()
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+
+        replay_guard._rotation_time -= 2 * replay_guard.challenge_lifetime
+
+        ok_(replay_guard.consume(RANDOM_CHALLENGE_ID))
+
+    def test_false_positive_rate(self):
+        replay_guard = self._create_replay_guard(
+            capacity=1000,
+            false_positive_rate=0.01,
+            )
+
+        new_challenge_count = sum(
+            replay_guard.consume('challenge {}'.format(challenge_index))
+            for challenge_index in range(1000)
+            )
+
+        ok_(970 <= new_challenge_count)
+
+    def test_bounded_memory(self):
+        replay_guard = self._create_replay_guard(capacity=1000)
+
+        for challenge_index in range(10000):
+            replay_guard.consume('challenge {}'.format(challenge_index))
+
+        eq_(
+            (replay_guard._bloom_filter_size + 7) // 8,
+            len(replay_guard._current_bloom_filter),
+            )
+
+    #{ Utilities
+
+    def _create_replay_guard(self, **kwargs):
+        return RecaptchaReplayGuard(60, **kwargs)
+
+    #}
+
+
+class TestCachedChallenges(_ReplayGuardTestCase):
+
+    def setup(self):
+        self.cache = create_local_memory_cache('recaptcha-challenges')
+
+    def teardown(self):
+        self.cache.clear()
+
+    def test_shared_challenges(self):
+        replay_guard1 = self._create_replay_guard()
+        replay_guard2 = self._create_replay_guard()
+
+        replay_guard1.consume(RANDOM_CHALLENGE_ID)
+
+        assert_false(replay_guard2.consume(RANDOM_CHALLENGE_ID))
+
+    def test_expiry(self):
+        replay_guard = RecaptchaReplayGuard(-1, self.cache)
+        replay_guard.consume(RANDOM_CHALLENGE_ID)
+
+        ok_(replay_guard.consume(RANDOM_CHALLENGE_ID))
+
+    #{ Utilities
+
+    def _create_replay_guard(self, **kwargs):
+        return RecaptchaReplayGuard(60, self.cache, **kwargs)
+
+    #}
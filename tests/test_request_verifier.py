@@ -0,0 +1,388 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from django.http import HttpRequest
+from nose.tools import assert_false
+from nose.tools import assert_is_instance
+from nose.tools import assert_is_none
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import RecaptchaClientRegistry
+from django_recaptcha_field import RecaptchaRateLimiter
+from django_recaptcha_field import RecaptchaRequestVerifier
+from django_recaptcha_field import _PASS_TOKEN_SESSION_KEY
+
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+
+
+__all__ = [
+    'TestClientRegistry',
+    'TestPassTokens',
+    'TestRawSubmissions',
+    'TestRequestSubmissions',
+    ]
+
+
+_RANDOM_SUBMISSION_DATA = {
+    'recaptcha_response_field': RANDOM_SOLUTION_TEXT,
+    'recaptcha_challenge_field': RANDOM_CHALLENGE_ID,
+    }
+
+
+class TestRawSubmissions(object):
+
+    def test_correct_solution(self):
+        verifier = RecaptchaRequestVerifier(_FakeVerificationClient(True))
+
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        ok_(verification_result.is_accepted)
+        ok_(verification_result.is_solution_correct)
+        assert_is_none(verification_result.error_message)
+        eq_(RANDOM_CHALLENGE_ID, verification_result.challenge_id)
+        eq_(RANDOM_SOLUTION_TEXT, verification_result.solution_text)
+        eq_(RANDOM_REMOTE_IP, verification_result.remote_ip)
+
+    def test_incorrect_solution(self):
+        verifier = RecaptchaRequestVerifier(_FakeVerificationClient(False))
+
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        assert_false(verification_result.is_accepted)
+        assert_false(verification_result.is_solution_correct)
+        eq_(
+            verifier._field.error_messages['incorrect_solution'],
+            verification_result.error_message,
+            )
+
+    def test_invalid_challenge(self):
+        verifier = RecaptchaRequestVerifier(
+            _FakeVerificationClient(RecaptchaInvalidChallengeError()),
+            )
+
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        assert_false(verification_result.is_accepted)
+        ok_(verification_result.is_challenge_invalid)
+        eq_(
+            verifier._field.error_messages['invalid'],
+            verification_result.error_message,
+            )
+
+    def test_missing_solution(self):
+        recaptcha_client = _FakeVerificationClient(True)
+        verifier = RecaptchaRequestVerifier(recaptcha_client)
+
+        verification_result = \
+            verifier.verify(RANDOM_CHALLENGE_ID, '', RANDOM_REMOTE_IP)
+
+        assert_false(verification_result.is_accepted)
+        eq_(
+            verifier._field.error_messages['required'],
+            verification_result.error_message,
+            )
+        eq_(0, recaptcha_client.communication_attempts)
+
+    def test_malformed_solution(self):
+        recaptcha_client = _FakeVerificationClient(True)
+        verifier = RecaptchaRequestVerifier(
+            recaptcha_client,
+            max_solution_length=5,
+            )
+
+        verification_result = \
+            verifier.verify(RANDOM_CHALLENGE_ID, 'a' * 6, RANDOM_REMOTE_IP)
+
+        assert_false(verification_result.is_accepted)
+        eq_(0, recaptcha_client.communication_attempts)
+
+    def test_encoding(self):
+        recaptcha_client = _FakeVerificationClient(True)
+        verifier = RecaptchaRequestVerifier(recaptcha_client)
+
+        verifier.verify(RANDOM_CHALLENGE_ID, 'caf\xc3\xa9', RANDOM_REMOTE_IP)
+
+        eq_(u'caf\xe9', recaptcha_client.solution_text)
+
+    def test_unreachable_recaptcha(self):
+        verifier = RecaptchaRequestVerifier(
+            _FakeVerificationClient(RecaptchaUnreachableError()),
+            )
+
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        assert_false(verification_result.is_accepted)
+        assert_is_instance(verification_result.error, RecaptchaUnreachableError)
+
+    def test_unavailability_policy_accept(self):
+        verifier = RecaptchaRequestVerifier(
+            _FakeVerificationClient(RecaptchaUnreachableError()),
+            unavailability_policy='accept',
+            )
+
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        ok_(verification_result.is_accepted)
+        ok_(verification_result.was_verification_skipped)
+
+    def test_unavailability_policy_reject(self):
+        verifier = RecaptchaRequestVerifier(
+            _FakeVerificationClient(RecaptchaUnreachableError()),
+            unavailability_policy='reject',
+            )
+
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        assert_false(verification_result.is_accepted)
+        assert_false(verification_result.was_verification_skipped)
+        eq_(
+            verifier._field.error_messages['unavailable'],
+            verification_result.error_message,
+            )
+
+    def test_rate_limiting(self):
+        verifier = RecaptchaRequestVerifier(
+            _FakeVerificationClient(True),
+            rate_limiter=RecaptchaRateLimiter(rate=0.001, capacity=1),
+            )
+
+        verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+        verification_result = verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            )
+
+        assert_false(verification_result.is_accepted)
+        eq_(
+            verifier._field.error_messages['rate_limited'],
+            verification_result.error_message,
+            )
+
+
+class TestRequestSubmissions(object):
+
+    def test_submission(self):
+        recaptcha_client = _FakeVerificationClient(True)
+        verifier = RecaptchaRequestVerifier(recaptcha_client)
+
+        verification_result = verifier.verify_request(
+            _make_request(),
+            _RANDOM_SUBMISSION_DATA,
+            )
+
+        ok_(verification_result.is_accepted)
+        eq_(RANDOM_REMOTE_IP, verification_result.remote_ip)
+        eq_(RANDOM_REMOTE_IP, recaptcha_client.remote_ip)
+
+    def test_non_string_values(self):
+        """Values decoded from JSON that aren't strings are rejected."""
+        recaptcha_client = _FakeVerificationClient(True)
+        verifier = RecaptchaRequestVerifier(recaptcha_client)
+
+        verification_result = verifier.verify_request(
+            _make_request(),
+            {
+                'recaptcha_response_field': [RANDOM_SOLUTION_TEXT],
+                'recaptcha_challenge_field': RANDOM_CHALLENGE_ID,
+                },
+            )
+
+        assert_false(verification_result.is_accepted)
+        eq_(0, recaptcha_client.communication_attempts)
+
+    def test_allowed_network(self):
+        recaptcha_client = _FakeVerificationClient(False)
+        verifier = RecaptchaRequestVerifier(
+            recaptcha_client,
+            allowed_networks=['192.0.2.0/24'],
+            )
+
+        verification_result = verifier.verify_request(_make_request(), {})
+
+        ok_(verification_result.is_accepted)
+        ok_(verification_result.was_verification_waived)
+        eq_(0, recaptcha_client.communication_attempts)
+
+
+class TestPassTokens(object):
+
+    def setup(self):
+        self.recaptcha_client = _FakeVerificationClient(True)
+        self.verifier = RecaptchaRequestVerifier(
+            self.recaptcha_client,
+            pass_token_timeout=60,
+            )
+
+    def test_token_issuance(self):
+        request = _make_request()
+        request.session = {}
+
+        self.verifier.verify_request(request, _RANDOM_SUBMISSION_DATA)
+
+        ok_(_PASS_TOKEN_SESSION_KEY in request.session)
+
+    def test_incorrect_solution(self):
+        self.recaptcha_client.verification_result = False
+        request = _make_request()
+        request.session = {}
+
+        self.verifier.verify_request(request, _RANDOM_SUBMISSION_DATA)
+
+        assert_false(_PASS_TOKEN_SESSION_KEY in request.session)
+
+    def test_waived_verification(self):
+        """Submissions made with a valid token needn't include a solution."""
+        request = _make_request()
+        request.session = {}
+        self.verifier.verify_request(request, _RANDOM_SUBMISSION_DATA)
+
+        verification_result = self.verifier.verify_request(request, {})
+
+        ok_(verification_result.is_accepted)
+        ok_(verification_result.was_verification_waived)
+        eq_(1, self.recaptcha_client.communication_attempts)
+
+    def test_token_from_different_ip(self):
+        request = _make_request()
+        request.session = {}
+        self.verifier.verify_request(request, _RANDOM_SUBMISSION_DATA)
+
+        request.META['REMOTE_ADDR'] = '192.0.2.1'
+        verification_result = self.verifier.verify_request(request, {})
+
+        assert_false(verification_result.is_accepted)
+
+    def test_no_session(self):
+        verification_result = self.verifier.verify_request(
+            _make_request(),
+            _RANDOM_SUBMISSION_DATA,
+            )
+
+        ok_(verification_result.is_accepted)
+
+
+class TestClientRegistry(object):
+
+    def setup(self):
+        self.recaptcha_clients = {
+            'example.com': _FakeVerificationClient(True),
+            'example.org': _FakeVerificationClient(False),
+            }
+        self.verifier = RecaptchaRequestVerifier(
+            None,
+            recaptcha_client_registry=
+                RecaptchaClientRegistry(self.recaptcha_clients.get),
+            )
+
+    def test_request(self):
+        request = _make_request()
+        request.META['HTTP_HOST'] = 'example.org'
+
+        verification_result = \
+            self.verifier.verify_request(request, _RANDOM_SUBMISSION_DATA)
+
+        assert_false(verification_result.is_accepted)
+        eq_(1, self.recaptcha_clients['example.org'].communication_attempts)
+
+    def test_raw_submission_with_client(self):
+        verification_result = self.verifier.verify(
+            RANDOM_CHALLENGE_ID,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_REMOTE_IP,
+            self.recaptcha_clients['example.com'],
+            )
+
+        ok_(verification_result.is_accepted)
+        eq_(1, self.recaptcha_clients['example.com'].communication_attempts)
+
+    def test_raw_submission_without_client(self):
+        with assert_raises(ValueError):
+            self.verifier.verify(
+                RANDOM_CHALLENGE_ID,
+                RANDOM_SOLUTION_TEXT,
+                RANDOM_REMOTE_IP,
+                )
+
+
+#{ Stubs
+
+
+class _FakeVerificationClient(object):
+
+    def __init__(self, verification_result):
+        super(_FakeVerificationClient, self).__init__()
+
+        self.verification_result = verification_result
+
+        self.communication_attempts = 0
+
+        self.solution_text = None
+        self.remote_ip = None
+
+    def is_solution_correct(self, solution_text, challenge_id, remote_ip):
+        self.communication_attempts += 1
+
+        self.solution_text = solution_text
+        self.remote_ip = remote_ip
+
+        if isinstance(self.verification_result, Exception):
+            raise self.verification_result
+        return self.verification_result
+
+
+def _make_request():
+    request = HttpRequest()
+    request.META['REMOTE_ADDR'] = RANDOM_REMOTE_IP
+    return request
+
+
+#}
@@ -0,0 +1,299 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from json import dumps as json_encode
+
+from django.core.exceptions import ValidationError
+from django.forms.fields import CharField
+from django.forms.forms import Form
+from django.http import HttpRequest
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaInvalidPrivateKeyError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import PooledVerificationTransport
+from django_recaptcha_field import RecaptchaScoreVerifier
+from django_recaptcha_field import _RecaptchaField as RecaptchaField
+from django_recaptcha_field import _RecaptchaFormState as RecaptchaFormState
+from django_recaptcha_field import create_form_subclass_with_recaptcha
+
+from tests import FAKE_RECAPTCHA_CLIENT
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+from tests.verification_server import FakeVerificationServer
+
+
+__all__ = [
+    'TestScoreBasedForm',
+    'TestScoreVerification',
+    'TestScoreVerifier',
+    ]
+
+
+_RANDOM_SCORE_TOKEN = 'score-token'
+
+
+_SCORE_TOKEN_MARKUP_SNIPPET = 'name="recaptcha_score_token"'
+
+
+_CHALLENGE_MARKUP_SNIPPET = 'recaptcha_challenge_field'
+
+
+class _ScoreVerificationServerTestCase(object):
+
+    def setup(self):
+        self.verification_server = FakeVerificationServer()
+        self.verification_server.start()
+        self._set_verification_response(score=0.9)
+
+        self.score_verifier = RecaptchaScoreVerifier(
+            'site key',
+            'secret key',
+            score_threshold=0.5,
+            verification_transport=PooledVerificationTransport(
+                self.verification_server.verification_url,
+                ),
+            )
+
+    def teardown(self):
+        self.verification_server.stop()
+
+    def _set_verification_response(self, **verification_result):
+        verification_result.setdefault('success', True)
+        verification_result.setdefault('action', 'submit')
+        self.verification_server.response_body = \
+            json_encode(verification_result)
+
+
+class TestScoreVerifier(_ScoreVerificationServerTestCase):
+
+    def test_request_data(self):
+        self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+        eq_(
+            {
+                'secret': 'secret key',
+                'response': _RANDOM_SCORE_TOKEN,
+                'remoteip': RANDOM_REMOTE_IP,
+                },
+            self.verification_server.requests_data[0],
+            )
+
+    def test_score(self):
+        score = \
+            self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+        eq_(0.9, score)
+
+    def test_invalid_token(self):
+        self._set_verification_response(
+            success=False,
+            **{'error-codes': ['timeout-or-duplicate']}
+            )
+
+        with assert_raises(RecaptchaInvalidChallengeError):
+            self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+    def test_invalid_secret_key(self):
+        self._set_verification_response(
+            success=False,
+            **{'error-codes': ['invalid-input-secret']}
+            )
+
+        with assert_raises(RecaptchaInvalidPrivateKeyError):
+            self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+    def test_different_action(self):
+        self._set_verification_response(score=0.9, action='login')
+
+        with assert_raises(RecaptchaInvalidChallengeError):
+            self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+    def test_malformed_response(self):
+        self.verification_server.response_body = 'true\nsuccess'
+
+        with assert_raises(RecaptchaUnreachableError):
+            self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+    def test_malformed_score(self):
+        self._set_verification_response(score=None)
+
+        with assert_raises(RecaptchaUnreachableError):
+            self.score_verifier.get_score(_RANDOM_SCORE_TOKEN, RANDOM_REMOTE_IP)
+
+
+class TestScoreVerification(_ScoreVerificationServerTestCase):
+
+    def setup(self):
+        super(TestScoreVerification, self).setup()
+
+        self.field = RecaptchaField(
+            FAKE_RECAPTCHA_CLIENT,
+            score_verifier=self.score_verifier,
+            )
+        self.form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+    def test_high_score(self):
+        self.field.verify({'score_token': _RANDOM_SCORE_TOKEN}, self.form_state)
+
+        assert_false(self.form_state.is_challenge_required)
+
+    def test_low_score(self):
+        self._set_verification_response(score=0.1)
+
+        with assert_raises(ValidationError):
+            self.field.verify(
+                {'score_token': _RANDOM_SCORE_TOKEN},
+                self.form_state,
+                )
+
+        ok_(self.form_state.is_challenge_required)
+
+    def test_invalid_token(self):
+        self._set_verification_response(success=False)
+
+        with assert_raises(ValidationError):
+            self.field.verify(
+                {'score_token': _RANDOM_SCORE_TOKEN},
+                self.form_state,
+                )
+
+    def test_unreachable_recaptcha(self):
+        self.verification_server.response_body = ''
+        field = RecaptchaField(
+            FAKE_RECAPTCHA_CLIENT,
+            score_verifier=self.score_verifier,
+            unavailability_policy='accept',
+            )
+
+        field.verify({'score_token': _RANDOM_SCORE_TOKEN}, self.form_state)
+
+        ok_(self.form_state.was_verification_skipped)
+
+    def test_token_without_score_verifier(self):
+        field = RecaptchaField(FAKE_RECAPTCHA_CLIENT)
+
+        with assert_raises(ValidationError):
+            field.verify({'score_token': _RANDOM_SCORE_TOKEN}, self.form_state)
+
+    def test_token_extraction(self):
+        field_value = self.field.widget.value_from_datadict(
+            {'recaptcha_score_token': _RANDOM_SCORE_TOKEN},
+            {},
+            'recaptcha',
+            )
+
+        eq_({'score_token': _RANDOM_SCORE_TOKEN}, field_value)
+
+    def test_solution_precedence(self):
+        """Solutions to challenges take precedence over score tokens."""
+        field_value = self.field.widget.value_from_datadict(
+            {
+                'recaptcha_score_token': _RANDOM_SCORE_TOKEN,
+                'recaptcha_response_field': RANDOM_SOLUTION_TEXT,
+                'recaptcha_challenge_field': RANDOM_CHALLENGE_ID,
+                },
+            {},
+            'recaptcha',
+            )
+
+        eq_(RANDOM_SOLUTION_TEXT, field_value['solution_text'])
+
+
+class TestScoreBasedForm(_ScoreVerificationServerTestCase):
+
+    def setup(self):
+        super(TestScoreBasedForm, self).setup()
+
+        self.form_class = create_form_subclass_with_recaptcha(
+            _MockForm,
+            FAKE_RECAPTCHA_CLIENT,
+            {'score_verifier': self.score_verifier},
+            )
+
+    def test_unbound_form(self):
+        """No challenge is presented until it's required."""
+        form = self.form_class(_create_request())
+
+        recaptcha_markup = unicode(form['recaptcha'])
+        ok_(_SCORE_TOKEN_MARKUP_SNIPPET in recaptcha_markup)
+        assert_false(_CHALLENGE_MARKUP_SNIPPET in recaptcha_markup)
+
+    def test_high_score(self):
+        form = self.form_class(
+            _create_request(),
+            {'name': 'Alice', 'recaptcha_score_token': _RANDOM_SCORE_TOKEN},
+            )
+
+        ok_(form.is_valid())
+
+    def test_low_score(self):
+        """The challenge is presented to users with a low score."""
+        self._set_verification_response(score=0.1)
+        form = self.form_class(
+            _create_request(),
+            {'name': 'Alice', 'recaptcha_score_token': _RANDOM_SCORE_TOKEN},
+            )
+
+        assert_false(form.is_valid())
+        ok_(_CHALLENGE_MARKUP_SNIPPET in unicode(form['recaptcha']))
+
+    def test_missing_token(self):
+        """Users who couldn't get a token are presented with the challenge."""
+        form = self.form_class(_create_request(), {'name': 'Alice'})
+
+        assert_false(form.is_valid())
+        ok_(_CHALLENGE_MARKUP_SNIPPET in unicode(form['recaptcha']))
+
+    def test_challenge_solution(self):
+        """Users solving a challenge keep getting challenges."""
+        form = self.form_class(
+            _create_request(),
+            {
+                'name': '',
+                'recaptcha_response_field': RANDOM_SOLUTION_TEXT,
+                'recaptcha_challenge_field': RANDOM_CHALLENGE_ID,
+                },
+            )
+
+        ok_(form.recaptcha_state.is_challenge_required)
+        ok_(_CHALLENGE_MARKUP_SNIPPET in unicode(form['recaptcha']))
+
+
+#{ Utilities
+
+
+def _create_request():
+    request = HttpRequest()
+    request.META['REMOTE_ADDR'] = RANDOM_REMOTE_IP
+    return request
+
+
+#{ Stubs
+
+
+class _MockForm(Form):
+
+    name = CharField(max_length=255)
+
+
+#}
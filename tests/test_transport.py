@@ -0,0 +1,250 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+
+from time import time
+
+from django.core.exceptions import ValidationError
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from recaptcha import RecaptchaClient
+from recaptcha import RecaptchaInvalidChallengeError
+from recaptcha import RecaptchaInvalidPrivateKeyError
+from recaptcha import RecaptchaUnreachableError
+
+from django_recaptcha_field import PooledVerificationTransport
+from django_recaptcha_field import _RecaptchaField as RecaptchaField
+from django_recaptcha_field import _RecaptchaFormState as RecaptchaFormState
+from django_recaptcha_field import \
+    _is_solution_correct_via_transport as is_solution_correct_via_transport
+
+from tests import FAKE_RECAPTCHA_CLIENT
+from tests import RANDOM_CHALLENGE_ID
+from tests import RANDOM_REMOTE_IP
+from tests import RANDOM_SOLUTION_TEXT
+from tests.verification_server import FakeVerificationServer
+
+
+__all__ = [
+    'TestConnectionPooling',
+    'TestFaultInjection',
+    'TestVerification',
+    ]
+
+
+class _VerificationServerTestCase(object):
+
+    def setup(self):
+        self.verification_server = FakeVerificationServer()
+        self.verification_server.start()
+
+        self.transport = PooledVerificationTransport(
+            self.verification_server.verification_url,
+            pool_size=2,
+            )
+
+    def teardown(self):
+        self.verification_server.stop()
+
+    def _is_solution_correct(self, recaptcha_client=FAKE_RECAPTCHA_CLIENT):
+        is_solution_correct = is_solution_correct_via_transport(
+            self.transport,
+            recaptcha_client,
+            RANDOM_SOLUTION_TEXT,
+            RANDOM_CHALLENGE_ID,
+            RANDOM_REMOTE_IP,
+            )
+        return is_solution_correct
+
+
+class TestVerification(_VerificationServerTestCase):
+
+    def test_request_data(self):
+        self._is_solution_correct()
+
+        eq_(1, len(self.verification_server.requests_data))
+        request_data = self.verification_server.requests_data[0]
+        eq_(FAKE_RECAPTCHA_CLIENT.private_key, request_data['privatekey'])
+        eq_(RANDOM_REMOTE_IP, request_data['remoteip'])
+        eq_(RANDOM_CHALLENGE_ID, request_data['challenge'])
+        eq_(RANDOM_SOLUTION_TEXT, request_data['response'])
+
+    def test_correct_solution(self):
+        ok_(self._is_solution_correct())
+
+    def test_incorrect_solution(self):
+        self.verification_server.response_body = 'false\nincorrect-captcha-sol'
+
+        assert_false(self._is_solution_correct())
+
+    def test_invalid_challenge_id(self):
+        self.verification_server.response_body = 'false\ninvalid-request-cookie'
+
+        with assert_raises(RecaptchaInvalidChallengeError):
+            self._is_solution_correct()
+
+    def test_invalid_private_key(self):
+        self.verification_server.response_body = \
+            'false\ninvalid-site-private-key'
+
+        with assert_raises(RecaptchaInvalidPrivateKeyError):
+            self._is_solution_correct()
+
+    def test_remote_api_unreachable(self):
+        self.verification_server.stop()
+
+        with assert_raises(RecaptchaUnreachableError):
+            self._is_solution_correct()
+
+        self.verification_server = FakeVerificationServer()
+        self.verification_server.start()
+
+    def test_field(self):
+        """The field uses the transport when one is set."""
+        self.verification_server.response_body = 'false\nincorrect-captcha-sol'
+        field = RecaptchaField(
+            FAKE_RECAPTCHA_CLIENT,
+            verification_transport=self.transport,
+            )
+        form_state = RecaptchaFormState(RANDOM_REMOTE_IP)
+
+        field_value = {
+            'solution_text': RANDOM_SOLUTION_TEXT,
+            'challenge_id': RANDOM_CHALLENGE_ID,
+            }
+        with assert_raises(ValidationError):
+            field.verify(field_value, form_state)
+
+        eq_(1, len(self.verification_server.requests_data))
+
+
+class TestConnectionPooling(_VerificationServerTestCase):
+
+    def test_connection_reuse(self):
+        self._is_solution_correct()
+        self._is_solution_correct()
+        self._is_solution_correct()
+
+        eq_(3, len(self.verification_server.requests_data))
+        eq_(1, self.verification_server.connection_count)
+
+    def test_prewarming(self):
+        self.transport.prewarm()
+        self._is_solution_correct()
+
+        eq_(2, self.verification_server.connection_count)
+
+    def test_failed_prewarming(self):
+        """Connections that couldn't be established aren't pooled."""
+        self.verification_server.stop()
+
+        with assert_raises(RecaptchaUnreachableError):
+            self.transport.prewarm()
+
+        eq_(0, self.transport._idle_connections.qsize())
+
+        self.verification_server = FakeVerificationServer()
+        self.verification_server.start()
+
+    def test_closed_connection(self):
+        """Idle connections closed by the server are replaced transparently."""
+        self._is_solution_correct()
+        self.verification_server.close_connections()
+
+        ok_(self._is_solution_correct())
+        eq_(2, self.verification_server.connection_count)
+
+
+class TestFaultInjection(_VerificationServerTestCase):
+
+    def test_server_error(self):
+        self.verification_server.error_rate = 1
+
+        with assert_raises(RecaptchaUnreachableError):
+            self._is_solution_correct()
+
+    def test_timeout(self):
+        self.verification_server.timeout_rate = 1
+        self.verification_server.timeout_duration = 0.5
+        self.transport = PooledVerificationTransport(
+            self.verification_server.verification_url,
+            timeout=0.05,
+            )
+
+        with assert_raises(RecaptchaUnreachableError):
+            self._is_solution_correct()
+
+    def test_timeout_on_reused_connection(self):
+        """
+        Timeouts aren't retried, since reCAPTCHA may have used up the
+        challenge already.
+
+        """
+        self.transport = PooledVerificationTransport(
+            self.verification_server.verification_url,
+            timeout=0.1,
+            )
+        self._is_solution_correct()
+        self.verification_server.timeout_rate = 1
+        self.verification_server.timeout_duration = 0.5
+
+        verification_start_time = time()
+        with assert_raises(RecaptchaUnreachableError):
+            self._is_solution_correct()
+
+        ok_(time() - verification_start_time < 0.2)
+        eq_(2, len(self.verification_server.requests_data))
+
+    def test_client_timeout(self):
+        """The timeout of the client takes precedence."""
+        self.verification_server.timeout_rate = 1
+        self.verification_server.timeout_duration = 0.5
+        recaptcha_client = RecaptchaClient(
+            'private key',
+            'public key',
+            verification_timeout=0.05,
+            )
+
+        verification_start_time = time()
+        with assert_raises(RecaptchaUnreachableError):
+            self._is_solution_correct(recaptcha_client)
+
+        ok_(time() - verification_start_time < 0.2)
+
+    def test_default_timeout(self):
+        transport = PooledVerificationTransport()
+
+        ok_(transport.timeout)
+
+    def test_invalid_challenge(self):
+        self.verification_server.invalid_challenge_rate = 1
+
+        with assert_raises(RecaptchaInvalidChallengeError):
+            self._is_solution_correct()
+
+    def test_response_delay_distribution(self):
+        response_delays = []
+
+        def get_response_delay():
+            response_delays.append(0.001)
+            return response_delays[-1]
+
+        self.verification_server.response_delay = get_response_delay
+
+        ok_(self._is_solution_correct())
+        eq_([0.001], response_delays)
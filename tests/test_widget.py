@@ -17,7 +17,9 @@
 from nose.tools import assert_false
 from nose.tools import eq_
 from nose.tools import ok_
+from recaptcha import RecaptchaClient
 
+from django_recaptcha_field import _RecaptchaFormState as RecaptchaFormState
 from django_recaptcha_field import _RecaptchaWidget as RecaptchaWidget
 
 from tests import FAKE_RECAPTCHA_CLIENT
@@ -26,6 +28,8 @@ from tests import RANDOM_SOLUTION_TEXT
 
 
 __all__ = [
+    'TestChallengeMarkupCaching',
+    'TestClientSideRendering',
     'TestWidgetDataExtraction',
     'TestWidgetRendering',
     ]
@@ -36,7 +40,7 @@ _RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY = 'error=incorrect-captcha-sol'
 
 _FAKE_FILES_DATA = {}
 _FAKE_FIELD_NAME = 'field_name'
-_FAKE_FIELD_VALUE = None
+_FAKE_FIELD_VALUE = RecaptchaFormState()
 _FAKE_FIELD_ATTRIBUTES = {}
 
 
@@ -90,11 +94,12 @@ class TestWidgetRendering(object):
 
     def test_previous_solution_incorrect(self):
         widget = RecaptchaWidget(FAKE_RECAPTCHA_CLIENT)
-        widget.was_previous_solution_incorrect = True
+        form_state = RecaptchaFormState()
+        form_state.was_previous_solution_incorrect = True
 
         widget_markup = widget.render(
             _FAKE_FIELD_NAME,
-            _FAKE_FIELD_VALUE,
+            form_state,
             _FAKE_FIELD_ATTRIBUTES,
             )
 
@@ -112,14 +117,11 @@ class TestWidgetRendering(object):
         assert_false(_RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY in widget_markup)
 
     def test_challenge_not_over_ssl(self):
-        widget = RecaptchaWidget(
-            FAKE_RECAPTCHA_CLIENT,
-            transmit_challenge_over_ssl=False,
-            )
+        widget = RecaptchaWidget(FAKE_RECAPTCHA_CLIENT)
 
         widget_markup = widget.render(
             _FAKE_FIELD_NAME,
-            _FAKE_FIELD_VALUE,
+            RecaptchaFormState(transmit_challenge_over_ssl=False),
             _FAKE_FIELD_ATTRIBUTES,
             )
 
@@ -127,16 +129,186 @@ class TestWidgetRendering(object):
         ok_('http://' in widget_markup)
 
     def test_challenge_over_ssl(self):
-        widget = RecaptchaWidget(
-            FAKE_RECAPTCHA_CLIENT,
-            transmit_challenge_over_ssl=True,
-            )
+        widget = RecaptchaWidget(FAKE_RECAPTCHA_CLIENT)
 
         widget_markup = widget.render(
             _FAKE_FIELD_NAME,
-            _FAKE_FIELD_VALUE,
+            RecaptchaFormState(transmit_challenge_over_ssl=True),
             _FAKE_FIELD_ATTRIBUTES,
             )
 
         assert_false('http://' in widget_markup)
         ok_('https://' in widget_markup)
+
+    def test_no_form_state(self):
+        """The widget can be rendered outside of a form."""
+        widget = RecaptchaWidget(FAKE_RECAPTCHA_CLIENT)
+
+        widget_markup = widget.render(
+            _FAKE_FIELD_NAME,
+            None,
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+
+        assert_false(_RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY in widget_markup)
+        ok_('http://' in widget_markup)
+
+
+class TestClientSideRendering(object):
+
+    def setup(self):
+        self.recaptcha_client = _MarkupCountingRecaptchaClient()
+        self.widget = RecaptchaWidget(
+            self.recaptcha_client,
+            render_client_side=True,
+            )
+
+    def test_placeholder(self):
+        widget_markup = self.widget.render(
+            _FAKE_FIELD_NAME,
+            _FAKE_FIELD_VALUE,
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+
+        ok_('<div id="field_name_challenge"></div>' in widget_markup)
+        ok_('Recaptcha.create(' in widget_markup)
+        ok_('"public key"' in widget_markup)
+        eq_(0, self.recaptcha_client.markup_generation_count)
+
+    def test_ssl_independence(self):
+        """The markup is the same regardless of the use of SSL."""
+        widget_markup1 = self.widget.render(
+            _FAKE_FIELD_NAME,
+            RecaptchaFormState(transmit_challenge_over_ssl=False),
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+        widget_markup2 = self.widget.render(
+            _FAKE_FIELD_NAME,
+            RecaptchaFormState(transmit_challenge_over_ssl=True),
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+
+        eq_(widget_markup1, widget_markup2)
+        assert_false('http://' in widget_markup1)
+        assert_false('https://' in widget_markup1)
+
+    def test_previous_solution_incorrect(self):
+        """The challenge is rendered server-side to report the error."""
+        form_state = RecaptchaFormState()
+        form_state.was_previous_solution_incorrect = True
+
+        widget_markup = self.widget.render(
+            _FAKE_FIELD_NAME,
+            form_state,
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+
+        ok_(_RECAPTCHA_INCORRECT_SOLUTION_URL_QUERY in widget_markup)
+
+    def test_markup_escaping(self):
+        widget_markup = self.widget.render(
+            '"></div><script>',
+            _FAKE_FIELD_VALUE,
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+
+        assert_false('"></div><script>' in widget_markup)
+
+    def test_different_field_names(self):
+        widget_markup = self.widget.render(
+            'other_field_name',
+            _FAKE_FIELD_VALUE,
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+
+        ok_('<div id="other_field_name_challenge"></div>' in widget_markup)
+
+
+class TestChallengeMarkupCaching(object):
+
+    def setup(self):
+        self.recaptcha_client = _MarkupCountingRecaptchaClient()
+
+    def test_repeated_rendering(self):
+        """The markup is only generated once for identical widgets."""
+        widget_markup1 = self._render_widget()
+        widget_markup2 = self._render_widget()
+
+        eq_(widget_markup1, widget_markup2)
+        eq_(1, self.recaptcha_client.markup_generation_count)
+
+    def test_different_widget_state(self):
+        self._render_widget()
+        self._render_widget(was_previous_solution_incorrect=True)
+        self._render_widget(transmit_challenge_over_ssl=True)
+
+        eq_(3, self.recaptcha_client.markup_generation_count)
+
+    def test_different_clients(self):
+        widget_markup1 = self._render_widget()
+
+        self.recaptcha_client = \
+            _MarkupCountingRecaptchaClient(public_key='another public key')
+        widget_markup2 = self._render_widget()
+
+        assert_false(widget_markup1 == widget_markup2)
+        eq_(1, self.recaptcha_client.markup_generation_count)
+
+    def test_client_settings_change(self):
+        """The cached markup is discarded when the client settings change."""
+        widget_markup1 = self._render_widget()
+
+        self.recaptcha_client.public_key = 'another public key'
+        widget_markup2 = self._render_widget()
+
+        assert_false(widget_markup1 == widget_markup2)
+        ok_('another+public+key' in widget_markup2)
+        eq_(2, self.recaptcha_client.markup_generation_count)
+
+    #{ Utilities
+
+    def _render_widget(
+        self,
+        was_previous_solution_incorrect=False,
+        transmit_challenge_over_ssl=False,
+        ):
+        widget = RecaptchaWidget(self.recaptcha_client)
+        form_state = RecaptchaFormState(
+            transmit_challenge_over_ssl=transmit_challenge_over_ssl,
+            )
+        form_state.was_previous_solution_incorrect = \
+            was_previous_solution_incorrect
+
+        widget_markup = widget.render(
+            _FAKE_FIELD_NAME,
+            form_state,
+            _FAKE_FIELD_ATTRIBUTES,
+            )
+        return widget_markup
+
+    #}
+
+
+#{ Stubs
+
+
+class _MarkupCountingRecaptchaClient(RecaptchaClient):
+
+    def __init__(self, public_key='public key'):
+        super(_MarkupCountingRecaptchaClient, self).__init__(
+            'private key',
+            public_key,
+            )
+
+        self.markup_generation_count = 0
+
+    def get_challenge_markup(self, *args, **kwargs):
+        self.markup_generation_count += 1
+
+        return super(_MarkupCountingRecaptchaClient, self).get_challenge_markup(
+            *args,
+            **kwargs
+            )
+
+
+#}
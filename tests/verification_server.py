@@ -0,0 +1,194 @@
+################################################################################
+#
+# Copyright (c) 2012, 2degrees Limited <2degrees-floss@googlegroups.com>.
+# All Rights Reserved.
+#
+# This file is part of django-recaptcha-field
+# <http://packages.python.org/django-recaptcha-field/>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+################################################################################
+
+"""Local stand-in for the reCAPTCHA verification API."""
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+from socket import SHUT_RDWR
+from socket import error as SocketError
+from sys import exc_info
+from random import random
+from threading import Thread
+from time import sleep
+from urlparse import parse_qs
+
+
+__all__ = ['FakeVerificationServer']
+
+
+_SERVER_POLL_INTERVAL = 0.01
+
+
+_INVALID_CHALLENGE_RESPONSE_BODY = 'false\ninvalid-request-cookie'
+
+
+class FakeVerificationServer(object):
+    """
+    HTTP server that responds to every verification request with
+    ``response_body``, after ``response_delay`` seconds.
+
+    ``response_delay`` may also be a callable that returns the delay for each
+    request, so that it can be drawn from a distribution (e.g.,
+    ``lambda: random.expovariate(20)``).
+
+    Faults are injected at random in the following proportions of requests:
+
+    - ``error_rate``: The server responds with an HTTP 500 error.
+    - ``timeout_rate``: The server waits for ``timeout_duration`` seconds and
+      then closes the connection without responding.
+    - ``invalid_challenge_rate``: The server reports that the challenge is
+      invalid.
+
+    """
+
+    def __init__(
+        self,
+        response_body='true\nsuccess',
+        response_delay=0,
+        error_rate=0,
+        timeout_rate=0,
+        timeout_duration=60,
+        invalid_challenge_rate=0,
+        ):
+        super(FakeVerificationServer, self).__init__()
+
+        self.response_body = response_body
+        self.response_delay = response_delay
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_duration = timeout_duration
+        self.invalid_challenge_rate = invalid_challenge_rate
+
+        self.connection_count = 0
+        self.requests_data = []
+
+        self._open_connections = set()
+
+        self._http_server = _ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            _VerificationRequestHandler,
+            )
+        self._http_server.fake_verification_server = self
+        self._http_server_thread = None
+
+    @property
+    def verification_url(self):
+        host, port = self._http_server.server_address
+        verification_url = 'http://{}:{}/verify'.format(host, port)
+        return verification_url
+
+    def start(self):
+        self._http_server_thread = Thread(
+            target=self._http_server.serve_forever,
+            args=(_SERVER_POLL_INTERVAL,),
+            )
+        self._http_server_thread.daemon = True
+        self._http_server_thread.start()
+
+    def get_response_delay(self):
+        if callable(self.response_delay):
+            response_delay = self.response_delay()
+        else:
+            response_delay = self.response_delay
+        return response_delay
+
+    def close_connections(self):
+        """Close the connections that clients are keeping alive."""
+        for connection in list(self._open_connections):
+            try:
+                connection.shutdown(SHUT_RDWR)
+            except SocketError:
+                pass
+        self._open_connections.clear()
+
+    def stop(self):
+        self.close_connections()
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._http_server_thread.join()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients resetting the connections they keep alive is expected
+        exception = exc_info()[1]
+        if not isinstance(exception, SocketError):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class _VerificationRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # Buffer the response so that it's sent in one go instead of being
+    # delayed by Nagle's algorithm
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+
+        fake_verification_server = self.server.fake_verification_server
+        fake_verification_server.connection_count += 1
+        fake_verification_server._open_connections.add(self.request)
+
+    def do_POST(self):
+        fake_verification_server = self.server.fake_verification_server
+
+        request_body_length = int(self.headers.get('Content-Length', 0))
+        request_body = self.rfile.read(request_body_length)
+        request_data = dict(
+            (key, values[0]) for key, values in parse_qs(request_body).items()
+            )
+        fake_verification_server.requests_data.append(request_data)
+
+        response_delay = fake_verification_server.get_response_delay()
+        if response_delay:
+            sleep(response_delay)
+
+        fault_probability = random()
+
+        if fault_probability < fake_verification_server.timeout_rate:
+            sleep(fake_verification_server.timeout_duration)
+            self.close_connection = 1
+            return
+        fault_probability -= fake_verification_server.timeout_rate
+
+        if fault_probability < fake_verification_server.error_rate:
+            response_status = 500
+            response_body = 'Internal Server Error'
+        elif fault_probability < (
+            fake_verification_server.error_rate +
+            fake_verification_server.invalid_challenge_rate
+            ):
+            response_status = 200
+            response_body = _INVALID_CHALLENGE_RESPONSE_BODY
+        else:
+            response_status = 200
+            response_body = fake_verification_server.response_body
+
+        self.send_response(response_status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass